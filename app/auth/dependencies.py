@@ -1,3 +1,5 @@
+import os
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
@@ -52,3 +54,20 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         )
 
     return user
+
+# Usernames allowed to use operational admin endpoints (comma-separated)
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+def get_admin_user(current_user: User = Depends(get_current_user)):
+    """
+    Dependency restricting a route to the users listed in ADMIN_USERNAMES.
+
+    Raises:
+        HTTPException: 403 if the authenticated user is not an administrator
+    """
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administrator access required",
+        )
+    return current_user
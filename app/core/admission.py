@@ -0,0 +1,230 @@
+"""
+admission.py: Admission control and per-user rate limiting for LLM-backed routes.
+
+Every plan generation waits on the AI provider for tens of seconds. Accepting
+unlimited generations means that under a spike they all wait together and all time
+out. This module bounds the work a worker takes on:
+
+- ``AdmissionController`` caps concurrent generations and keeps a bounded FIFO
+  wait queue. Requests that cannot start within the queue deadline are refused
+  quickly with 503 and a Retry-After hint instead of timing out later.
+- ``RateLimiter`` applies a per-user token bucket and answers 429 with Retry-After.
+
+Token buckets live in a pluggable backend; ``InMemoryTokenBucketBackend`` is
+per-process and is what the tests use.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+
+from app.auth.dependencies import get_current_user
+from app.core.deadline import Deadline, request_deadline
+from app.core.metrics import REGISTRY
+from app.db.models import User
+
+# Configuration for LLM-backed routes (0 disables the corresponding limit)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "15"))
+LLM_RATE_LIMIT_PER_MINUTE = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "6"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "3"))
+
+in_flight_gauge = REGISTRY.gauge("llm_admission_in_flight", "LLM-backed requests currently running")
+queue_depth_gauge = REGISTRY.gauge("llm_admission_queue_depth", "LLM-backed requests waiting for a slot")
+wait_histogram = REGISTRY.histogram("llm_admission_wait_seconds", "Time spent waiting for an LLM slot")
+rejected_counter = REGISTRY.counter(
+    "llm_admission_rejected_total", "LLM-backed requests refused by admission control", ["reason"]
+)
+
+
+class AdmissionController:
+    """
+    Concurrency limiter with a bounded wait queue and a queueing deadline.
+
+    Args:
+        max_concurrent: Requests allowed to run at once
+        max_queue: Requests allowed to wait for a slot; further requests are refused immediately
+        queue_timeout: Seconds a request may wait before it is refused
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        # Exponentially weighted average of how long a slot is held
+        self.avg_service_seconds = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrent) if max_concurrent > 0 else None
+
+    def estimated_wait(self) -> float:
+        """Estimate how long a newly queued request would wait for a slot."""
+        if self._semaphore is None or self.in_flight < self.max_concurrent:
+            return 0.0
+        return (self.waiting + 1) / self.max_concurrent * self.avg_service_seconds
+
+    def _reject(self, reason: str, retry_after: float):
+        rejected_counter.inc(reason=reason)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy generating plans. Please retry shortly.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[Deadline] = None):
+        """
+        Hold a concurrency slot for the duration of the block.
+
+        Args:
+            deadline: Request deadline; queueing never outlasts the time it has left
+        """
+        if self._semaphore is None:
+            yield
+            return
+
+        if not self._semaphore.locked():
+            # Uncontended: a free slot is taken without queueing
+            await self._semaphore.acquire()
+            wait_histogram.observe(0.0)
+        else:
+            queue_timeout = deadline.bound(self.queue_timeout) if deadline else self.queue_timeout
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full", self.estimated_wait() or self.queue_timeout)
+            if self.avg_service_seconds and self.estimated_wait() > queue_timeout:
+                # Fail fast: this request would exceed its deadline before starting
+                self._reject("deadline", self.estimated_wait())
+
+            self.waiting += 1
+            queue_depth_gauge.set(self.waiting)
+            started_waiting = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("timeout", self.estimated_wait() or self.queue_timeout)
+            finally:
+                self.waiting -= 1
+                queue_depth_gauge.set(self.waiting)
+                wait_histogram.observe(time.perf_counter() - started_waiting)
+
+        self.in_flight += 1
+        in_flight_gauge.set(self.in_flight)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.avg_service_seconds = elapsed if not self.avg_service_seconds else (
+                0.8 * self.avg_service_seconds + 0.2 * elapsed
+            )
+            self.in_flight -= 1
+            in_flight_gauge.set(self.in_flight)
+            self._semaphore.release()
+
+
+class InMemoryTokenBucketBackend:
+    """
+    Per-process token bucket storage.
+
+    Args:
+        clock: Monotonic time source, overridable in tests
+        max_keys: Number of tracked keys after which idle (full) buckets are pruned
+    """
+
+    def __init__(self, clock=time.monotonic, max_keys: int = 10000):
+        self.clock = clock
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate: float, burst: int, cost: float = 1.0) -> float:
+        """
+        Take ``cost`` tokens from the bucket for ``key``.
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they are available
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (cost - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now, rate, burst)
+        return wait
+
+    def _prune(self, now: float, rate: float, burst: int):
+        idle = [
+            key for key, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * rate >= burst
+        ]
+        for key in idle:
+            del self._buckets[key]
+
+
+class RateLimiter:
+    """
+    Per-user token bucket rate limiter.
+
+    Args:
+        per_minute: Sustained requests allowed per minute (0 disables the limiter)
+        burst: Requests allowed back to back before the sustained rate applies
+        backend: Token bucket storage
+    """
+
+    def __init__(self, per_minute: float, burst: int, backend=None):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.backend = backend or InMemoryTokenBucketBackend()
+
+    def check(self, key):
+        """Consume one token for ``key`` or raise 429 with a Retry-After header."""
+        if self.rate <= 0:
+            return
+        wait = self.backend.take(key, self.rate, self.burst)
+        if wait > 0:
+            rejected_counter.inc(reason="rate_limited")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many plan requests. Please slow down.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))}
+            )
+
+
+# Shared limiters for all LLM-backed routes in this worker
+llm_admission_controller = AdmissionController(LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT_SECONDS)
+llm_rate_limiter = RateLimiter(LLM_RATE_LIMIT_PER_MINUTE, LLM_RATE_LIMIT_BURST)
+
+
+@asynccontextmanager
+async def llm_slot(user_id: int, deadline: Optional[Deadline] = None):
+    """
+    Apply the per-user rate limit first (cheap, no queueing), then hold a
+    concurrency slot for the duration of the block. The wait for a slot counts
+    against the request deadline.
+
+    Routes that call a model only for some requests use this directly.
+    """
+    llm_rate_limiter.check(user_id)
+    async with llm_admission_controller.slot(deadline):
+        yield
+
+
+async def llm_admission(
+    current_user: User = Depends(get_current_user),
+    deadline: Deadline = Depends(request_deadline)
+):
+    """FastAPI dependency holding ``llm_slot`` until the route handler has finished."""
+    async with llm_slot(current_user.id, deadline):
+        yield
@@ -0,0 +1,198 @@
+"""
+capture.py: Opt-in traffic capture for performance regression testing.
+
+When ``TRAFFIC_CAPTURE_PATH`` is set, ``TrafficCaptureMiddleware`` appends one JSON
+line per request with its timing and a sanitized *shape*:
+
+- the route template (``/api/my-plans/{plan_id}``) rather than the raw path;
+- the request body with every string replaced by ``"$str:<length>"``, so long
+  free-text ``UserInput`` fields keep their size but none of their content;
+- a pseudonymous client id (a hash of the Authorization header) and a hash of
+  any Idempotency-Key, so per-user mixes and retry patterns can be reproduced;
+- the response status, size and duration.
+
+The LLM output of every agent run is recorded alongside as a *cassette*, keyed by
+the id of the request that triggered it, so a replay can serve the same model
+responses with the same latency without calling the provider.
+
+``benchmarks/replay_traffic.py`` re-drives a capture against a build.
+"""
+import contextvars
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from urllib.parse import parse_qsl
+
+from app.core.instrumentation import route_template
+
+# Request bodies larger than this are recorded by size only
+MAX_CAPTURED_BODY = 256 * 1024
+
+# Id of the captured request being served, used to key cassettes
+_capture_request_id = contextvars.ContextVar("capture_request_id", default=None)
+
+
+class JsonlWriter:
+    """Thread-safe, line-buffered JSONL appender."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        line = json.dumps(record, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+# Writers are only created when capture is configured; None means capture is off
+traffic_writer = None
+cassette_writer = None
+
+
+def configure_capture(path: str, cassette_path: str = None):
+    """Enable capture to ``path``; cassettes go to ``cassette_path`` (default ``<path>.cassettes``)."""
+    global traffic_writer, cassette_writer
+    traffic_writer = JsonlWriter(path)
+    cassette_writer = JsonlWriter(cassette_path or f"{path}.cassettes")
+    return traffic_writer
+
+
+def disable_capture():
+    """Close the capture files and stop recording."""
+    global traffic_writer, cassette_writer
+    for writer in (traffic_writer, cassette_writer):
+        if writer is not None:
+            writer.close()
+    traffic_writer = cassette_writer = None
+
+
+def short_hash(value: str) -> str:
+    """Return a short, stable pseudonym for a sensitive value."""
+    return hashlib.sha256(value.encode()).hexdigest()[:12]
+
+
+def sanitize(value):
+    """Replace every string in a JSON value with its length, keeping the structure."""
+    if isinstance(value, str):
+        return f"$str:{len(value)}"
+    if isinstance(value, dict):
+        return {key: sanitize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [sanitize(item) for item in value]
+    return value
+
+
+def body_shape(content_type: str, body: bytes):
+    """Return the sanitized shape of a request body, or None if it is empty."""
+    if not body:
+        return None
+    try:
+        if content_type.startswith("application/json"):
+            return sanitize(json.loads(body))
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return sanitize(dict(parse_qsl(body.decode("latin-1"))))
+    except ValueError:
+        pass
+    return {"$bytes": len(body)}
+
+
+def record_cassette(agent: str, latency_seconds: float, output):
+    """Record an agent's output for the captured request being served (no-op unless capturing)."""
+    if cassette_writer is None:
+        return
+    request_id = _capture_request_id.get()
+    if request_id is None:
+        return
+    cassette_writer.write({
+        "request_id": request_id,
+        "agent": agent,
+        "latency_ms": round(latency_seconds * 1000, 1),
+        "output": output,
+    })
+
+
+class TrafficCaptureMiddleware:
+    """
+    ASGI middleware recording sanitized request shapes and timings as JSONL.
+
+    Args:
+        app: ASGI application
+        writer: JsonlWriter receiving one record per request
+        sample_rate: Fraction of requests to record
+        exclude: Paths never recorded
+    """
+
+    def __init__(self, app, writer: JsonlWriter, sample_rate: float = 1.0, exclude=("/metrics",)):
+        self.app = app
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.exclude = set(exclude)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude or random.random() >= self.sample_rate:
+            await self.app(scope, receive, send)
+            return
+
+        request_id = uuid.uuid4().hex[:16]
+        token = _capture_request_id.set(request_id)
+        headers = dict(scope.get("headers") or [])
+        chunks = []
+        body_size = 0
+        status_code = 500
+        response_bytes = 0
+
+        async def receive_wrapper():
+            nonlocal body_size
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                body_size += len(body)
+                if body_size <= MAX_CAPTURED_BODY:
+                    chunks.append(body)
+            return message
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started
+            _capture_request_id.reset(token)
+            authorization = headers.get(b"authorization")
+            idempotency_key = headers.get(b"idempotency-key")
+            if body_size > MAX_CAPTURED_BODY:
+                shape = {"$bytes": body_size}
+            else:
+                shape = body_shape(headers.get(b"content-type", b"").decode("latin-1"), b"".join(chunks))
+            query = parse_qsl(scope.get("query_string", b"").decode("latin-1"))
+            self.writer.write({
+                "id": request_id,
+                "ts": round(started_at, 6),
+                "method": scope["method"],
+                "route": route_template(scope),
+                "query": {key: value[:64] for key, value in query},
+                "client": short_hash(authorization.decode("latin-1")) if authorization else None,
+                "idempotency_key": short_hash(idempotency_key.decode("latin-1")) if idempotency_key else None,
+                "accept_encoding": headers.get(b"accept-encoding", b"").decode("latin-1"),
+                "body": shape,
+                "status": status_code,
+                "response_bytes": response_bytes,
+                "duration_ms": round(duration * 1000, 2),
+            })
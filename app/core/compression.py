@@ -0,0 +1,274 @@
+"""
+compression.py: Negotiated response compression middleware for the Diet Fitness application.
+
+Plan payloads are mostly verbose free text (meals and activities for every day of
+the week), so they compress very well. This module provides a pure ASGI middleware
+that picks the best encoding the client accepts (zstd, brotli or gzip), skips small
+bodies, and compresses streamed responses chunk by chunk so NDJSON lines still
+arrive as soon as they are produced.
+
+brotli and zstd are optional: they are only offered when the ``brotli`` or
+``zstandard`` packages are installed. gzip is always available.
+"""
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+# Content types worth compressing; everything else (images, archives...) passes through
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/javascript",
+    "application/xml",
+    "text/",
+)
+
+
+class GzipCompressor:
+    """Streaming gzip compressor that flushes on every chunk."""
+
+    encoding = "gzip"
+
+    def __init__(self, level: int = 6):
+        # wbits=31 produces a gzip container instead of a raw zlib stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor:
+    """Streaming brotli compressor that flushes on every chunk."""
+
+    encoding = "br"
+
+    def __init__(self, level: int = 4):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    """Streaming zstd compressor that flushes a block on every chunk."""
+
+    encoding = "zstd"
+
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+def available_compressors() -> dict:
+    """
+    Return the compressor classes supported in this environment.
+
+    Returns:
+        dict: Mapping of content-coding name to compressor class, in server preference order
+    """
+    compressors = {}
+    if zstandard is not None:
+        compressors["zstd"] = ZstdCompressor
+    if brotli is not None:
+        compressors["br"] = BrotliCompressor
+    compressors["gzip"] = GzipCompressor
+    return compressors
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """
+    Parse an Accept-Encoding header into a mapping of coding to q-value.
+
+    Args:
+        header: Raw Accept-Encoding header value, e.g. "gzip;q=0.8, br"
+
+    Returns:
+        dict: Lower-cased coding names mapped to their quality value
+    """
+    accepted = {}
+    for part in header.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        coding, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def select_encoding(header: str, encodings) -> str:
+    """
+    Choose the content coding to use for a response.
+
+    The client's q-values win; ties are broken by the server preference order
+    given in ``encodings``.
+
+    Args:
+        header: Raw Accept-Encoding header value
+        encodings: Supported codings in server preference order
+
+    Returns:
+        str: Chosen coding, or None if the response should not be compressed
+    """
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = accepted.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware that compresses responses using the best encoding the client accepts.
+
+    Complete bodies smaller than ``minimum_size`` are sent untouched. Streamed bodies
+    (``more_body=True``) are compressed incrementally and flushed after every chunk,
+    so NDJSON and other streaming responses keep their latency characteristics.
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_level: int = 4,
+        zstd_level: int = 3,
+        encodings=None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_level, "zstd": zstd_level}
+        compressors = available_compressors()
+        if encodings:
+            compressors = {name: compressors[name] for name in encodings if name in compressors}
+        self.compressors = compressors
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+
+        encoding = select_encoding(accept, self.compressors) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    """Per-request state machine wrapping the ASGI ``send`` callable."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+        self.started = False
+
+    def _should_compress(self, headers) -> bool:
+        content_type = ""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    def _compressed_headers(self, content_length: int = None):
+        headers = [
+            (name, value) for name, value in self.start_message.get("headers", [])
+            if name not in (b"content-length", b"content-encoding")
+        ]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        vary = [value for name, value in headers if name == b"vary"]
+        if not any(b"accept-encoding" in value.lower() for value in vary):
+            headers.append((b"vary", b"Accept-Encoding"))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return headers
+
+    async def send(self, message):
+        message_type = message["type"]
+
+        if message_type == "http.response.start":
+            # Hold the headers back until we know whether the body will be compressed
+            self.start_message = message
+            self.passthrough = not self._should_compress(message.get("headers", []))
+            if self.passthrough:
+                await self.downstream(message)
+            return
+
+        if message_type != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        compressor_cls = self.middleware.compressors[self.encoding]
+        level = self.middleware.levels[self.encoding]
+
+        if not self.started and not more_body:
+            # Complete body in a single message
+            self.started = True
+            if len(body) < self.middleware.minimum_size:
+                await self.downstream(self.start_message)
+                await self.downstream(message)
+                return
+            compressor = compressor_cls(level)
+            compressed = compressor.compress(body) + compressor.finish()
+            self.start_message["headers"] = self._compressed_headers(len(compressed))
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": compressed})
+            return
+
+        if not self.started:
+            # First chunk of a streamed body: switch to chunked transfer
+            self.started = True
+            self.compressor = compressor_cls(level)
+            self.start_message["headers"] = self._compressed_headers()
+            await self.downstream(self.start_message)
+
+        chunk = self.compressor.compress(body) if body else b""
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.downstream({"type": "http.response.body", "body": chunk, "more_body": more_body})
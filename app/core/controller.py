@@ -0,0 +1,114 @@
+"""
+controller.py: Operational endpoints (health, metrics, profiling, slow queries) for the Diet Fitness application.
+"""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.auth.dependencies import get_admin_user
+from app.core.metrics import REGISTRY
+from app.core.profiler import MAX_SECONDS, profiler
+from app.db.slow_queries import slow_query_log
+
+# Router for operational endpoints; not part of the public API schema
+router = APIRouter(tags=["Operations"], include_in_schema=False)
+
+
+@router.get("/health/live")
+def liveness():
+    """
+    GET endpoint for liveness probes: the process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+def readiness(request: Request):
+    """
+    GET endpoint for readiness probes.
+    Answers 503 until the start-up warm-up has finished, then 200.
+    """
+    warmup = getattr(request.app.state, "warmup", None)
+    if warmup is None or warmup.ready:
+        return {"status": "ready", "warmup": warmup.status() if warmup else None}
+    return JSONResponse({"status": "warming_up", "warmup": warmup.status()}, status_code=503)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    GET endpoint exposing application metrics in Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.post("/admin/profile", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(get_admin_user)])
+def start_profile(request: Request, seconds: float = 10, requests: Optional[int] = None, interval_ms: float = 5):
+    """
+    POST endpoint starting a sampling profiler session in this worker.
+    Runs for ``seconds`` or until ``requests`` more requests have completed, whichever is first.
+    """
+    if not 0 < seconds <= MAX_SECONDS or not 1 <= interval_ms <= 1000 or (requests is not None and requests < 1):
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_SECONDS}], interval_ms in [1, 1000]")
+    try:
+        session = profiler.start(request.app, seconds, requests, interval_ms / 1000)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return session.status()
+
+
+@router.delete("/admin/profile", dependencies=[Depends(get_admin_user)])
+def stop_profile():
+    """
+    DELETE endpoint ending the running profiler session early.
+    """
+    session = profiler.active
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session is running")
+    session.stop()
+    session.wait(timeout=5)
+    return session.status()
+
+
+@router.get("/admin/profile", dependencies=[Depends(get_admin_user)])
+def get_profile(format: str = "status"):
+    """
+    GET endpoint returning the latest profiler session.
+    ``format`` is ``status`` (JSON summary), ``collapsed`` (collapsed stacks) or ``speedscope`` (JSON).
+    """
+    session = profiler.session
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session has been run")
+    if format == "status":
+        return session.status()
+    if format not in ("collapsed", "speedscope"):
+        raise HTTPException(status_code=400, detail="format must be status, collapsed or speedscope")
+    if session.running:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Profiling session is still running")
+    if format == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    return JSONResponse(session.speedscope())
+
+
+@router.get("/admin/slow-queries", dependencies=[Depends(get_admin_user)])
+def get_slow_queries(limit: int = 20, order: str = "total"):
+    """
+    GET endpoint listing the slowest statement fingerprints seen by this worker.
+    ``order`` is ``total`` (cumulative time), ``max`` (worst single run) or ``count``.
+    """
+    if order not in ("total", "max", "count") or limit < 1:
+        raise HTTPException(status_code=400, detail="order must be total, max or count and limit positive")
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "explain": slow_query_log.explain,
+        "queries": slow_query_log.top(limit, order),
+    }
+
+
+@router.delete("/admin/slow-queries", status_code=status.HTTP_204_NO_CONTENT, dependencies=[Depends(get_admin_user)])
+def reset_slow_queries():
+    """
+    DELETE endpoint clearing the slow-query statistics.
+    """
+    slow_query_log.reset()
@@ -0,0 +1,53 @@
+"""
+deadline.py: End-to-end deadlines for LLM-backed requests.
+
+A plan request gets a deadline when it arrives: ``LLM_REQUEST_DEADLINE_SECONDS``
+from now, or sooner if the client sends ``X-Request-Timeout: <seconds>`` (a
+client that gives up after 30 seconds gains nothing from a plan finished at 90).
+The ``Deadline`` object is passed down the pipeline, and every agent call is
+bounded by whatever time is left rather than by its own fixed timeout.
+"""
+import os
+import time
+
+from fastapi import Header
+
+LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv("LLM_REQUEST_DEADLINE_SECONDS", "150"))
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before the work could finish."""
+
+
+class Deadline:
+    """
+    Point in time by which a request must be answered.
+
+    Args:
+        seconds: Time budget from now
+        clock: Monotonic clock (tests pass a fake one)
+    """
+
+    def __init__(self, seconds: float, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def bound(self, timeout: float) -> float:
+        """Return ``timeout`` capped by the time left."""
+        return min(timeout, self.remaining())
+
+
+async def request_deadline(x_request_timeout: float = Header(None, gt=0)) -> Deadline:
+    """Dependency creating the deadline for the current request."""
+    seconds = LLM_REQUEST_DEADLINE_SECONDS
+    if x_request_timeout is not None:
+        seconds = min(seconds, x_request_timeout)
+    return Deadline(seconds)
@@ -0,0 +1,201 @@
+"""
+instrumentation.py: Request and database instrumentation for the Diet Fitness application.
+
+- ``MetricsMiddleware`` records the latency of every HTTP request, labelled by route
+  template (``/api/my-plans/{plan_id}``, never the raw path) and status code.
+- ``install_db_instrumentation`` hooks SQLAlchemy cursor events on every engine and
+  records the latency of each statement by operation (select/insert/update/delete).
+- ``ServerTimingMiddleware`` counts the statements and DB time of each request, plus
+  the time spent in named stages (the LLM calls), and reports them in a
+  ``Server-Timing`` response header and a structured log line.
+"""
+import contextvars
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.metrics import REGISTRY
+
+http_request_histogram = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+http_in_flight_gauge = REGISTRY.gauge("http_requests_in_flight", "HTTP requests currently being served")
+db_query_histogram = REGISTRY.histogram(
+    "db_query_duration_seconds", "Database statement latency by operation", ["operation"]
+)
+db_errors_counter = REGISTRY.counter("db_errors_total", "Database statements that raised", ["operation"])
+
+DB_OPERATIONS = ("select", "insert", "update", "delete")
+
+request_logger = logging.getLogger("app.requests")
+
+# Per-request accumulator; shared with threadpool workers through context copying
+_current_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Statement count, DB time and stage durations collected for one request."""
+
+    __slots__ = ("db_queries", "db_seconds", "stages", "scope")
+
+    def __init__(self, scope=None):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.stages = {}
+        self.scope = scope
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+def current_timings():
+    """Return the RequestTimings of the request being served, if any."""
+    return _current_timings.get()
+
+
+def current_route():
+    """Return the route template of the request being served, or None outside a request."""
+    timings = _current_timings.get()
+    if timings is None or timings.scope is None:
+        return None
+    return route_template(timings.scope)
+
+
+def record_stage(stage: str, seconds: float):
+    """Attribute ``seconds`` spent in ``stage`` to the current request."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add_stage(stage, seconds)
+
+
+def route_template(scope) -> str:
+    """Return the matched route template for a request scope, or "unmatched"."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency by method, route template and status."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_flight_gauge.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight_gauge.dec()
+            http_request_histogram.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=route_template(scope),
+                status=status_code,
+            )
+
+
+def statement_operation(statement: str) -> str:
+    """Classify a SQL statement by its leading keyword."""
+    keyword = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else ""
+    return keyword if keyword in DB_OPERATIONS else "other"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    db_query_histogram.observe(elapsed, operation=statement_operation(statement))
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.db_queries += 1
+        timings.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("query_start_time") if exception_context.connection else None
+    if starts:
+        starts.pop()
+    db_errors_counter.inc(operation=statement_operation(exception_context.statement or ""))
+
+
+def install_db_instrumentation():
+    """Attach statement timing hooks to every SQLAlchemy engine (idempotent)."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+
+
+def format_server_timing(timings: RequestTimings, total_seconds: float) -> str:
+    """Render request timings as a Server-Timing header value (durations in ms)."""
+    metrics = [f'db;dur={timings.db_seconds * 1000:.1f};desc="{timings.db_queries} queries"']
+    for stage, seconds in timings.stages.items():
+        metrics.append(f"{stage};dur={seconds * 1000:.1f}")
+    metrics.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware reporting per-request DB and stage timings.
+
+    Args:
+        app: ASGI application
+        emit_header: Add a Server-Timing header to responses
+    """
+
+    def __init__(self, app, emit_header: bool = True):
+        self.app = app
+        self.emit_header = emit_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope)
+        token = _current_timings.set(timings)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.emit_header:
+                    value = format_server_timing(timings, time.perf_counter() - started)
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timings.reset(token)
+            total_ms = (time.perf_counter() - started) * 1000
+            fields = {
+                "method": scope["method"],
+                "route": route_template(scope),
+                "status": status_code,
+                "duration_ms": round(total_ms, 1),
+                "db_queries": timings.db_queries,
+                "db_ms": round(timings.db_seconds * 1000, 1),
+            }
+            fields.update({f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in timings.stages.items()})
+            request_logger.info(" ".join(f"{key}={value}" for key, value in fields.items()), extra=fields)
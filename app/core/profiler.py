@@ -0,0 +1,278 @@
+"""
+profiler.py: On-demand statistical sampling profiler.
+
+A profiling session samples the Python stack of every thread at a fixed
+interval, for the next T seconds or the next N requests, whichever ends first.
+Each sample is attributed to the route whose endpoint function is on the stack
+(``analyze_fitness``, ``get_user_plans``...), which works for async endpoints on
+the event loop thread and sync endpoints in the threadpool alike. Idle threads
+(waiting in ``select``, locks or queues) are skipped.
+
+Results are exported as collapsed stacks (``flamegraph.pl``, speedscope, etc.)
+or as a speedscope JSON document with one profile per route.
+
+Nothing runs while no session is active: there is no sampling thread, and
+``ProfilerMiddleware`` only checks one attribute per request. Sessions are
+started from ``POST /admin/profile`` or, if ``PROFILER_SIGNAL_DIR`` is set, by
+sending the worker SIGUSR2.
+"""
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.005
+MAX_SECONDS = 300
+MAX_DEPTH = 128
+UNATTRIBUTED = "(unattributed)"
+
+# Innermost frames of threads that are blocked rather than burning CPU
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("_base.py", "result"),
+}
+
+
+def endpoint_labels(app) -> dict:
+    """Map each route endpoint's code object to its function name."""
+    labels = {}
+    for route in getattr(app, "routes", []):
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(endpoint, "__code__", None)
+        if code is not None:
+            labels[code] = endpoint.__name__
+    return labels
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """
+    One sampling run.
+
+    Args:
+        endpoints: Map of endpoint code objects to route labels
+        seconds: Stop after this many seconds
+        max_requests: Stop after this many requests have completed (None for no limit)
+        interval: Seconds between samples
+    """
+
+    def __init__(self, endpoints: dict, seconds: float, max_requests: int = None, interval: float = DEFAULT_INTERVAL,
+                 on_finish=None):
+        self.endpoints = endpoints
+        self.seconds = min(seconds, MAX_SECONDS)
+        self.max_requests = max_requests
+        self.interval = interval
+        self.requests = 0
+        self.samples = Counter()
+        self.sample_count = 0
+        # The sampler thread adds samples while requests read them
+        self._samples_lock = threading.Lock()
+        self.started = None
+        self.elapsed = 0.0
+        self.on_finish = on_finish
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def request_finished(self):
+        self.requests += 1
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            self.stop()
+
+    def _run(self):
+        own = threading.get_ident()
+        deadline = self.started + self.seconds
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= deadline:
+                break
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._sample(frame)
+        self.elapsed = time.monotonic() - self.started
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def _sample(self, frame):
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+            return
+        stack = []
+        route = UNATTRIBUTED
+        while frame is not None and len(stack) < MAX_DEPTH:
+            code = frame.f_code
+            if route == UNATTRIBUTED and code in self.endpoints:
+                route = self.endpoints[code]
+            stack.append(_frame_name(code))
+            frame = frame.f_back
+        stack.append(route)
+        stack.reverse()
+        with self._samples_lock:
+            self.samples[tuple(stack)] += 1
+            self.sample_count += 1
+
+    def snapshot(self) -> Counter:
+        """Copy of the sample counts, safe to iterate while sampling continues."""
+        with self._samples_lock:
+            return Counter(self.samples)
+
+    def routes(self) -> Counter:
+        """Sample counts per route."""
+        totals = Counter()
+        for stack, count in self.snapshot().items():
+            totals[stack[0]] += count
+        return totals
+
+    def collapsed(self) -> str:
+        """Render samples as collapsed stacks: ``route;outer;...;inner count`` per line."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.snapshot().items()))
+
+    def speedscope(self) -> dict:
+        """Render samples as a speedscope document with one sampled profile per route."""
+        frames = []
+        frame_index = {}
+        profiles = {}
+        for stack, count in self.snapshot().items():
+            indexes = []
+            for name in stack[1:]:
+                if name not in frame_index:
+                    frame_index[name] = len(frames)
+                    frames.append({"name": name})
+                indexes.append(frame_index[name])
+            profile = profiles.setdefault(stack[0], {"samples": [], "weights": []})
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "exporter": "diet-fitness-profiler",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": route,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(profile["weights"]),
+                    "samples": profile["samples"],
+                    "weights": profile["weights"],
+                }
+                for route, profile in sorted(profiles.items())
+            ],
+        }
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "seconds": self.seconds,
+            "max_requests": self.max_requests,
+            "requests": self.requests,
+            "samples": self.sample_count,
+            "elapsed": round(self.elapsed if not self.running else time.monotonic() - self.started, 3),
+            "routes": dict(self.routes().most_common()),
+        }
+
+
+class Profiler:
+    """Holds the running session (``active``, None when idle) and the most recent one (``session``)."""
+
+    def __init__(self):
+        self.session = None
+        self.active = None
+        self._lock = threading.Lock()
+
+    def _finished(self, session: ProfileSession):
+        with self._lock:
+            if self.active is session:
+                self.active = None
+
+    def start(self, app, seconds: float, max_requests: int = None, interval: float = DEFAULT_INTERVAL) -> ProfileSession:
+        """
+        Start a session profiling ``app``'s routes.
+
+        Raises:
+            RuntimeError: If a session is already running
+        """
+        with self._lock:
+            if self.active is not None:
+                raise RuntimeError("A profiling session is already running")
+            session = ProfileSession(endpoint_labels(app), seconds, max_requests, interval, on_finish=self._finished)
+            self.session = self.active = session
+            session.start()
+            return session
+
+
+profiler = Profiler()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware counting requests towards an active session's request limit."""
+
+    def __init__(self, app, profiler: Profiler = profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        session = self.profiler.active
+        if session is None or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.request_finished()
+
+
+def install_signal_handler(app, output_dir: str, seconds: float = 30, signum=None):
+    """
+    Profile for ``seconds`` whenever the process receives ``signum`` (SIGUSR2).
+
+    Results are written to ``output_dir`` as ``profile-<pid>-<time>.collapsed``
+    and ``.speedscope.json`` when the session ends.
+    """
+    signum = signum or signal.SIGUSR2
+
+    def write_when_done(session):
+        session.wait()
+        stem = os.path.join(output_dir, f"profile-{os.getpid()}-{int(time.time())}")
+        with open(f"{stem}.collapsed", "w") as f:
+            f.write(session.collapsed())
+        with open(f"{stem}.speedscope.json", "w") as f:
+            json.dump(session.speedscope(), f)
+        logger.warning("Profile written to %s.{collapsed,speedscope.json}", stem)
+
+    def handler(received, frame):
+        try:
+            session = profiler.start(app, seconds)
+        except RuntimeError:
+            return
+        threading.Thread(target=write_when_done, args=(session,), daemon=True).start()
+
+    os.makedirs(output_dir, exist_ok=True)
+    signal.signal(signum, handler)
@@ -0,0 +1,193 @@
+"""
+warmup.py: Start-up warm-up so the first requests after a deploy run at steady-state speed.
+
+A fresh worker pays several one-off costs on its first requests: opening database
+connections, building pydantic schemas and the OpenAPI document, loading the
+bcrypt backend, importing and building the AI agents, and the TLS handshake with
+the model provider. The lifespan runs these steps in the background right after
+start-up; ``GET /health/ready`` answers 503 until they have finished (or the
+warm-up timed out), so a load balancer only routes traffic to warm workers.
+
+Steps (``WARMUP_STEPS``, comma-separated; empty disables warm-up):
+
+- ``db``: check out ``WARMUP_DB_CONNECTIONS`` pool connections at once;
+- ``schemas``: build the UserInput/CoachResult JSON schemas, validate a sample plan
+  and generate the OpenAPI document;
+- ``auth``: issue and verify a JWT and hash and verify a password;
+- ``agents``: import pydantic_ai and build the agents;
+- ``provider``: open a connection to the model provider (needs ``OPENAI_API_KEY``).
+"""
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import text
+
+from app.core.metrics import REGISTRY
+
+WARMUP_STEPS = tuple(
+    step.strip() for step in os.getenv("WARMUP_STEPS", "db,schemas,auth,agents,provider").split(",") if step.strip()
+)
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "4"))
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "30"))
+PROVIDER_TIMEOUT_SECONDS = 5.0
+
+logger = logging.getLogger(__name__)
+
+ready_gauge = REGISTRY.gauge("app_ready", "1 once start-up warm-up has finished")
+warmup_step_gauge = REGISTRY.gauge("warmup_step_duration_seconds", "Duration of each warm-up step", ["step"])
+
+
+def warm_database(engine, connections: int = WARMUP_DB_CONNECTIONS):
+    """Open ``connections`` pooled connections at the same time, then return them to the pool."""
+    held = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            held.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in held:
+            connection.close()
+
+
+def warm_schemas(app):
+    """Build JSON schemas and validators for the plan models and the OpenAPI document."""
+    from app.diet_fit_app.models import CoachResult, UserInput, Weekday
+
+    UserInput.model_json_schema()
+    CoachResult.model_json_schema()
+    sample = CoachResult(
+        workout_plan=[{"day": day, "activity": "Rest"} for day in Weekday],
+        diet_plan=[{"day": day, "meals": "Balanced meals"} for day in Weekday],
+        estimated_days_to_goal=0,
+    )
+    CoachResult.model_validate_json(sample.model_dump_json())
+    app.openapi()
+
+
+def warm_auth():
+    """Exercise the JWT and bcrypt code paths once."""
+    import app.auth.token as auth_token_module
+    from app.auth.utils import get_password_hash, verify_password
+
+    token = auth_token_module.create_access_token({"sub": "warmup"})
+    auth_token_module.verify_token(token)
+    verify_password("warm-up password", get_password_hash("warm-up password"))
+
+
+def warm_agents():
+    """Import pydantic_ai and build the AI agents."""
+    from app.diet_fit_app.service import init_agents
+
+    init_agents()
+
+
+async def warm_provider():
+    """Open a connection to the model provider from every distinct HTTP client the agents use."""
+    from app.diet_fit_app.service import get_agent
+
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.info("Skipping provider warm-up: OPENAI_API_KEY is not set")
+        return
+    clients = {}
+    for name in ("gpt03_agent", "estimator_agent"):
+        client = getattr(get_agent(name).model, "client", None)
+        if client is not None:
+            clients.setdefault(id(getattr(client, "_client", client)), client)
+    # Listing models is free and leaves a live connection in the shared pool
+    await asyncio.gather(*(
+        asyncio.wait_for(client.models.list(), PROVIDER_TIMEOUT_SECONDS) for client in clients.values()
+    ))
+
+
+class Warmup:
+    """
+    Runs the warm-up steps and tracks readiness.
+
+    Args:
+        app: FastAPI application (for the OpenAPI document)
+        engine: Database engine whose pool is warmed (the application engine by default)
+        steps: Steps to run, in the order listed in the module docstring
+        timeout: Seconds after which the worker is declared ready regardless
+    """
+
+    def __init__(self, app, steps=WARMUP_STEPS, timeout: float = WARMUP_TIMEOUT_SECONDS, engine=None):
+        self.app = app
+        self.engine = engine
+        self.steps = tuple(steps)
+        self.timeout = timeout
+        self.results = {}
+        self.ready = False
+        self.timed_out = False
+        self.elapsed = 0.0
+        self._task = None
+
+    def start(self):
+        """Run the warm-up in the background."""
+        self._task = asyncio.create_task(self.run())
+
+    def mark_ready(self):
+        self.ready = True
+        ready_gauge.set(1)
+
+    async def stop(self):
+        """Cancel an unfinished warm-up (at shutdown)."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _step(self, name: str, work):
+        started = time.perf_counter()
+        try:
+            await work()
+            self.results[name] = {"ok": True}
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            self.results[name] = {"ok": False, "error": str(e)}
+        elapsed = time.perf_counter() - started
+        self.results[name]["ms"] = round(elapsed * 1000, 1)
+        warmup_step_gauge.set(elapsed, step=name)
+
+    async def _agents_then_provider(self):
+        if "agents" in self.steps:
+            await self._step("agents", lambda: asyncio.to_thread(warm_agents))
+        if "provider" in self.steps:
+            await self._step("provider", warm_provider)
+
+    async def run(self):
+        """Run all configured steps, then mark the worker ready."""
+        ready_gauge.set(0)
+        started = time.perf_counter()
+        # Independent steps run side by side in worker threads, keeping the event loop free
+        work = []
+        if "db" in self.steps:
+            if self.engine is None:
+                from app.db.database import engine as app_engine
+                self.engine = app_engine
+            work.append(self._step("db", lambda: asyncio.to_thread(warm_database, self.engine)))
+        if "schemas" in self.steps:
+            work.append(self._step("schemas", lambda: asyncio.to_thread(warm_schemas, self.app)))
+        if "auth" in self.steps:
+            work.append(self._step("auth", lambda: asyncio.to_thread(warm_auth)))
+        work.append(self._agents_then_provider())
+        try:
+            await asyncio.wait_for(asyncio.gather(*work), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            logger.warning("Warm-up did not finish within %.0fs; marking the worker ready", self.timeout)
+        finally:
+            self.elapsed = time.perf_counter() - started
+            self.mark_ready()
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "steps": self.results,
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+            "timed_out": self.timed_out,
+        }
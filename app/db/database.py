@@ -52,6 +52,11 @@ except Exception as e:
     )
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Log statements slower than SLOW_QUERY_THRESHOLD_MS (0 disables the slow-query log)
+from app.db.slow_queries import SLOW_QUERY_THRESHOLD_MS, slow_query_log
+if SLOW_QUERY_THRESHOLD_MS > 0:
+    slow_query_log.attach(engine)
+
 # Create a base class for declarative class definitions
 # All ORM model classes will inherit from this base
 Base = declarative_base()
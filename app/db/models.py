@@ -1,8 +1,11 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import (
+    Column, Integer, SmallInteger, String, Boolean, DateTime, Float, ForeignKey, Text, UniqueConstraint, Index, event,
+)
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
 from app.db.database import Base
+from app.diet_fit_app.goals import GOAL_COLUMNS, goal_columns
 
 # Database models for the Diet and Fitness application
 
@@ -24,14 +27,24 @@ class User(Base):
 
     # Relationship to user's fitness plans
     plans = relationship("UserPlan", back_populates="user", cascade="all, delete-orphan")
+    idempotency_keys = relationship("IdempotencyKey", back_populates="user", cascade="all, delete-orphan")
+    llm_usage = relationship("LLMUsage", back_populates="user", cascade="all, delete-orphan")
+    weight_entries = relationship("WeightEntry", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class UserPlan(Base):
     """
     UserPlan model representing a user's fitness plan.
 
     Contains weight goals, workout frequency, and links to specific workout and diet plans.
+    The free-text goal fields are also stored as canonical numbers for SQL analytics;
+    these columns are derived on every write (see app/diet_fit_app/goals.py).
     """
     __tablename__ = "user_plans"
+    __table_args__ = (
+        Index("ix_user_plans_goal_direction_weight_kg", "goal_direction", "weight_kg"),
+        Index("ix_user_plans_target_weight_kg", "target_weight_kg"),
+        Index("ix_user_plans_sessions_per_week", "sessions_per_week"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))           # Link to the user who owns this plan
@@ -39,6 +52,12 @@ class UserPlan(Base):
     weight_goal = Column(String)                                # User's target weight
     workout_frequency = Column(String)                          # How often user plans to workout
     estimated_days_to_goal = Column(Integer)                    # Estimated time to reach weight goal
+    model_tier = Column(String(32), nullable=True)              # Coach model tier that generated the plan
+    program = Column(Text, nullable=True)                       # Multi-week program settings (JSON), expanded on read
+    weight_kg = Column(Float, nullable=True)                    # Current weight in kg, parsed from current_weight
+    target_weight_kg = Column(Float, nullable=True)             # Target weight in kg, parsed from weight_goal
+    sessions_per_week = Column(SmallInteger, nullable=True)     # Workouts per week, parsed from workout_frequency
+    goal_direction = Column(SmallInteger, nullable=True)        # -1 lose, 0 maintain, 1 gain
     created_at = Column(DateTime(timezone=True), server_default=func.now())  # Plan creation timestamp
 
     # Relationships to related models
@@ -46,6 +65,14 @@ class UserPlan(Base):
     workout_plans = relationship("WorkoutPlan", back_populates="user_plan", cascade="all, delete-orphan")  # Workout schedule
     diet_plans = relationship("DietPlan", back_populates="user_plan", cascade="all, delete-orphan")        # Diet schedule
 
+@event.listens_for(UserPlan, "before_insert")
+@event.listens_for(UserPlan, "before_update")
+def _derive_goal_columns(mapper, connection, plan):
+    # Keep the numeric goal columns in step with the free-text fields on every ORM write
+    values = goal_columns(plan.current_weight, plan.weight_goal, plan.workout_frequency)
+    for column in GOAL_COLUMNS:
+        setattr(plan, column, values[column])
+
 class WorkoutPlan(Base):
     """
     WorkoutPlan model representing daily workout activities.
@@ -77,3 +104,91 @@ class DietPlan(Base):
 
     # Relationship back to the parent plan
     user_plan = relationship("UserPlan", back_populates="diet_plans")
+
+class IdempotencyKey(Base):
+    """
+    IdempotencyKey model recording plan generation requests by client-supplied key.
+
+    Lets a retried POST with the same Idempotency-Key replay the stored response
+    instead of generating (and storing) a second plan.
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_id_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"))            # User who sent the request
+    key = Column(String(255))                                    # Client-supplied Idempotency-Key header
+    request_hash = Column(String(64))                            # SHA-256 of the request body
+    status = Column(String(16), default="in_progress")           # "in_progress" or "completed"
+    response_body = Column(Text, nullable=True)                  # Stored JSON response once completed
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # Start of the current in-progress lease
+    created_at = Column(DateTime(timezone=True), server_default=func.now())  # First request timestamp
+    expires_at = Column(DateTime(timezone=True))                 # Replay window end
+
+    # Relationship back to the user
+    user = relationship("User", back_populates="idempotency_keys")
+
+class LLMUsage(Base):
+    """
+    LLMUsage model recording token usage and cost of one AI agent run.
+
+    Rows are written in batches and aggregated per user for usage reports and budgets.
+    """
+    __tablename__ = "llm_usage"
+    __table_args__ = (Index("ix_llm_usage_user_id_created_at", "user_id", "created_at"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"))            # User the run was made for
+    agent = Column(String(32))                                   # Pipeline agent ("coach", "estimator")
+    model = Column(String(64))                                   # Model that served the run
+    requests = Column(Integer, default=0)                        # Model API requests in the run
+    prompt_tokens = Column(Integer, default=0)                   # Input tokens
+    completion_tokens = Column(Integer, default=0)               # Output tokens
+    cached_tokens = Column(Integer, default=0)                   # Input tokens served from the provider cache
+    latency_ms = Column(Integer, default=0)                      # Wall-clock duration of the run
+    cost_usd = Column(Float, default=0.0)                        # Estimated cost from the price table
+    created_at = Column(DateTime(timezone=True))                 # When the run finished
+
+    # Relationship back to the user
+    user = relationship("User", back_populates="llm_usage")
+
+class PlanTemplate(Base):
+    """
+    PlanTemplate model storing a generated week that can be served to similar users.
+
+    Plans are collected as unapproved candidates; only approved templates are
+    matched against new requests (see app/diet_fit_app/templates.py).
+    """
+    __tablename__ = "plan_templates"
+    __table_args__ = (
+        Index("ix_plan_templates_approved", "approved"),
+        Index("ix_plan_templates_features", "features"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    features = Column(Text)                                      # JSON feature vector of the source UserInput
+    result = Column(Text)                                        # CoachResult JSON (7-day workout and diet plan)
+    source_tier = Column(String(32), nullable=True)              # Coach model tier that generated the plan
+    approved = Column(Boolean, default=False)                    # Only approved templates are served
+    uses = Column(Integer, default=0)                            # Times the template was served
+    created_at = Column(DateTime(timezone=True), server_default=func.now())  # When the plan was collected
+
+class WeightEntry(Base):
+    """
+    WeightEntry model recording one weigh-in of a user.
+
+    The log is append-only: rows are inserted in batches and never updated, and
+    are read back by user and time range through the composite index
+    (see app/diet_fit_app/weight_log.py).
+    """
+    __tablename__ = "weight_entries"
+    __table_args__ = (Index("ix_weight_entries_user_id_recorded_at", "user_id", "recorded_at"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)  # User who logged the entry
+    recorded_at = Column(DateTime(timezone=True), nullable=False)  # When the weight was measured (UTC)
+    weight_g = Column(Integer, nullable=False)                   # Measured weight in grams
+    note = Column(String(140), nullable=True)                    # Optional short check-in note
+
+    # Relationship back to the user
+    user = relationship("User", back_populates="weight_entries")
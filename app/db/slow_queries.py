@@ -0,0 +1,200 @@
+"""
+slow_queries.py: Slow-query log for the application database engine.
+
+Statements slower than ``SLOW_QUERY_THRESHOLD_MS`` are:
+
+- logged on the ``app.db.slow`` logger with their fingerprint, duration, the
+  shape of their parameters (types only, never values) and the route that ran them;
+- aggregated per fingerprint (the statement with literals and IN lists
+  normalized), so ``GET /admin/slow-queries`` can rank them by total time,
+  worst case or frequency;
+- optionally explained: with ``SLOW_QUERY_EXPLAIN=1`` the first slow occurrence
+  of each fingerprint runs ``EXPLAIN`` (``EXPLAIN QUERY PLAN`` on SQLite) with
+  the same parameters and keeps the plan with the statistics.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+from app.core.instrumentation import current_route, statement_operation
+from app.core.metrics import REGISTRY
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "0") == "1"
+# Distinct fingerprints kept in memory; slow statements beyond this are only logged
+SLOW_QUERY_MAX_FINGERPRINTS = 500
+
+logger = logging.getLogger("app.db.slow")
+
+slow_queries_counter = REGISTRY.counter(
+    "db_slow_queries_total", "Statements slower than the slow-query threshold", ["operation"]
+)
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Replace literals and bind placeholders with ``?`` and collapse IN lists and whitespace."""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _IN_LIST.sub("(?...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def fingerprint(statement: str) -> str:
+    """Return a short stable id for a statement's normalized form."""
+    return hashlib.sha1(normalize_statement(statement).encode()).hexdigest()[:12]
+
+
+def parameter_shape(parameters, executemany: bool = False):
+    """Describe bound parameters by type only, e.g. ``{"user_id": "int"}``."""
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {"rows": len(parameters), "row": parameter_shape(parameters[0]) if parameters else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class SlowQueryLog:
+    """
+    Per-fingerprint statistics for statements over a latency threshold.
+
+    Args:
+        threshold_ms: Minimum duration to count as slow
+        explain: Capture EXPLAIN output for the first slow occurrence of each fingerprint
+        max_fingerprints: Distinct fingerprints kept in memory
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_THRESHOLD_MS, explain: bool = SLOW_QUERY_EXPLAIN,
+                 max_fingerprints: int = SLOW_QUERY_MAX_FINGERPRINTS):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.max_fingerprints = max_fingerprints
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def attach(self, engine):
+        """Time every statement on ``engine`` (idempotent)."""
+        if not event.contains(engine, "before_cursor_execute", self._before):
+            event.listen(engine, "before_cursor_execute", self._before)
+            event.listen(engine, "after_cursor_execute", self._after)
+
+    def reset(self):
+        with self._lock:
+            self.stats = {}
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("slow_query_start")
+        if not starts:
+            return
+        duration_ms = (time.perf_counter() - starts.pop()) * 1000
+        if duration_ms >= self.threshold_ms:
+            self.record(conn, cursor, statement, parameters, executemany, duration_ms)
+
+    def record(self, conn, cursor, statement, parameters, executemany, duration_ms):
+        """Log and aggregate one slow statement."""
+        key = fingerprint(statement)
+        operation = statement_operation(statement)
+        route = current_route() or "(no request)"
+        shape = parameter_shape(parameters, executemany)
+        slow_queries_counter.inc(operation=operation)
+        logger.warning(
+            "slow query fingerprint=%s duration_ms=%.1f route=%s params=%s statement=%s",
+            key, duration_ms, route, shape, _WHITESPACE.sub(" ", statement).strip(),
+            extra={"fingerprint": key, "duration_ms": round(duration_ms, 1), "route": route},
+        )
+
+        with self._lock:
+            entry = self.stats.get(key)
+            first = entry is None
+            if first:
+                if len(self.stats) >= self.max_fingerprints:
+                    return
+                entry = self.stats[key] = {
+                    "fingerprint": key,
+                    "statement": normalize_statement(statement),
+                    "operation": operation,
+                    "parameters": shape,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "routes": {},
+                    "explain": None,
+                }
+            entry["count"] += 1
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = time.time()
+            entry["routes"][route] = entry["routes"].get(route, 0) + 1
+
+        if first and self.explain and not executemany and operation == "select":
+            entry["explain"] = self._explain(conn, statement, parameters)
+
+    @staticmethod
+    def _explain(conn, statement, parameters):
+        """
+        Run EXPLAIN for a statement on a fresh DBAPI cursor of the same connection.
+
+        The connection is inside the request's transaction. A failed statement
+        aborts a PostgreSQL transaction, so EXPLAIN runs in a savepoint that is
+        rolled back on failure and the request's later statements are unaffected.
+        """
+        sqlite = conn.dialect.name == "sqlite"
+        prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+        try:
+            cursor = conn.connection.dbapi_connection.cursor()
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+        try:
+            if not sqlite:
+                cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(prefix + statement, parameters)
+                plan = "\n".join(" ".join(str(column) for column in row) for row in cursor.fetchall())
+            except Exception as e:
+                if not sqlite:
+                    cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                plan = f"EXPLAIN failed: {e}"
+            if not sqlite:
+                cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        except Exception as e:
+            return f"EXPLAIN failed: {e}"
+        finally:
+            cursor.close()
+
+    def top(self, limit: int = 20, order: str = "total") -> list:
+        """
+        Return the ``limit`` worst fingerprints.
+
+        Args:
+            limit: Number of entries
+            order: ``total`` (cumulative time), ``max`` (worst single run) or ``count``
+        """
+        sort_key = {"total": "total_ms", "max": "max_ms", "count": "count"}[order]
+        with self._lock:
+            entries = [dict(entry, routes=dict(entry["routes"])) for entry in self.stats.values()]
+        for entry in entries:
+            entry["mean_ms"] = round(entry["total_ms"] / entry["count"], 2)
+            entry["total_ms"] = round(entry["total_ms"], 2)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+        entries.sort(key=lambda entry: entry[sort_key], reverse=True)
+        return entries[:limit]
+
+
+slow_query_log = SlowQueryLog()
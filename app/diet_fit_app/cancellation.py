@@ -0,0 +1,134 @@
+"""
+cancellation.py: Stop plan generations nobody is waiting for.
+
+A plan request keeps two agent calls running for tens of seconds. If the client
+goes away in the meantime (the user closed the app, a proxy timed out), carrying
+on costs provider capacity and an admission slot for a response nobody reads.
+``run_until_disconnect`` runs the generation as a task and watches the request
+for ``http.disconnect``. What happens then depends on ``GENERATION_ON_DISCONNECT``:
+
+- ``abort`` (default): the generation task is cancelled, which closes the
+  in-flight provider request; the request ends with 499. An Idempotency-Key
+  claim is released, so a retry generates afresh.
+- ``finish``: the generation completes and is stored (and its Idempotency-Key
+  response recorded), so a retry or the next ``/my-plans`` call gets it for free.
+
+All generation tasks are tracked in ``generations``. At shutdown the lifespan
+calls ``generations.drain()``, which waits up to
+``GENERATION_SHUTDOWN_DEADLINE_SECONDS`` for them and cancels the rest.
+"""
+import asyncio
+import os
+import time
+
+from fastapi import HTTPException, Request
+
+from app.core.metrics import REGISTRY
+
+ABORT = "abort"
+FINISH = "finish"
+
+GENERATION_ON_DISCONNECT = os.getenv("GENERATION_ON_DISCONNECT", ABORT)
+GENERATION_SHUTDOWN_DEADLINE_SECONDS = float(os.getenv("GENERATION_SHUTDOWN_DEADLINE_SECONDS", "30"))
+
+# Non-standard status (nginx) for a request the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+disconnects_counter = REGISTRY.counter(
+    "pipeline_client_disconnects_total", "Plan requests whose client disconnected mid-generation", ["action"]
+)
+cancelled_counter = REGISTRY.counter(
+    "pipeline_cancelled_total", "Plan generations cancelled before completion", ["reason"]
+)
+cancelled_work_histogram = REGISTRY.histogram(
+    "pipeline_cancelled_work_seconds", "Time already spent on generations when they were cancelled", ["reason"]
+)
+
+
+class Generations:
+    """Registry of running generation tasks, for cancellation and shutdown draining."""
+
+    def __init__(self):
+        self.started = {}
+
+    def __len__(self):
+        return len(self.started)
+
+    def start(self, coroutine) -> asyncio.Task:
+        task = asyncio.ensure_future(coroutine)
+        self.started[task] = time.perf_counter()
+        task.add_done_callback(lambda done: self.started.pop(done, None))
+        return task
+
+    async def cancel(self, task: asyncio.Task, reason: str):
+        """Cancel ``task`` and wait for it to unwind."""
+        if task.done():
+            return
+        started = self.started.get(task, time.perf_counter())
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # It failed while unwinding; nobody is waiting for the error
+            pass
+        cancelled_counter.inc(reason=reason)
+        cancelled_work_histogram.observe(time.perf_counter() - started, reason=reason)
+
+    async def drain(self, deadline: float = GENERATION_SHUTDOWN_DEADLINE_SECONDS):
+        """Wait up to ``deadline`` seconds for running generations, then cancel the rest."""
+        tasks = list(self.started)
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        await asyncio.gather(*(self.cancel(task, "shutdown") for task in pending))
+
+
+generations = Generations()
+
+
+async def wait_for_disconnect(request: Request):
+    """Return once the client has disconnected (the request body has already been read)."""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def run_until_disconnect(request: Request, produce, on_disconnect: str = None):
+    """
+    Run ``produce()`` unless the client disconnects first.
+
+    Args:
+        request: The plan request being served
+        produce: Zero-argument coroutine function running the generation
+        on_disconnect: ``abort`` or ``finish`` (defaults to ``GENERATION_ON_DISCONNECT``)
+
+    Returns:
+        The result of ``produce()``
+
+    Raises:
+        HTTPException: 499 if the client disconnected and the generation was aborted
+    """
+    on_disconnect = on_disconnect or GENERATION_ON_DISCONNECT
+    task = generations.start(produce())
+    watcher = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            return task.result()
+        if on_disconnect == FINISH:
+            disconnects_counter.inc(action="finished")
+            return await asyncio.shield(task)
+        disconnects_counter.inc(action="aborted")
+        await generations.cancel(task, "disconnect")
+        raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    except asyncio.CancelledError:
+        # The server gave up on the request (e.g. its graceful-shutdown timeout). In
+        # finish mode the generation carries on and is drained by the lifespan.
+        if on_disconnect != FINISH:
+            await generations.cancel(task, "shutdown")
+        raise
+    finally:
+        watcher.cancel()
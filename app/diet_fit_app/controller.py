@@ -1,10 +1,28 @@
 """
 controller.py: Defines API endpoints for the Diet Fit application.
 """
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from app.diet_fit_app.models import UserInput, CoachResult, UserPlanUpdate
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, selectinload
+
+from app.diet_fit_app.models import (
+    UserInput, CoachResult, UserPlanUpdate, UsageReport, ProgramPage, ProgramSettings,
+    WeightLogBatch, WeightLog, WeightLogResult, WeightTrend,
+)
+from app.diet_fit_app import export as plan_export
+from app.diet_fit_app.idempotency import run_idempotent
+from app.diet_fit_app import usage as llm_usage
+from app.diet_fit_app.cancellation import run_until_disconnect
+from app.diet_fit_app.fallback import CIRCUIT_OPEN_SECONDS, NoTierAvailable
+from app.diet_fit_app.repair import complete_week
+from app.diet_fit_app.replan import replan as replan_plan
+from app.diet_fit_app import progression
+from app.diet_fit_app.nutrition import attach_nutrition
+from app.diet_fit_app import weight_log
 import warnings
 try:
     from app.diet_fit_app.service import run_fitness_pipeline
@@ -15,26 +33,66 @@ except ImportError as _err:
 from app.db.database import get_db
 from app.db.models import User, UserPlan, WorkoutPlan, DietPlan
 from app.auth.dependencies import get_current_user
+from app.core.admission import llm_admission, llm_slot
+from app.core.deadline import Deadline, DeadlineExceeded, request_deadline
 
 
 # Router  for nutrition and fitness analysis endpoints
 router = APIRouter()
 
-@router.post("/fitness-plan", response_model=CoachResult)
+@router.post(
+    "/fitness-plan",
+    response_model=CoachResult,
+    # The deadline comes first so that time spent queueing for admission counts against it
+    dependencies=[Depends(request_deadline), Depends(llm_usage.enforce_usage_budget), Depends(llm_admission)]
+)
 async def analyze_fitness(
     input_data: UserInput,
+    request: Request,
+    response: Response,
+    deadline: Deadline = Depends(request_deadline),
+    idempotency_key: Optional[str] = Header(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     POST endpoint to generate a fitness and diet plan.
     Requires authentication.
+
+    Clients may send an ``Idempotency-Key`` header; retries with the same key
+    replay the original response instead of generating a new plan.
+
+    If the client disconnects mid-generation the agent calls are cancelled, or
+    finished and stored, depending on ``GENERATION_ON_DISCONNECT``. Agent calls
+    are bounded by the request deadline (``X-Request-Timeout`` header).
     """
     try:
         # Invoke the service pipeline to get workout, diet, and estimate
         # Also store the results in the database
-        result = await run_fitness_pipeline(input_data, db, current_user.id)
+        if idempotency_key is not None:
+            result, replayed = await run_until_disconnect(request, lambda: run_idempotent(
+                db, current_user.id, idempotency_key, input_data,
+                lambda: run_fitness_pipeline(input_data, db, current_user.id, deadline)
+            ))
+            if replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+            return result
+        result = await run_until_disconnect(
+            request, lambda: run_fitness_pipeline(input_data, db, current_user.id, deadline)
+        )
         return result
+    except HTTPException:
+        # Re-raise HTTP exceptions
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
+    except NoTierAvailable as e:
+        # Every model tier is failing or has its circuit open
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(int(CIRCUIT_OPEN_SECONDS))}
+        )
     except Exception as e:
         # Log error and return HTTP 500
         print("Error in analyze_fitness:", e)
@@ -49,8 +107,14 @@ async def get_user_plans(
     GET endpoint to retrieve all fitness plans for the current user.
     """
     try:
-        # Get all plans for the current user
-        user_plans = db.query(UserPlan).filter(UserPlan.user_id == current_user.id).all()
+        # Get all plans for the current user, loading their day plans in two batched
+        # queries instead of two lazy loads per plan
+        user_plans = (
+            db.query(UserPlan)
+            .options(selectinload(UserPlan.workout_plans), selectinload(UserPlan.diet_plans))
+            .filter(UserPlan.user_id == current_user.id)
+            .all()
+        )
 
         # Convert database models to Pydantic models
         results = []
@@ -71,13 +135,9 @@ async def get_user_plans(
                     "meals": dp.meals
                 })
 
-            # Create CoachResult object
-            result = CoachResult(
-                workout_plan=workout_plans,
-                diet_plan=diet_plans,
-                estimated_days_to_goal=plan.estimated_days_to_goal
-            )
-            results.append(result)
+            # Create CoachResult object, completing any days missing from older plans
+            result = complete_week(workout_plans, diet_plans, plan.estimated_days_to_goal)
+            results.append(attach_nutrition(result))
 
         return results
     except Exception as e:
@@ -86,16 +146,57 @@ async def get_user_plans(
         raise HTTPException(status_code=500, detail=f"Error retrieving plans: {str(e)}")
 
 
+@router.get("/my-plans/export")
+async def export_user_plans(
+    table: str = "user_plans",
+    format: str = "ndjson",
+    batch_size: int = plan_export.DEFAULT_BATCH_SIZE,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    GET endpoint to stream the current user's plan history.
+
+    Streams one of the ``user_plans``, ``workout_plans`` or ``diet_plans`` tables
+    as NDJSON, CSV or Parquet, reading rows in batches so memory use stays flat.
+    """
+    if table not in plan_export.EXPORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unknown table: {table}")
+    if format not in plan_export.ENCODERS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
+    if format == "parquet" and not plan_export.PARQUET_AVAILABLE:
+        raise HTTPException(status_code=400, detail="Parquet export is not available on this server")
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be positive")
+
+    # The stream opens its own connection, so it outlives the request session
+    chunks = plan_export.stream_export(db.get_bind(), table, format, current_user.id, batch_size)
+    return StreamingResponse(
+        chunks,
+        media_type=plan_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    )
+
+
 @router.put("/my-plans/{plan_id}", response_model=CoachResult)
 async def update_user_plan(
     plan_id: int,
     update_data: UserPlanUpdate,
+    response: Response,
+    replan: str = Query("incremental", pattern="^(incremental|model|none)$"),
+    deadline: Deadline = Depends(request_deadline),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     PUT endpoint to update an existing fitness plan.
     Requires authentication and plan ownership.
+
+    With ``replan=incremental`` (default) the parts of the plan that depend on the
+    changed fields are recomputed locally (see replan.py); ``replan=model`` may call
+    the repair or estimator agents and is admitted, rate limited and budgeted like
+    plan generation; ``replan=none`` only stores the fields.
+    The recomputed parts are listed in the ``X-Replanned`` response header.
     """
     try:
         # Get the plan and verify ownership
@@ -110,6 +211,17 @@ async def update_user_plan(
                 detail="Plan not found or you don't have permission to update it"
             )
 
+        if replan != "none":
+            # Recompute only the estimate and/or workout days affected by the change
+            use_model = replan == "model"
+            if use_model:
+                # Same guards as plan generation: usage budget, rate limit and a concurrency slot
+                llm_usage.check_budget(db, current_user.id)
+            async with llm_slot(current_user.id, deadline) if use_model else nullcontext():
+                result, parts = await replan_plan(db, plan, update_data, current_user.id, deadline, use_model)
+            response.headers["X-Replanned"] = ",".join(parts) or "none"
+            return attach_nutrition(result)
+
         # Update the plan with the provided data
         if update_data.current_weight is not None:
             plan.current_weight = update_data.current_weight
@@ -139,22 +251,75 @@ async def update_user_plan(
             })
 
         # Create CoachResult object with updated data
-        result = CoachResult(
-            workout_plan=workout_plans,
-            diet_plan=diet_plans,
-            estimated_days_to_goal=plan.estimated_days_to_goal
-        )
+        result = complete_week(workout_plans, diet_plans, plan.estimated_days_to_goal)
 
-        return result
+        response.headers["X-Replanned"] = "none"
+        return attach_nutrition(result)
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=str(e))
     except Exception as e:
         # Log error and return HTTP 500
         print("Error in update_user_plan:", e)
         raise HTTPException(status_code=500, detail=f"Error updating plan: {str(e)}")
 
 
+def _owned_plan(db: Session, plan_id: int, user: User) -> UserPlan:
+    # The user's plan with its day rows, or 404
+    plan = (
+        db.query(UserPlan)
+        .options(selectinload(UserPlan.workout_plans), selectinload(UserPlan.diet_plans))
+        .filter(UserPlan.id == plan_id, UserPlan.user_id == user.id)
+        .first()
+    )
+    if not plan:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Plan not found")
+    return plan
+
+
+def _program_page(plan: UserPlan, page: int, page_size: int) -> ProgramPage:
+    base = complete_week(
+        [{"day": row.day, "activity": row.activity} for row in plan.workout_plans],
+        [{"day": row.day, "meals": row.meals} for row in plan.diet_plans],
+        plan.estimated_days_to_goal,
+    )
+    return progression.program_page(plan, base, page, page_size)
+
+
+@router.get("/my-plans/{plan_id}/program", response_model=ProgramPage)
+async def get_plan_program(
+    plan_id: int,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(progression.DEFAULT_PAGE_SIZE, ge=1, le=progression.MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    GET endpoint returning one page of weeks of a plan's multi-week program.
+    Weeks are computed from the plan's base week when requested.
+    """
+    return _program_page(_owned_plan(db, plan_id, current_user), page, page_size)
+
+
+@router.put("/my-plans/{plan_id}/program", response_model=ProgramPage)
+async def set_plan_program(
+    plan_id: int,
+    settings: ProgramSettings,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    PUT endpoint setting a plan's program length and progression rules.
+    Returns the first page of the program.
+    """
+    plan = _owned_plan(db, plan_id, current_user)
+    progression.save_settings(plan, settings)
+    db.commit()
+    return _program_page(plan, 1, progression.DEFAULT_PAGE_SIZE)
+
+
 @router.delete("/my-plans/{plan_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_user_plan(
     plan_id: int,
@@ -192,3 +357,75 @@ async def delete_user_plan(
         # Log error and return HTTP 500
         print("Error in delete_user_plan:", e)
         raise HTTPException(status_code=500, detail=f"Error deleting plan: {str(e)}")
+
+
+@router.get("/usage", response_model=UsageReport)
+async def get_usage(
+    days: int = 30,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    GET endpoint reporting the current user's AI token usage and estimated cost.
+    Aggregated by agent and model over the last ``days`` days.
+    """
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be positive")
+    since = datetime.now(timezone.utc) - timedelta(days=days)
+    usage = llm_usage.usage_report(db, current_user.id, since)
+    return UsageReport(
+        since=since,
+        total_tokens=sum(row["prompt_tokens"] + row["completion_tokens"] for row in usage),
+        total_cost_usd=round(sum(row["cost_usd"] for row in usage), 6),
+        daily_token_budget=llm_usage.LLM_USER_DAILY_TOKEN_BUDGET or None,
+        monthly_cost_budget_usd=llm_usage.LLM_USER_MONTHLY_COST_BUDGET_USD or None,
+        usage=usage
+    )
+
+
+@router.post("/weight-log", response_model=WeightLogResult, status_code=status.HTTP_201_CREATED)
+async def add_weight_entries(
+    batch: WeightLogBatch,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    POST endpoint adding one or more weigh-ins to the current user's weight log.
+    The latest plan's estimated days to goal is updated from the weight trend.
+    """
+    inserted = weight_log.add_entries(db, current_user.id, batch.entries)
+    trend = weight_log.trend(db, current_user.id, update_plan=True)
+    db.commit()
+    return WeightLogResult(inserted=inserted, trend=trend)
+
+
+@router.get("/weight-log", response_model=WeightLog)
+async def get_weight_log(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = Query("raw", pattern="^(raw|day|week)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    GET endpoint returning the current user's weight log between ``start`` and ``end``
+    (default: the last 90 days), raw or rolled up per day or week.
+    """
+    end = weight_log.as_utc(end) if end else datetime.now(timezone.utc)
+    start = weight_log.as_utc(start) if start else end - timedelta(days=90)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    points = weight_log.series(db, current_user.id, start, end, resolution)
+    return WeightLog(resolution=resolution, start=start, end=end, points=points)
+
+
+@router.get("/weight-log/trend", response_model=WeightTrend)
+async def get_weight_trend(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    GET endpoint returning the current user's weight trend and the projected days
+    to the latest plan's goal. Nothing is updated.
+    """
+    return weight_log.trend(db, current_user.id)
@@ -0,0 +1,288 @@
+"""
+export.py: Streaming bulk export of stored plans.
+
+Exports the ``user_plans``, ``workout_plans`` and ``diet_plans`` tables as NDJSON,
+CSV or Parquet without loading them into memory. Rows are read with a server-side
+cursor (``stream_results``/``yield_per``) in fixed-size batches and encoded batch by
+batch, so memory use stays flat regardless of table size.
+
+Parquet output requires the optional ``pyarrow`` package.
+
+Usage (all users, for analytics):
+    python -m app.diet_fit_app.export --table diet_plans --format parquet --output diet.parquet
+"""
+import csv
+import importlib.util
+import io
+import json
+import logging
+import sys
+import time
+from datetime import date, datetime
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, SmallInteger, select
+
+from app.db.models import UserPlan, WorkoutPlan, DietPlan
+
+# pyarrow is optional and slow to import, so it is only loaded for a Parquet export
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Columns exported for each table, in output order
+EXPORT_COLUMNS = {
+    "user_plans": [
+        UserPlan.id, UserPlan.user_id, UserPlan.current_weight, UserPlan.weight_goal,
+        UserPlan.workout_frequency, UserPlan.estimated_days_to_goal, UserPlan.model_tier, UserPlan.program,
+        UserPlan.weight_kg, UserPlan.target_weight_kg, UserPlan.sessions_per_week, UserPlan.goal_direction,
+        UserPlan.created_at,
+    ],
+    "workout_plans": [WorkoutPlan.id, WorkoutPlan.user_plan_id, UserPlan.user_id, WorkoutPlan.day, WorkoutPlan.activity],
+    "diet_plans": [DietPlan.id, DietPlan.user_plan_id, UserPlan.user_id, DietPlan.day, DietPlan.meals],
+}
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportStats:
+    """Row counter and timer used to report export throughput."""
+
+    def __init__(self):
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def build_export_query(table: str, user_id: int = None):
+    """
+    Build the SELECT statement for an export.
+
+    Args:
+        table: One of ``user_plans``, ``workout_plans`` or ``diet_plans``
+        user_id: Restrict the export to a single user's plans
+
+    Returns:
+        Select: Column-level select ordered by primary key
+    """
+    if table not in EXPORT_COLUMNS:
+        raise ValueError(f"Unknown export table: {table}")
+    columns = EXPORT_COLUMNS[table]
+    stmt = select(*columns)
+    if table == "workout_plans":
+        stmt = stmt.join(UserPlan, WorkoutPlan.user_plan_id == UserPlan.id)
+    elif table == "diet_plans":
+        stmt = stmt.join(UserPlan, DietPlan.user_plan_id == UserPlan.id)
+    if user_id is not None:
+        stmt = stmt.where(UserPlan.user_id == user_id)
+    return stmt.order_by(columns[0])
+
+
+def iter_batches(connection, table: str, user_id: int = None, batch_size: int = DEFAULT_BATCH_SIZE, stats: ExportStats = None):
+    """
+    Stream rows from the database in batches.
+
+    Columns are selected directly (not ORM entities), so no identity map grows
+    while iterating. On PostgreSQL ``stream_results`` uses a named server-side
+    cursor; on other backends rows are still fetched ``batch_size`` at a time.
+
+    Args:
+        connection: SQLAlchemy connection or session
+        table: Table to export
+        user_id: Optional user filter
+        batch_size: Rows fetched per round trip
+        stats: Optional stats object updated with the number of rows read
+
+    Yields:
+        tuple: (column names, list of row dictionaries)
+    """
+    stmt = build_export_query(table, user_id).execution_options(stream_results=True, yield_per=batch_size)
+    result = connection.execute(stmt)
+    names = list(result.keys())
+    for partition in result.partitions(batch_size):
+        rows = [dict(zip(names, row)) for row in partition]
+        if stats is not None:
+            stats.rows += len(rows)
+        yield names, rows
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_ndjson(batches, columns):
+    """Encode row batches as newline-delimited JSON (each row carries its column names)."""
+    for _, rows in batches:
+        yield "".join(json.dumps(row, default=_json_default) + "\n" for row in rows).encode()
+
+
+def encode_csv(batches, columns):
+    """Encode row batches as CSV with a single header line, written even for an empty export."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[column.name for column in columns])
+    writer.writeheader()
+    for _, rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the caller."""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema(columns):
+    """
+    Arrow schema of the export columns, from their SQL types.
+
+    Inferring it from the first batch would type a column that happens to be all
+    NULL there as ``null`` and fail on the first later value.
+    """
+    import pyarrow
+
+    fields = []
+    for column in columns:
+        if isinstance(column.type, SmallInteger):
+            arrow_type = pyarrow.int16()
+        elif isinstance(column.type, Integer):
+            arrow_type = pyarrow.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pyarrow.float64()
+        elif isinstance(column.type, Boolean):
+            arrow_type = pyarrow.bool_()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pyarrow.timestamp("us", tz="UTC" if column.type.timezone else None)
+        else:
+            arrow_type = pyarrow.string()
+        fields.append(pyarrow.field(column.name, arrow_type))
+    return pyarrow.schema(fields)
+
+
+def encode_parquet(batches, columns):
+    """Encode row batches as a Parquet file, one row group per batch."""
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+    import pyarrow
+    import pyarrow.parquet as pyarrow_parquet
+
+    sink = _ChunkSink()
+    schema = parquet_schema(columns)
+    # Opened before the first batch, so an empty export is still a valid file
+    writer = pyarrow_parquet.ParquetWriter(pyarrow.PythonFile(sink, mode="w"), schema)
+    for _, rows in batches:
+        writer.write_table(pyarrow.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {
+    "ndjson": encode_ndjson,
+    "csv": encode_csv,
+    "parquet": encode_parquet,
+}
+
+
+def stream_export(engine, table: str, fmt: str, user_id: int = None, batch_size: int = DEFAULT_BATCH_SIZE, stats: ExportStats = None):
+    """
+    Stream an encoded export using its own database connection.
+
+    The connection is held only while the generator is being consumed, which makes
+    it safe to use from a streaming HTTP response after the request session closed.
+
+    Args:
+        engine: SQLAlchemy engine to read from
+        table: Table to export
+        fmt: Output format (``ndjson``, ``csv`` or ``parquet``)
+        user_id: Optional user filter
+        batch_size: Rows per batch
+        stats: Optional stats object; created if not given
+
+    Yields:
+        bytes: Encoded output chunks
+    """
+    if fmt not in ENCODERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    stats = stats or ExportStats()
+    with engine.connect() as connection:
+        batches = iter_batches(connection, table, user_id, batch_size, stats)
+        for chunk in ENCODERS[fmt](batches, EXPORT_COLUMNS[table]):
+            if chunk:
+                yield chunk
+    logger.info(
+        "export table=%s format=%s rows=%d seconds=%.3f rows_per_sec=%.0f",
+        table, fmt, stats.rows, stats.elapsed, stats.rows_per_sec,
+    )
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stream plan tables to NDJSON, CSV or Parquet")
+    parser.add_argument("--table", choices=sorted(EXPORT_COLUMNS), default="user_plans")
+    parser.add_argument("--format", dest="fmt", choices=sorted(ENCODERS), default="ndjson")
+    parser.add_argument("--output", help="output file (defaults to stdout)")
+    parser.add_argument("--user-id", type=int, help="export a single user's plans")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    from app.db.database import engine
+
+    stats = ExportStats()
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in stream_export(engine, args.table, args.fmt, args.user_id, args.batch_size, stats):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    print(
+        f"Exported {stats.rows} rows in {stats.elapsed:.2f}s ({stats.rows_per_sec:.0f} rows/sec)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+fallback.py: Model fallback chains with circuit breakers for the plan agents.
+
+Each agent runs through an ordered chain of tiers, e.g. ``o3 -> gpt-4o -> local``
+for the coach. A request starts at the first tier whose circuit breaker lets it
+through; if that tier errors or exceeds its timeout it moves on to the next one.
+The ``local`` tier needs no provider: it builds a plain plan (or estimate) from
+the user's own input, so a plan request still succeeds during a provider outage.
+
+A tier's breaker watches its recent calls and trips (opens) when, over the last
+``CIRCUIT_WINDOW`` calls, the share of errors reaches ``CIRCUIT_ERROR_RATE`` or
+the share of calls slower than the tier's latency SLO reaches
+``CIRCUIT_SLOW_RATE``. An open tier is skipped for ``CIRCUIT_OPEN_SECONDS``;
+after that it is half-open and lets a single probe request through. A good probe
+closes the circuit, a bad one opens it again.
+
+Provider calls are bounded by the request deadline as well as the tier timeout,
+and may be hedged (see hedging.py). Once the deadline has passed only the
+``local`` tier is tried.
+
+Chains are configured per agent with comma-separated model names:
+``COACH_MODEL_CHAIN`` (default ``o3,gpt-4o,local``) and ``ESTIMATOR_MODEL_CHAIN``
+(default ``gpt-4o,gpt-4o-mini,local``).
+"""
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.core.metrics import REGISTRY
+from app.diet_fit_app.goals import parse_goal, sessions_per_week
+from app.diet_fit_app.hedging import HedgePolicy, hedged_call
+from app.diet_fit_app.models import CoachResult, UserInput, Weekday
+
+logger = logging.getLogger(__name__)
+
+LOCAL_TIER = "local"
+
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_ERROR_RATE = float(os.getenv("CIRCUIT_ERROR_RATE", "0.5"))
+CIRCUIT_SLOW_RATE = float(os.getenv("CIRCUIT_SLOW_RATE", "0.5"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+tier_served_counter = REGISTRY.counter("llm_tier_served_total", "Agent runs by the tier that served them", ["agent", "tier"])
+tier_failures_counter = REGISTRY.counter(
+    "llm_tier_failures_total", "Agent runs that failed on a tier and fell through", ["agent", "tier", "reason"]
+)
+circuit_state_gauge = REGISTRY.gauge(
+    "llm_circuit_state", "Circuit breaker state per tier (0 closed, 1 half-open, 2 open)", ["agent", "tier"]
+)
+circuit_transitions_counter = REGISTRY.counter(
+    "llm_circuit_transitions_total", "Circuit breaker state changes", ["agent", "tier", "state"]
+)
+
+
+class NoTierAvailable(RuntimeError):
+    """Every tier of a chain failed or was skipped by its breaker."""
+
+
+class CircuitBreaker:
+    """
+    Error-rate and latency circuit breaker for one tier.
+
+    Args:
+        agent: Agent label for metrics
+        tier: Tier label for metrics
+        latency_slo: Seconds above which a successful call counts as slow (None to ignore latency)
+        window: Number of recent calls considered
+        min_calls: Calls needed in the window before the breaker may trip
+        error_rate: Share of failed calls that trips the breaker
+        slow_rate: Share of slow calls that trips the breaker
+        open_seconds: How long the breaker stays open before a probe is allowed
+        clock: Monotonic clock (tests pass a fake one)
+    """
+
+    def __init__(self, agent: str, tier: str, latency_slo: float = None, window: int = CIRCUIT_WINDOW,
+                 min_calls: int = CIRCUIT_MIN_CALLS, error_rate: float = CIRCUIT_ERROR_RATE,
+                 slow_rate: float = CIRCUIT_SLOW_RATE, open_seconds: float = CIRCUIT_OPEN_SECONDS,
+                 clock=time.monotonic):
+        self.agent = agent
+        self.tier = tier
+        self.latency_slo = latency_slo
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.calls = deque(maxlen=window)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+        circuit_state_gauge.set(STATE_VALUES[CLOSED], agent=agent, tier=tier)
+
+    def _transition(self, state: str):
+        self.state = state
+        circuit_state_gauge.set(STATE_VALUES[state], agent=self.agent, tier=self.tier)
+        circuit_transitions_counter.inc(agent=self.agent, tier=self.tier, state=state)
+        if state == OPEN:
+            self.opened_at = self.clock()
+            logger.warning("Circuit for %s tier %s opened", self.agent, self.tier)
+        elif state == CLOSED:
+            self.calls.clear()
+
+    def allow(self) -> bool:
+        """Return True if a call may go to this tier; in half-open state only one probe at a time."""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency: float):
+        """Record the outcome of a call let through by ``allow()``."""
+        slow = ok and self.latency_slo is not None and latency > self.latency_slo
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probing = False
+                self._transition(CLOSED if ok and not slow else OPEN)
+                return
+            self.calls.append((ok, slow))
+            if self.state == CLOSED and len(self.calls) >= self.min_calls:
+                errors = sum(1 for call_ok, _ in self.calls if not call_ok)
+                slow_calls = sum(1 for _, call_slow in self.calls if call_slow)
+                if errors >= self.error_rate * len(self.calls) or slow_calls >= self.slow_rate * len(self.calls):
+                    self._transition(OPEN)
+
+    def release(self):
+        """Give back a half-open probe slot without an outcome (the call was cancelled)."""
+        with self._lock:
+            self.probing = False
+
+
+class Tier:
+    """
+    One step of a fallback chain: a provider model, or the local fallback.
+
+    Args:
+        agent: Agent label for metrics
+        name: Model name (e.g. ``o3``) or ``local``
+        timeout: Seconds before the call is abandoned and the next tier tried
+        latency_slo: Seconds above which a call counts as slow for the breaker
+    """
+
+    def __init__(self, agent: str, name: str, timeout: float, latency_slo: float):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(agent, name, latency_slo)
+        self.hedge = HedgePolicy(agent, name)
+        self._model = None
+
+    @property
+    def is_local(self) -> bool:
+        return self.name == LOCAL_TIER
+
+    def model(self):
+        """Return the pydantic_ai model for this tier, created on first use."""
+        if self._model is None:
+            from pydantic_ai.models import infer_model
+
+            self._model = infer_model(self.name)
+        return self._model
+
+
+class Served:
+    """Outcome of a chain run: the output, the tier that produced it and the agent run (None for local)."""
+
+    def __init__(self, tier: str, output, run=None, elapsed: float = 0.0):
+        self.tier = tier
+        self.output = output
+        self.run = run
+        self.elapsed = elapsed
+
+
+class FallbackChain:
+    """
+    Ordered tiers for one agent.
+
+    Args:
+        agent: Agent label (``coach`` or ``estimator``)
+        names: Tier names in order of preference
+        local: Function ``(deps, user_input) -> output`` used by the ``local`` tier
+        timeout: Per-tier timeout in seconds
+        latency_slo: Per-tier latency SLO in seconds
+    """
+
+    def __init__(self, agent: str, names, local, timeout: float, latency_slo: float):
+        self.agent = agent
+        self.local = local
+        self.tiers = [Tier(agent, name, timeout, latency_slo) for name in names]
+
+    async def run(self, agent, deps, user_input: UserInput, deadline: Deadline = None) -> Served:
+        """
+        Run ``agent`` with ``deps`` on the first healthy tier.
+
+        Raises:
+            DeadlineExceeded: If the deadline passed before any tier succeeded
+            NoTierAvailable: If every tier failed or was skipped
+        """
+        last_error = None
+        for tier in self.tiers:
+            timeout = tier.timeout if deadline is None else deadline.bound(tier.timeout)
+            if not tier.is_local and timeout <= 0:
+                continue
+            if not tier.breaker.allow():
+                continue
+            started = time.perf_counter()
+            try:
+                if tier.is_local:
+                    run, output = None, self.local(deps, user_input)
+                else:
+                    run = await hedged_call(lambda: agent.run(deps=deps, model=tier.model()), tier.hedge, timeout)
+                    output = run.output
+            except asyncio.CancelledError:
+                tier.breaker.release()
+                raise
+            except Exception as e:
+                elapsed = time.perf_counter() - started
+                reason = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                if reason == "timeout" and timeout < tier.timeout:
+                    # Cut short by the request deadline, not the tier's fault
+                    reason = "deadline"
+                    tier.breaker.release()
+                else:
+                    tier.breaker.record(False, elapsed)
+                tier_failures_counter.inc(agent=self.agent, tier=tier.name, reason=reason)
+                logger.warning("%s tier %s failed (%s): %s", self.agent, tier.name, reason, e)
+                last_error = e
+                continue
+            elapsed = time.perf_counter() - started
+            tier.breaker.record(True, elapsed)
+            tier_served_counter.inc(agent=self.agent, tier=tier.name)
+            return Served(tier.name, output, run, elapsed)
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded(f"The {self.agent} agent did not finish before the request deadline") from last_error
+        raise NoTierAvailable(f"No model available for the {self.agent} agent") from last_error
+
+    def status(self) -> list:
+        return [{"tier": tier.name, "state": tier.breaker.state} for tier in self.tiers]
+
+
+# Local fallbacks: plain plans built from the user's own input, no provider call
+
+LOCAL_ACTIVITIES = (
+    "30 minutes of brisk walking or jogging, then 15 minutes of core exercises",
+    "Full-body strength circuit: squats, push-ups, lunges and rows, 3 sets of 12",
+    "45 minutes of moderate cardio such as cycling, dancing or a brisk walk",
+)
+LOCAL_REST = "Rest day or light stretching"
+SAFE_LBS_PER_WEEK = 1.0
+
+_REST = re.compile(r"\brest\b", re.IGNORECASE)
+
+
+def _sessions_per_week(workout_frequency: str) -> int:
+    sessions = sessions_per_week(workout_frequency)
+    return max(1, sessions) if sessions is not None else 3
+
+
+def _options(text: str) -> list:
+    parts = [part.strip() for part in re.split(r",|\bor\b", text or "") if part.strip()]
+    return parts or [text]
+
+
+def local_coach_plan(deps: UserInput, user_input: UserInput) -> CoachResult:
+    """Build a generic 7-day plan that spreads the requested sessions and rotates the user's usual meals."""
+    days = list(Weekday)
+    sessions = _sessions_per_week(deps.workout_frequency)
+    workout_days = _spread(sessions)
+    breakfasts, lunches, dinners = _options(deps.typical_breakfast), _options(deps.typical_lunch), _options(deps.typical_dinner)
+    workout_plan, diet_plan = [], []
+    sessions_done = 0
+    for index, day in enumerate(days):
+        if index in workout_days:
+            activity = LOCAL_ACTIVITIES[sessions_done % len(LOCAL_ACTIVITIES)]
+            sessions_done += 1
+        else:
+            activity = LOCAL_REST
+        workout_plan.append({"day": day, "activity": activity})
+        diet_plan.append({"day": day, "meals": (
+            f"Breakfast: {breakfasts[index % len(breakfasts)]} (moderate portion)\n"
+            f"Lunch: {lunches[index % len(lunches)]} with extra vegetables\n"
+            f"Dinner: {dinners[index % len(dinners)]} (light portion)\n"
+            f"Snacks: Fruit or a small handful of nuts\n"
+            f"Restrictions: {deps.dietary_restrictions}"
+        )})
+    return CoachResult(workout_plan=workout_plan, diet_plan=diet_plan, estimated_days_to_goal=0)
+
+
+def _spread(sessions: int) -> set:
+    # Indexes of the training days when ``sessions`` are spread evenly over the week
+    return {round(i * 7 / sessions) for i in range(sessions)}
+
+
+def fit_sessions(result: CoachResult, sessions: int) -> CoachResult:
+    """
+    Return a copy of ``result`` with ``sessions`` training days spread over the week.
+
+    The plan's own workouts are reused in order (the generic ones if it has none);
+    all other days become rest days. A plan that already has ``sessions`` training
+    days is returned unchanged.
+    """
+    result = result.model_copy(deep=True)
+    activities = [entry.activity for entry in result.workout_plan if not _REST.search(entry.activity)]
+    if len(activities) == sessions:
+        return result
+    activities = activities or list(LOCAL_ACTIVITIES)
+    training_days = _spread(sessions)
+    done = 0
+    for index, entry in enumerate(result.workout_plan):
+        if index in training_days:
+            entry.activity = activities[done % len(activities)]
+            done += 1
+        else:
+            entry.activity = LOCAL_REST
+    return result
+
+
+def local_estimate(deps: CoachResult, user_input: UserInput) -> int:
+    """Estimate days to goal at a safe rate of ``SAFE_LBS_PER_WEEK``; 0 when the goal can't be read."""
+    _, pounds, _ = parse_goal(user_input.current_weight, user_input.weight_goal)
+    return math.ceil(pounds / SAFE_LBS_PER_WEEK * 7)
+
+
+def _chain_names(env: str, default: str) -> list:
+    return [name.strip() for name in os.getenv(env, default).split(",") if name.strip()]
+
+
+coach_chain = FallbackChain(
+    "coach", _chain_names("COACH_MODEL_CHAIN", "o3,gpt-4o,local"), local_coach_plan,
+    timeout=float(os.getenv("COACH_TIER_TIMEOUT_SECONDS", "120")),
+    latency_slo=float(os.getenv("COACH_LATENCY_SLO_SECONDS", "60")),
+)
+estimator_chain = FallbackChain(
+    "estimator", _chain_names("ESTIMATOR_MODEL_CHAIN", "gpt-4o,gpt-4o-mini,local"), local_estimate,
+    timeout=float(os.getenv("ESTIMATOR_TIER_TIMEOUT_SECONDS", "30")),
+    latency_slo=float(os.getenv("ESTIMATOR_LATENCY_SLO_SECONDS", "15")),
+)
@@ -0,0 +1,125 @@
+"""
+goals.py: Parsing of the free-text weight, goal and frequency fields.
+
+Plans store what the user typed ("190 lbs", "Lose 15 lbs (target: 175 lbs)",
+"Workout 3 times per week"). This module reads those strings once and derives
+canonical numeric values, which are kept in indexed ``user_plans`` columns so
+range filters and aggregates run in SQL:
+
+- ``weight_kg``: the current weight;
+- ``target_weight_kg``: the explicit target, or the current weight moved by the
+  stated change;
+- ``sessions_per_week``: workouts per week, 0-7;
+- ``goal_direction``: -1 (lose), 0 (maintain) or 1 (gain).
+
+Weights without a unit are taken in the unit of the current weight, and pounds
+when that has none either. Values that can't be read are None.
+The local estimate, the template features and the weight trend use the same
+parser, so all of them read a goal the same way.
+"""
+import re
+from typing import Optional
+
+KG_TO_LBS = 2.20462
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+# Units may follow the number directly ("80kg")
+_KG = re.compile(r"(?<![a-z])kgs?\b|kilo", re.IGNORECASE)
+_LBS = re.compile(r"(?<![a-z])lbs?\b|pound", re.IGNORECASE)
+# "target: 175 lbs", "target weight 80kg", "to reach 175", "down to 80 kg"
+_TARGET = re.compile(r"\b(?:target|goal weight|reach|(?:down|up) to)\D{0,12}?(\d+(?:\.\d+)?)", re.IGNORECASE)
+_LOSE = re.compile(r"\b(lose|loss|cut|drop|slim)", re.IGNORECASE)
+_GAIN = re.compile(r"\b(gain|bulk|build|increase)", re.IGNORECASE)
+_MAINTAIN = re.compile(r"\b(maintain|keep|stay)", re.IGNORECASE)
+_DAILY = re.compile(r"\b(daily|every ?day)\b", re.IGNORECASE)
+_TIMES = {"once": 1, "twice": 2}
+
+GOAL_COLUMNS = ("weight_kg", "target_weight_kg", "sessions_per_week", "goal_direction")
+
+
+def _in_kg(text: str) -> Optional[bool]:
+    if _KG.search(text):
+        return True
+    if _LBS.search(text):
+        return False
+    return None
+
+
+def pounds(text: str, value: float, default_kg: bool = False) -> float:
+    """``value`` in pounds, converted from kilograms if ``text`` (or the default) says kg."""
+    in_kg = _in_kg(text or "")
+    return value * KG_TO_LBS if (default_kg if in_kg is None else in_kg) else value
+
+
+def current_pounds(current_weight: str) -> Optional[float]:
+    """The current weight in pounds, or None."""
+    match = _NUMBER.search(current_weight or "")
+    return pounds(current_weight, float(match.group())) if match else None
+
+
+def parse_goal(current_weight: str, weight_goal: str):
+    """
+    Read the goal of the free-text weight fields.
+
+    Returns:
+        tuple: (direction, change in pounds, target in pounds or None), direction
+        being -1 (lose), 0 (maintain) or 1 (gain)
+    """
+    goal = weight_goal or ""
+    if not goal.strip():
+        return 0, 0.0, None
+    current = current_pounds(current_weight)
+    default_kg = bool(_in_kg(current_weight or ""))
+    target_match = _TARGET.search(goal)
+    target = pounds(goal, float(target_match.group(1)), default_kg) if target_match else None
+    # The first number that is not the target is the stated change ("Lose 15 lbs")
+    change_match = next(
+        (m for m in _NUMBER.finditer(goal) if not target_match or m.start() != target_match.start(1)), None
+    )
+    change = 0.0
+    if current is not None and target is not None:
+        change = target - current
+    elif change_match:
+        change = pounds(goal, float(change_match.group()), default_kg)
+
+    if _LOSE.search(goal):
+        direction = -1
+    elif _GAIN.search(goal):
+        direction = 1
+    elif _MAINTAIN.search(goal):
+        direction = 0
+    else:
+        direction = (change > 0) - (change < 0) if current is not None and target is not None else 0
+
+    if target is None and current is not None:
+        if direction and change:
+            target = current + direction * abs(change)
+        elif _MAINTAIN.search(goal):
+            target = current
+    return direction, abs(change), target
+
+
+def sessions_per_week(workout_frequency: str) -> Optional[int]:
+    """Workouts per week (0-7) from the frequency text, or None."""
+    text = workout_frequency or ""
+    if _DAILY.search(text):
+        return 7
+    match = _NUMBER.search(text)
+    if match:
+        return min(7, max(0, round(float(match.group()))))
+    for word, times in _TIMES.items():
+        if re.search(rf"\b{word}\b", text, re.IGNORECASE):
+            return times
+    return None
+
+
+def goal_columns(current_weight: str, weight_goal: str, workout_frequency: str) -> dict:
+    """The canonical numeric ``user_plans`` columns for the free-text fields."""
+    current = current_pounds(current_weight)
+    direction, _, target = parse_goal(current_weight, weight_goal)
+    return {
+        "weight_kg": round(current / KG_TO_LBS, 2) if current is not None else None,
+        "target_weight_kg": round(target / KG_TO_LBS, 2) if target is not None else None,
+        "sessions_per_week": sessions_per_week(workout_frequency),
+        "goal_direction": direction if (weight_goal or "").strip() else None,
+    }
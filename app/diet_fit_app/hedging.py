@@ -0,0 +1,182 @@
+"""
+hedging.py: Hedged agent calls to cut the LLM latency tail.
+
+Most completions return in a predictable time, but a few take several times
+longer and dominate p99. With hedging enabled (``HEDGE_ENABLED=1``), a call that
+is still running after the ``HEDGE_PERCENTILE`` latency of its tier gets a
+duplicate request; whichever returns first wins and the other is cancelled.
+
+Duplicates cost provider capacity, so they are rationed by a shared budget: every
+primary call earns ``HEDGE_BUDGET_RATIO`` (default 0.05) of a hedge, so at most
+about 5% extra calls are made however slow the provider gets. Hedging for a tier
+starts once ``HEDGE_MIN_SAMPLES`` latencies have been observed.
+"""
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from app.core.metrics import REGISTRY
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# Latencies kept per tier for the percentile, and the most hedges that can be saved up
+HEDGE_SAMPLE_WINDOW = 200
+HEDGE_MAX_BALANCE = 10.0
+
+hedges_counter = REGISTRY.counter("llm_hedges_total", "Duplicate agent calls fired after the hedge delay", ["agent", "tier"])
+hedge_wins_counter = REGISTRY.counter(
+    "llm_hedge_wins_total", "Hedged calls where the duplicate returned first", ["agent", "tier"]
+)
+hedge_rate_gauge = REGISTRY.gauge("llm_hedge_rate", "Hedges fired per primary agent call", ["agent", "tier"])
+hedge_win_rate_gauge = REGISTRY.gauge(
+    "llm_hedge_win_rate", "Share of hedges that beat the primary call", ["agent", "tier"]
+)
+
+
+class HedgeBudget:
+    """
+    Global allowance of duplicate calls.
+
+    Args:
+        ratio: Hedges earned per primary call
+        max_balance: Cap on saved-up hedges, so a quiet period cannot fund a burst
+    """
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, max_balance: float = HEDGE_MAX_BALANCE):
+        self.ratio = ratio
+        self.max_balance = max_balance
+        self.balance = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.balance = min(self.max_balance, self.balance + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.balance >= 1:
+                self.balance -= 1
+                return True
+            return False
+
+
+hedge_budget = HedgeBudget()
+
+
+class HedgePolicy:
+    """
+    Latency history and hedge statistics for one tier.
+
+    Args:
+        agent: Agent label for metrics
+        tier: Tier label for metrics
+        enabled: Fire hedges at all
+        percentile: Latency percentile used as the hedge delay
+        min_samples: Latencies needed before hedging starts
+        budget: Shared hedge budget
+    """
+
+    def __init__(self, agent: str, tier: str, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 min_samples: int = HEDGE_MIN_SAMPLES, budget: HedgeBudget = hedge_budget):
+        self.agent = agent
+        self.tier = tier
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = budget
+        self.latencies = deque(maxlen=HEDGE_SAMPLE_WINDOW)
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while there is too little history."""
+        if not self.enabled or len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(self.percentile / 100 * len(ordered)) - 1)]
+
+    def observe(self, latency: float):
+        self.latencies.append(latency)
+
+    def _update_rates(self):
+        hedge_rate_gauge.set(self.hedges / self.calls if self.calls else 0.0, agent=self.agent, tier=self.tier)
+        hedge_win_rate_gauge.set(self.wins / self.hedges if self.hedges else 0.0, agent=self.agent, tier=self.tier)
+
+    def started(self):
+        self.calls += 1
+        self.budget.deposit()
+        self._update_rates()
+
+    def hedged(self):
+        self.hedges += 1
+        hedges_counter.inc(agent=self.agent, tier=self.tier)
+        self._update_rates()
+
+    def won(self):
+        self.wins += 1
+        hedge_wins_counter.inc(agent=self.agent, tier=self.tier)
+        self._update_rates()
+
+
+async def _timed(make_call):
+    started = time.perf_counter()
+    result = await make_call()
+    return result, time.perf_counter() - started
+
+
+async def _race(make_call, policy: HedgePolicy):
+    started = time.perf_counter()
+    primary = asyncio.ensure_future(_timed(make_call))
+    pending = {primary}
+    try:
+        delay = policy.delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and policy.budget.try_spend():
+                pending.add(asyncio.ensure_future(_timed(make_call)))
+                policy.hedged()
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    # Keep waiting for the other call, if there is one
+                    error = task.exception()
+                    continue
+                result, latency = task.result()
+                policy.observe(latency)
+                if task is not primary:
+                    policy.won()
+                return result
+        raise error
+    finally:
+        if not primary.done():
+            # Beaten by the hedge or out of time: record the primary as taking at least
+            # this long, or the percentile (and the hedge delay) would drift low
+            policy.observe(time.perf_counter() - started)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def hedged_call(make_call, policy: HedgePolicy, timeout: float):
+    """
+    Run ``make_call()`` within ``timeout`` seconds, hedging it if it is slow.
+
+    Args:
+        make_call: Zero-argument coroutine function making the agent call
+        policy: Hedge policy of the tier being called
+        timeout: Seconds before the call (and any hedge) is abandoned
+
+    Raises:
+        asyncio.TimeoutError: If no call returned in time
+    """
+    policy.started()
+    return await asyncio.wait_for(_race(make_call, policy), timeout)
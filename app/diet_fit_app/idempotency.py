@@ -0,0 +1,249 @@
+"""
+idempotency.py: Idempotency-Key support for plan generation.
+
+Mobile clients retry POST /api/fitness-plan on network blips. Without protection
+every retry costs two more LLM calls and stores a duplicate plan. A request that
+carries an ``Idempotency-Key`` header claims a row in ``idempotency_keys``
+(unique per user and key) before generating:
+
+- a repeat with the same key and body inside the TTL replays the stored response;
+- a repeat that arrives while the original is still generating waits for it;
+- a repeat with the same key but a different body is rejected with 422.
+
+If the original generation fails its claim is released, so a later retry runs again.
+A claim is also a lease of ``IDEMPOTENCY_LEASE_SECONDS``: if the worker holding
+it crashed, the row stays ``in_progress``, and the next request with the same
+key and body takes the claim over once the lease has expired.
+"""
+import asyncio
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.metrics import REGISTRY
+from app.db.models import IdempotencyKey
+from app.diet_fit_app.models import UserInput, CoachResult
+
+# How long a completed response can be replayed
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+# How long a duplicate waits for an in-flight original before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "120"))
+# How long an in-progress claim is held before another request may take it over;
+# longer than any generation can run (LLM_REQUEST_DEADLINE_SECONDS)
+IDEMPOTENCY_LEASE_SECONDS = float(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "300"))
+# Database poll interval while waiting on an original running in another worker
+IDEMPOTENCY_POLL_SECONDS = 0.25
+
+MAX_KEY_LENGTH = 255
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+cache_counter = REGISTRY.counter("cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+
+# Generations in flight in this process, so local waiters wake up immediately
+_inflight = {}
+
+
+def request_fingerprint(payload: UserInput) -> str:
+    """Return a stable SHA-256 fingerprint of the request body."""
+    return hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+
+
+def _utc(value: datetime) -> datetime:
+    # SQLite returns naive datetimes; they are stored in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _is_expired(row: IdempotencyKey) -> bool:
+    if row.expires_at is None:
+        return False
+    return _utc(row.expires_at) <= datetime.now(timezone.utc)
+
+
+def _lease_expired(row: IdempotencyKey) -> bool:
+    # Claims from before leases existed have no claimed_at and count as expired
+    if row.status != IN_PROGRESS:
+        return False
+    if row.claimed_at is None:
+        return True
+    return _utc(row.claimed_at) + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS) <= datetime.now(timezone.utc)
+
+
+def _take_over(db: Session, row: IdempotencyKey) -> bool:
+    """Take over an in-progress claim whose lease expired; False if another request got it first."""
+    now = datetime.now(timezone.utc)
+    taken = db.query(IdempotencyKey).filter(
+        IdempotencyKey.id == row.id,
+        IdempotencyKey.status == IN_PROGRESS,
+        IdempotencyKey.claimed_at.is_(None) if row.claimed_at is None else IdempotencyKey.claimed_at == row.claimed_at,
+    ).update({IdempotencyKey.claimed_at: now}, synchronize_session=False)
+    db.commit()
+    if taken:
+        db.refresh(row)
+    return bool(taken)
+
+
+def _find(db: Session, user_id: int, key: str):
+    return db.query(IdempotencyKey).filter(
+        IdempotencyKey.user_id == user_id,
+        IdempotencyKey.key == key
+    ).first()
+
+
+def _claim(db: Session, user_id: int, key: str, request_hash: str):
+    """
+    Try to claim the key for this request.
+
+    Returns:
+        tuple: (row, claimed) where ``claimed`` is True if this request owns the key
+    """
+    now = datetime.now(timezone.utc)
+    row = IdempotencyKey(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        status=IN_PROGRESS,
+        claimed_at=now,
+        expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    )
+    db.add(row)
+    try:
+        db.commit()
+        return row, True
+    except IntegrityError:
+        db.rollback()
+
+    existing = _find(db, user_id, key)
+    if existing is not None and _is_expired(existing):
+        # Stale key: drop it and let the caller claim it afresh
+        db.delete(existing)
+        db.commit()
+        return None, False
+    if existing is not None and existing.request_hash == request_hash and _lease_expired(existing):
+        # The worker holding the claim is gone; run this request in its place
+        if _take_over(db, existing):
+            return existing, True
+        return None, False
+    return existing, False
+
+
+def _owned(row_id: int, claimed_at: datetime):
+    # Only the current holder of a claim may complete or release it
+    return IdempotencyKey.id == row_id, IdempotencyKey.claimed_at == claimed_at
+
+
+def _release(db: Session, row_id: int, claimed_at: datetime):
+    db.rollback()
+    # "fetch" also evicts the stale row from the identity map, so a re-claim reusing its id starts clean
+    db.query(IdempotencyKey).filter(*_owned(row_id, claimed_at)).delete(synchronize_session="fetch")
+    db.commit()
+
+
+async def _wait_for_completion(db: Session, user_id: int, key: str):
+    """
+    Wait for an in-flight original request to finish.
+
+    Returns:
+        IdempotencyKey: The completed row, or None if the original failed and released
+        the key or its lease expired (the caller then claims the key again)
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still being processed"
+            )
+        event = _inflight.get((user_id, key))
+        timeout = min(IDEMPOTENCY_POLL_SECONDS, remaining)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(timeout)
+
+        db.expire_all()
+        row = _find(db, user_id, key)
+        if row is None or row.status == COMPLETED:
+            return row
+        if _lease_expired(row):
+            return None
+
+
+async def run_idempotent(db: Session, user_id: int, key: str, payload: UserInput, produce):
+    """
+    Run ``produce`` at most once per (user, Idempotency-Key).
+
+    Args:
+        db: Database session
+        user_id: Current user's id
+        key: Idempotency-Key header value
+        payload: Request body, fingerprinted to detect key reuse
+        produce: Zero-argument coroutine function generating the CoachResult
+
+    Returns:
+        tuple: (CoachResult, replayed) where ``replayed`` is True if a stored response was returned
+
+    Raises:
+        HTTPException: 400 for an invalid key, 422 if the key was used with a different body,
+            409 if the original request is still running after the wait timeout
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+
+    request_hash = request_fingerprint(payload)
+    while True:
+        row, claimed = _claim(db, user_id, key, request_hash)
+        if claimed:
+            break
+        if row is None:
+            continue
+        if row.request_hash != request_hash:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+        if row.status != COMPLETED:
+            row = await _wait_for_completion(db, user_id, key)
+            if row is None:
+                # The original failed and released the key, or its lease expired; run this request instead
+                continue
+        cache_counter.inc(cache="idempotency", result="hit")
+        return CoachResult.model_validate_json(row.response_body), True
+
+    cache_counter.inc(cache="idempotency", result="miss")
+    row_id, claimed_at = row.id, row.claimed_at
+    event = asyncio.Event()
+    _inflight[(user_id, key)] = event
+    try:
+        result = await produce()
+        db.query(IdempotencyKey).filter(*_owned(row_id, claimed_at)).update({
+            IdempotencyKey.status: COMPLETED,
+            IdempotencyKey.response_body: result.model_dump_json(),
+        })
+        db.commit()
+        return result, False
+    except BaseException:
+        _release(db, row_id, claimed_at)
+        raise
+    finally:
+        _inflight.pop((user_id, key), None)
+        event.set()
+
+
+def purge_expired(db: Session) -> int:
+    """Delete expired keys and return how many were removed."""
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at <= datetime.now(timezone.utc)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
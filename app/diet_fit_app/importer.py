@@ -0,0 +1,353 @@
+"""
+importer.py: Bulk import of historical plans from JSONL.
+
+Each input line is one JSON object holding a user id, the ``UserInput`` that
+produced the plan and the resulting ``CoachResult``:
+
+    {"user_id": 1, "input": {...UserInput...}, "result": {...CoachResult...}, "created_at": "2024-01-31T08:00:00Z"}
+
+The file is streamed in chunks. Each chunk is validated, its user ids are checked
+against ``users`` in one query, and it is written in a single transaction:
+through ``COPY`` on PostgreSQL, or ``executemany`` elsewhere. Records that fail
+either check go to the rejects file. After every commit the byte offset reached
+is saved to a checkpoint file, so an interrupted import resumes from the last
+committed chunk instead of starting over.
+
+Before each commit the checkpoint also records the chunk as pending, with the
+id of its first plan. If the process dies between the commit and the final
+checkpoint write, the resume looks that plan up to tell whether the chunk was
+committed, so it is neither lost nor imported twice.
+
+Rejects are written before the chunk's commit, tagged with the chunk's starting
+offset. With a checkpoint, an import first drops the rejects of chunks at or
+after its starting offset, since those chunks are read again, so every reject
+is recorded exactly once.
+
+Usage:
+    python -m app.diet_fit_app.importer plans.jsonl --checkpoint plans.ckpt --rejects rejects.jsonl
+"""
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, text
+
+from app.db.models import User, UserPlan, WorkoutPlan as DBWorkoutPlan, DietPlan as DBDietPlan
+from app.diet_fit_app.goals import GOAL_COLUMNS, goal_columns
+from app.diet_fit_app.models import UserInput, CoachResult
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+class ImportRecord(BaseModel):
+    # One historical plan as stored in the JSONL import format
+    user_id: int
+    input: UserInput
+    result: CoachResult
+    created_at: Optional[datetime] = None
+
+
+class ImportStats:
+    """Counters and timer for progress and throughput reporting."""
+
+    def __init__(self, lines: int = 0, imported: int = 0, rejected: int = 0):
+        self.lines = lines
+        self.imported = imported
+        self.rejected = rejected
+        self.started = time.perf_counter()
+        self.session_imported = 0
+
+    @property
+    def rows_per_sec(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.session_imported / elapsed if elapsed > 0 else 0.0
+
+
+def load_checkpoint(path: str) -> dict:
+    """Return the saved checkpoint, or an empty checkpoint if none exists."""
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"offset": 0, "lines": 0, "imported": 0, "rejected": 0}
+
+
+def resolve_pending(connection, checkpoint: dict) -> dict:
+    """
+    Settle a chunk left pending by a crash between its commit and the checkpoint write.
+
+    The chunk was committed if its first plan exists: resume after it, otherwise
+    from the offset before it.
+    """
+    pending = checkpoint.pop("pending", None)
+    if pending is None:
+        return checkpoint
+    committed = connection.execute(
+        select(UserPlan.id).where(UserPlan.id == pending["plan_id"], UserPlan.user_id == pending["user_id"])
+    ).first()
+    return {key: value for key, value in pending.items() if key in checkpoint} if committed else checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    """Atomically write the checkpoint so a crash never leaves it half written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def write_rejects(rejects_file, rejects, chunk_offset: int):
+    """Append the rejects of the chunk starting at ``chunk_offset`` and flush them."""
+    for line, error in rejects:
+        rejects_file.write(json.dumps({
+            "line": line.decode(errors="replace").rstrip("\n"), "error": error, "chunk": chunk_offset,
+        }) + "\n")
+    rejects_file.flush()
+
+
+def trim_rejects(path: str, offset: int):
+    """Drop the rejects of chunks starting at or after ``offset``, which a resume reads again."""
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        kept = [line for line in f if json.loads(line).get("chunk", 0) < offset]
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(kept)
+    os.replace(tmp_path, path)
+
+
+def read_chunks(path: str, offset: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Stream a JSONL file in chunks of non-empty lines.
+
+    Args:
+        path: JSONL file to read
+        offset: Byte offset to start from (from a checkpoint)
+        chunk_size: Lines per chunk
+
+    Yields:
+        tuple: (list of raw lines, byte offset just after the chunk)
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = []
+        for line in iter(f.readline, b""):
+            if line.strip():
+                chunk.append(line)
+            if len(chunk) >= chunk_size:
+                yield chunk, f.tell()
+                chunk = []
+        if chunk:
+            yield chunk, f.tell()
+
+
+def validate_chunk(lines):
+    """
+    Validate a chunk of raw JSONL lines.
+
+    Returns:
+        tuple: (list of (line, valid ImportRecord), list of (line, error message) rejects)
+    """
+    records, rejects = [], []
+    for line in lines:
+        try:
+            records.append((line, ImportRecord.model_validate_json(line)))
+        except ValidationError as e:
+            rejects.append((line, str(e)))
+    return records, rejects
+
+
+def _plan_row(record: ImportRecord, now: datetime) -> dict:
+    return {
+        "user_id": record.user_id,
+        "current_weight": record.input.current_weight,
+        "weight_goal": record.input.weight_goal,
+        "workout_frequency": record.input.workout_frequency,
+        "estimated_days_to_goal": record.result.estimated_days_to_goal,
+        "created_at": record.created_at or now,
+        # Core inserts bypass the ORM hook that derives these
+        **goal_columns(record.input.current_weight, record.input.weight_goal, record.input.workout_frequency),
+    }
+
+
+def _child_rows(records, plan_ids):
+    workouts, diets = [], []
+    for record, plan_id in zip(records, plan_ids):
+        for workout in record.result.workout_plan:
+            workouts.append({"user_plan_id": plan_id, "day": workout.day.value, "activity": workout.activity})
+        for diet in record.result.diet_plan:
+            diets.append({"user_plan_id": plan_id, "day": diet.day.value, "meals": diet.meals})
+    return workouts, diets
+
+
+def split_unknown_users(connection, records):
+    """
+    Check the user ids of a validated chunk in one query.
+
+    Returns:
+        tuple: (ImportRecords of existing users, list of (line, error message) rejects)
+    """
+    user_ids = {record.user_id for _, record in records}
+    known = set(connection.execute(select(User.id).where(User.id.in_(user_ids))).scalars())
+    valid = [record for _, record in records if record.user_id in known]
+    rejects = [(line, f"unknown user_id {record.user_id}") for line, record in records if record.user_id not in known]
+    return valid, rejects
+
+
+def insert_chunk_executemany(connection, records):
+    """Insert a chunk with executemany (SQLite and other non-PostgreSQL backends)."""
+    now = datetime.now(timezone.utc)
+    plan_rows = [_plan_row(record, now) for record in records]
+    result = connection.execute(
+        insert(UserPlan).returning(UserPlan.id, sort_by_parameter_order=True),
+        plan_rows
+    )
+    plan_ids = [row.id for row in result]
+    workouts, diets = _child_rows(records, plan_ids)
+    if workouts:
+        connection.execute(insert(DBWorkoutPlan), workouts)
+    if diets:
+        connection.execute(insert(DBDietPlan), diets)
+    return plan_ids
+
+
+def _copy(cursor, table: str, columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def insert_chunk_copy(connection, records):
+    """Insert a chunk through PostgreSQL COPY, pre-allocating plan ids from the sequence."""
+    now = datetime.now(timezone.utc)
+    plan_ids = connection.execute(
+        text("SELECT nextval(pg_get_serial_sequence('user_plans', 'id')) FROM generate_series(1, :n)"),
+        {"n": len(records)}
+    ).scalars().all()
+    plan_rows = []
+    for record, plan_id in zip(records, plan_ids):
+        row = _plan_row(record, now)
+        row["id"] = plan_id
+        row["created_at"] = row["created_at"].isoformat()
+        plan_rows.append(row)
+    workouts, diets = _child_rows(records, plan_ids)
+
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        _copy(cursor, "user_plans", ["id", "user_id", "current_weight", "weight_goal", "workout_frequency",
+                                     "estimated_days_to_goal", "created_at", *GOAL_COLUMNS], plan_rows)
+        _copy(cursor, "workout_plans", ["user_plan_id", "day", "activity"], workouts)
+        _copy(cursor, "diet_plans", ["user_plan_id", "day", "meals"], diets)
+    finally:
+        cursor.close()
+    return plan_ids
+
+
+def import_plans(engine, path: str, chunk_size: int = DEFAULT_CHUNK_SIZE, checkpoint_path: str = None,
+                 rejects_path: str = None, progress=None) -> ImportStats:
+    """
+    Import a JSONL file of historical plans.
+
+    Args:
+        engine: SQLAlchemy engine to write to
+        path: JSONL input file
+        chunk_size: Records validated and committed per transaction
+        checkpoint_path: Optional checkpoint file used to resume an interrupted import
+        rejects_path: Optional JSONL file receiving records that failed validation or name an unknown user,
+            each tagged with the byte offset of its chunk; kept in step with the checkpoint if there is one
+        progress: Optional callable receiving the ImportStats after every chunk
+
+    Returns:
+        ImportStats: Totals for the whole import, including previous resumed runs
+    """
+    checkpoint = load_checkpoint(checkpoint_path)
+    if "pending" in checkpoint:
+        with engine.connect() as connection:
+            checkpoint = resolve_pending(connection, checkpoint)
+    if checkpoint_path and rejects_path:
+        # The rejects file follows the checkpoint, also when a crash came before its first write
+        trim_rejects(rejects_path, checkpoint["offset"])
+    stats = ImportStats(checkpoint["lines"], checkpoint["imported"], checkpoint["rejected"])
+    insert_chunk = insert_chunk_copy if engine.dialect.name == "postgresql" else insert_chunk_executemany
+
+    rejects_file = open(rejects_path, "a") if rejects_path else None
+    try:
+        for lines, end_offset in read_chunks(path, checkpoint["offset"], chunk_size):
+            records, rejects = validate_chunk(lines)
+            committed = {"offset": checkpoint["offset"], "lines": stats.lines, "imported": stats.imported,
+                         "rejected": stats.rejected}
+            if records:
+                with engine.begin() as connection:
+                    records, unknown = split_unknown_users(connection, records)
+                    rejects += unknown
+                    plan_ids = insert_chunk(connection, records) if records else []
+                    if rejects_file:
+                        # Before the commit; a resume from this chunk trims them again
+                        write_rejects(rejects_file, rejects, committed["offset"])
+                    if checkpoint_path and plan_ids:
+                        # Written before the commit, settled by resolve_pending() after a crash
+                        save_checkpoint(checkpoint_path, {**committed, "pending": {
+                            "offset": end_offset,
+                            "lines": stats.lines + len(lines),
+                            "imported": stats.imported + len(records),
+                            "rejected": stats.rejected + len(rejects),
+                            "plan_id": plan_ids[0],
+                            "user_id": records[0].user_id,
+                        }})
+            elif rejects_file:
+                write_rejects(rejects_file, rejects, committed["offset"])
+
+            stats.lines += len(lines)
+            stats.imported += len(records)
+            stats.session_imported += len(records)
+            stats.rejected += len(rejects)
+            checkpoint = {
+                "offset": end_offset,
+                "lines": stats.lines,
+                "imported": stats.imported,
+                "rejected": stats.rejected,
+            }
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, checkpoint)
+            if progress:
+                progress(stats)
+    finally:
+        if rejects_file:
+            rejects_file.close()
+    return stats
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk import historical plans from JSONL")
+    parser.add_argument("path", help="JSONL file of {user_id, input, result} records")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="records per transaction")
+    parser.add_argument("--checkpoint", help="checkpoint file; an existing checkpoint is resumed")
+    parser.add_argument("--rejects", help="file receiving records that fail validation or name an unknown user")
+    args = parser.parse_args()
+
+    from app.db.database import engine
+
+    def report(stats: ImportStats):
+        print(
+            f"lines={stats.lines} imported={stats.imported} rejected={stats.rejected} "
+            f"rate={stats.rows_per_sec:.0f} plans/sec",
+            file=sys.stderr,
+        )
+
+    stats = import_plans(engine, args.path, args.chunk_size, args.checkpoint, args.rejects, progress=report)
+    print(f"Import finished: {stats.imported} plans imported, {stats.rejected} rejected", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
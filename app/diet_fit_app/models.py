@@ -1,7 +1,8 @@
 """
 models.py: Defines Pydantic models for request input (UserInput) and response output (WorkoutPlan, DietPlan, CoachResult).
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 from enum import Enum
 
@@ -62,11 +63,46 @@ class DietPlan(BaseModel):
     meals: str = Field(..., example="Breakfast: Avocado toast. Lunch: Couscous with grilled fish. Dinner: Plantain with beans.")
 
 
+class MealNutrition(BaseModel):
+    # Estimated nutrients of one meal of a diet day
+    meal: str = Field(..., example="lunch")
+    items: List[str] = Field(..., example=["jollof rice", "chicken"])
+    calories: float = Field(..., example=730.0)
+    protein_g: float = Field(..., example=48.0)
+    carbs_g: float = Field(..., example=80.0)
+    fat_g: float = Field(..., example=23.0)
+
+
+class DayNutrition(BaseModel):
+    # Estimated nutrients of one diet day, computed locally from the meal text
+    day: Weekday
+    calories: float = Field(..., example=1850.0)
+    protein_g: float = Field(..., example=95.0)
+    carbs_g: float = Field(..., example=240.0)
+    fat_g: float = Field(..., example=55.0)
+    meals: List[MealNutrition]
+
+
 class CoachResult(BaseModel):
     # Composite result including the generated workout and diet plans plus progress estimate
     workout_plan: List[WorkoutPlan] = Field(..., description="7-day custom workout schedule")
     diet_plan: List[DietPlan] = Field(..., description="7-day culturally sensitive diet plan")
     estimated_days_to_goal: int = Field(..., example=45, description="Projected days to reach target weight")
+    nutrition: Optional[List[DayNutrition]] = Field(
+        None, description="Estimated calories and macros per diet day, computed locally"
+    )
+
+    @field_validator("workout_plan", "diet_plan")
+    @classmethod
+    def cover_each_weekday_once(cls, days):
+        # Every weekday exactly once, returned in Monday..Sunday order
+        seen = [entry.day for entry in days]
+        missing = [day.value for day in Weekday if day not in seen]
+        repeated = sorted({day.value for day in seen if seen.count(day) > 1})
+        if missing or repeated:
+            raise ValueError(f"plan must cover each weekday once (missing: {missing}, repeated: {repeated})")
+        order = list(Weekday)
+        return sorted(days, key=lambda entry: order.index(entry.day))
 
 
 class UserPlanUpdate(BaseModel):
@@ -83,3 +119,122 @@ class UserPlanUpdate(BaseModel):
                 "workout_frequency": "Workout 3 times per week"
             }
         }
+
+
+class ProgramSettings(BaseModel):
+    # Parameters expanding a plan's base week into a multi-week program
+    weeks: int = Field(4, ge=1, le=12, description="Program length in weeks")
+    overload_percent: float = Field(5.0, ge=0, le=20, description="Workload increase per training week")
+    deload_every: int = Field(4, ge=0, le=12, description="Every Nth week is a deload week (0: never)")
+    deload_percent: float = Field(40.0, ge=0, le=80, description="Workload reduction in deload weeks")
+    rotate_meals: bool = Field(True, description="Shift the diet days by one day each week")
+
+
+class ProgramWeek(BaseModel):
+    # One week of a multi-week program
+    week: int = Field(..., example=2)
+    phase: str = Field(..., example="build", description="build or deload")
+    intensity: float = Field(..., example=1.05, description="Workload relative to the base week")
+    workout_plan: List[WorkoutPlan]
+    diet_plan: List[DietPlan]
+
+
+class ProgramPage(BaseModel):
+    # A page of weeks from a multi-week program
+    plan_id: int
+    settings: ProgramSettings
+    total_weeks: int
+    page: int
+    page_size: int
+    next_page: Optional[int] = None
+    weeks: List[ProgramWeek]
+
+
+class UsageTotals(BaseModel):
+    # Aggregated AI usage for one agent and model
+    agent: str = Field(..., example="coach")
+    model: str = Field(..., example="o3-2025-04-16")
+    runs: int = Field(..., example=12)
+    requests: int = Field(..., example=12)
+    prompt_tokens: int = Field(..., example=9800)
+    completion_tokens: int = Field(..., example=21400)
+    cached_tokens: int = Field(..., example=4096)
+    cost_usd: float = Field(..., example=0.19)
+    avg_latency_ms: float = Field(..., example=8450.0)
+
+
+class UsageReport(BaseModel):
+    # AI usage of the current user over a time window
+    since: datetime
+    total_tokens: int
+    total_cost_usd: float
+    daily_token_budget: Optional[int] = Field(None, description="Tokens allowed per rolling 24 hours, if limited")
+    monthly_cost_budget_usd: Optional[float] = Field(None, description="USD allowed per rolling 30 days, if limited")
+    usage: List[UsageTotals]
+
+
+class WeightUnit(str, Enum):
+    # Units accepted for logged weights; entries are stored in grams
+    kg = "kg"
+    lbs = "lbs"
+
+
+# How far ahead of the server clock a weigh-in may be stamped
+WEIGHT_ENTRY_CLOCK_SKEW = timedelta(minutes=10)
+
+
+class WeightEntryIn(BaseModel):
+    # One weigh-in to add to the weight log
+    weight: float = Field(..., gt=0, lt=700, example=86.4)
+    unit: WeightUnit = Field(WeightUnit.kg, example="kg")
+    recorded_at: Optional[datetime] = Field(None, description="Time of the measurement, defaults to now")
+    note: Optional[str] = Field(None, max_length=140, example="After morning run")
+
+    @field_validator("recorded_at")
+    @classmethod
+    def not_in_the_future(cls, recorded_at):
+        # Naive times are UTC; a few minutes of client clock skew are tolerated
+        if recorded_at is None:
+            return recorded_at
+        aware = recorded_at.replace(tzinfo=timezone.utc) if recorded_at.tzinfo is None else recorded_at
+        if aware > datetime.now(timezone.utc) + WEIGHT_ENTRY_CLOCK_SKEW:
+            raise ValueError("recorded_at must not be in the future")
+        return recorded_at
+
+
+class WeightLogBatch(BaseModel):
+    # Weigh-ins written together in one batched insert
+    entries: List[WeightEntryIn] = Field(..., min_length=1, max_length=1000)
+
+
+class WeightPoint(BaseModel):
+    # A raw entry, or the daily or weekly rollup of the entries starting at ``period``
+    period: datetime
+    weight_kg: float = Field(..., example=86.1, description="Entry weight, or the average of the period")
+    min_kg: float
+    max_kg: float
+    count: int = Field(..., example=7)
+
+
+class WeightLog(BaseModel):
+    # Entries or rollups of the weight log in a time range
+    resolution: str = Field(..., example="week", description="raw, day or week")
+    start: datetime
+    end: datetime
+    points: List[WeightPoint]
+
+
+class WeightTrend(BaseModel):
+    # Weight trend fitted to recent entries and the projected time to the goal
+    entries: int = Field(..., example=21, description="Entries in the fitted window")
+    current_kg: Optional[float] = Field(None, example=85.7, description="Trend weight at the latest entry")
+    slope_kg_per_week: Optional[float] = Field(None, example=-0.48)
+    target_kg: Optional[float] = Field(None, example=79.4, description="Target weight of the latest plan")
+    estimated_days_to_goal: Optional[int] = Field(None, example=92)
+    plan_id: Optional[int] = Field(None, description="Plan whose estimate was updated from the trend")
+
+
+class WeightLogResult(BaseModel):
+    # Result of adding entries to the weight log
+    inserted: int
+    trend: WeightTrend
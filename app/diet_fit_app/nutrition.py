@@ -0,0 +1,294 @@
+"""
+nutrition.py: Local calorie and macro estimates for diet plans.
+
+Diet days are free text ("Breakfast: Hausa koko with koose. Lunch: Jollof rice
+with grilled chicken..."). Rather than asking the model for numbers, the text is
+matched against a bundled food table and the nutrients are added up:
+
+1. each day's text is split into meals on ``Breakfast:``, ``Lunch:``, ``Dinner:``
+   and ``Snacks:`` labels;
+2. meal text is tokenized and scanned for the longest known food name at each
+   position ("jollof rice" before "rice"), with a count or portion word just
+   before it ("2 eggs", "small portion of banku") scaling the serving; options
+   joined by "or" are averaged;
+3. the servings of all meals of all 7 days form one (meals x foods) matrix, which
+   is multiplied by the (foods x nutrients) table in one step.
+
+Values in ``FOODS`` are per typical serving and are estimates, not dietary advice.
+Matching a day's text is the costly part, so its serving counts are cached by
+the SHA-256 of the text (``NUTRITION_CACHE_SIZE`` entries).
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, List
+
+from app.core.metrics import REGISTRY
+from app.diet_fit_app.models import CoachResult, DayNutrition
+
+if TYPE_CHECKING:
+    import numpy as np
+
+NUTRITION_ENABLED = os.getenv("NUTRITION_ENABLED", "1") == "1"
+NUTRITION_CACHE_SIZE = int(os.getenv("NUTRITION_CACHE_SIZE", "10000"))
+
+NUTRIENTS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+# name, aliases, serving, calories, protein (g), carbohydrate (g), fat (g) per serving
+FOODS = (
+    # West African dishes
+    ("jollof rice", ("jollof", "jollof rice"), "1 plate (300 g)", 480, 10, 80, 13),
+    ("waakye", ("waakye",), "1 plate (300 g)", 420, 15, 78, 4),
+    ("banku", ("banku",), "1 ball (250 g)", 350, 6, 76, 2),
+    ("fufu", ("fufu",), "1 ball (250 g)", 400, 3, 95, 1),
+    ("kenkey", ("kenkey", "dokon"), "1 ball (250 g)", 360, 8, 76, 3),
+    ("kelewele", ("kelewele",), "1 cup (150 g)", 330, 2, 48, 16),
+    ("red red", ("red red",), "1 plate (300 g)", 420, 14, 56, 16),
+    ("light soup", ("light soup",), "1 bowl (350 ml)", 180, 18, 10, 7),
+    ("palm nut soup", ("palm nut soup", "palmnut soup", "abenkwan"), "1 bowl (350 ml)", 420, 20, 14, 32),
+    ("groundnut soup", ("groundnut soup", "peanut soup", "nkatenkwan"), "1 bowl (350 ml)", 450, 22, 16, 34),
+    ("okra stew", ("okra stew", "okro stew", "okra soup", "okro soup", "okra"), "1 bowl (250 g)", 220, 15, 12, 13),
+    ("palava sauce", ("palava sauce", "palaver sauce", "kontomire stew", "kontomire"), "1 serving (200 g)",
+     280, 14, 10, 21),
+    ("shito", ("shito",), "1 tbsp", 90, 2, 2, 8),
+    ("gari", ("gari", "garri"), "1/2 cup (60 g)", 215, 1, 52, 0),
+    ("koose", ("koose", "akara"), "4 pieces", 280, 11, 22, 17),
+    ("hausa koko", ("hausa koko", "koko"), "1 cup (250 ml)", 180, 4, 38, 2),
+    ("bofrot", ("bofrot", "puff puff"), "3 pieces", 330, 5, 45, 15),
+    ("fried yam", ("fried yam", "yam chips"), "1 serving (200 g)", 380, 3, 55, 17),
+    ("yam", ("yam", "boiled yam", "ampesi"), "1 serving (200 g)", 240, 3, 56, 0),
+    ("fried plantain", ("fried plantain", "fried plantains"), "1 serving (150 g)", 340, 2, 58, 13),
+    ("plantain", ("plantain", "plantains", "boiled plantain"), "1 medium (180 g)", 220, 2, 57, 1),
+    # Proteins
+    ("tilapia", ("tilapia", "grilled tilapia"), "1 fish (200 g)", 260, 42, 0, 10),
+    ("fried fish", ("fried fish", "fried tilapia"), "1 piece (150 g)", 300, 30, 3, 18),
+    ("fish", ("fish", "grilled fish", "smoked fish", "salmon", "mackerel", "sardines"), "1 piece (150 g)",
+     220, 32, 0, 10),
+    ("fried chicken", ("fried chicken",), "1 piece (150 g)", 370, 30, 12, 22),
+    ("chicken", ("chicken", "grilled chicken", "roast chicken", "chicken breast"), "1 piece (150 g)", 250, 38, 0, 10),
+    ("beef", ("beef", "meat"), "100 g", 250, 26, 0, 15),
+    ("goat meat", ("goat", "goat meat"), "100 g", 140, 27, 0, 3),
+    ("egg", ("egg", "eggs", "boiled egg", "boiled eggs"), "1 egg", 78, 6, 1, 5),
+    ("fried egg", ("fried egg", "fried eggs", "omelette", "omelet"), "1 egg", 110, 6, 1, 9),
+    ("beans", ("beans", "bean stew", "lentils"), "1 cup (250 g)", 230, 15, 40, 1),
+    # Staples and breakfast
+    ("fried rice", ("fried rice",), "1 plate (300 g)", 450, 12, 65, 15),
+    ("rice", ("rice", "white rice", "plain rice", "brown rice"), "1 cup (200 g)", 260, 5, 57, 1),
+    ("pasta", ("pasta", "spaghetti", "macaroni", "noodles", "indomie"), "1 plate (250 g)", 350, 12, 70, 3),
+    ("couscous", ("couscous",), "1 cup (160 g)", 175, 6, 36, 0),
+    ("bread", ("bread", "tea bread", "sugar bread", "toast", "slice of bread"), "2 slices", 160, 5, 30, 2),
+    ("sandwich", ("sandwich", "sandwiches"), "1 sandwich", 350, 18, 35, 14),
+    ("oatmeal", ("oatmeal", "oats", "porridge"), "1 bowl (250 g)", 160, 6, 27, 3),
+    ("cereal", ("cereal", "cornflakes"), "1 bowl (40 g)", 150, 3, 33, 1),
+    ("potato", ("potato", "potatoes", "sweet potato", "sweet potatoes"), "1 medium (170 g)", 150, 3, 34, 0),
+    ("stew", ("stew", "tomato stew", "gravy"), "1 serving (150 g)", 180, 3, 10, 14),
+    ("soup", ("soup",), "1 bowl (350 ml)", 150, 10, 12, 7),
+    ("salad", ("salad", "salads", "vegetables", "veggies", "greens", "extra vegetables"), "1 bowl (150 g)",
+     80, 3, 10, 4),
+    # Drinks, snacks and sides
+    ("milk", ("milk",), "1 cup (250 ml)", 120, 8, 12, 5),
+    ("tea", ("tea", "coffee"), "1 cup with sugar", 30, 0, 7, 0),
+    ("milo", ("milo", "choco milo", "chocolate drink"), "1 cup (250 ml)", 170, 6, 25, 5),
+    ("yogurt", ("yogurt", "yoghurt"), "1 cup (200 g)", 150, 9, 17, 4),
+    ("fruit", ("fruit", "fruits", "fruit salad", "mango", "pawpaw", "papaya", "watermelon"), "1 serving (150 g)",
+     80, 1, 20, 0),
+    ("banana", ("banana", "bananas"), "1 medium", 105, 1, 27, 0),
+    ("apple", ("apple", "apples"), "1 medium", 95, 0, 25, 0),
+    ("orange", ("orange", "oranges"), "1 medium", 62, 1, 15, 0),
+    ("pineapple", ("pineapple",), "1 cup (165 g)", 80, 1, 22, 0),
+    ("avocado", ("avocado", "avocados"), "1/2 fruit", 160, 2, 9, 15),
+    ("nuts", ("nuts", "groundnuts", "peanuts", "cashews", "almonds"), "1 handful (30 g)", 170, 7, 5, 14),
+    ("biscuits", ("biscuits", "cookies", "crackers"), "4 pieces", 200, 3, 28, 9),
+    ("chocolate", ("chocolate",), "1 bar (40 g)", 215, 3, 24, 12),
+    ("ice cream", ("ice cream",), "1 cup", 270, 5, 31, 14),
+    ("burger", ("burger", "burgers"), "1 burger", 500, 25, 40, 25),
+    ("fries", ("fries", "chips", "french fries"), "1 medium portion", 365, 4, 48, 17),
+    ("pizza", ("pizza",), "2 slices", 570, 24, 70, 22),
+)
+
+FOOD_NAMES = [food[0] for food in FOODS]
+
+# Meal labels, and labels of non-meal notes whose text is skipped
+_MEAL_LABEL = re.compile(r"\b(breakfast|lunch|dinner|snacks?|restrictions?|notes?|tips?)\s*:", re.IGNORECASE)
+_NOT_MEALS = ("restriction", "note", "tip")
+_ALTERNATIVES = re.compile(r"\bor\b", re.IGNORECASE)
+_TOKEN = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+_NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "half": 0.5, "a": 1, "an": 1}
+_PORTIONS = {"small": 0.75, "light": 0.75, "moderate": 1.0, "large": 1.5, "big": 1.5, "double": 2.0}
+_NEGATIONS = {"no", "not", "without", "avoid", "skip"}
+
+_ALIASES = {tuple(_TOKEN.findall(alias)): index for index, food in enumerate(FOODS) for alias in food[1]}
+_LONGEST_ALIAS = max(len(alias) for alias in _ALIASES)
+
+
+
+@lru_cache(maxsize=1)
+def nutrient_table() -> "np.ndarray":
+    """(foods, nutrients) table; a day's servings (meals, foods) @ this table gives its nutrients."""
+    # numpy is imported on first use rather than with the app, to keep cold starts fast
+    import numpy as np
+
+    return np.array([food[3:] for food in FOODS], dtype=np.float64)
+
+
+cache_counter = REGISTRY.counter("nutrition_cache_requests_total", "Diet-day nutrition cache lookups", ["result"])
+unmatched_counter = REGISTRY.counter(
+    "nutrition_unmatched_meals_total", "Meals in which no food from the table was recognized"
+)
+
+
+def _quantity(tokens: list, floor: int, start: int) -> float:
+    """
+    Servings of the food named at ``tokens[start]``, from the words just before it.
+
+    Only words after the previous match (``floor``) count: "2 eggs" is 2 servings,
+    "small portion of banku" 0.75, and "no nuts" none at all.
+    """
+    count, portion = 1.0, 1.0
+    for token in tokens[max(floor, start - 3):start]:
+        if token in _NEGATIONS:
+            return 0.0
+        if token in _PORTIONS:
+            portion = _PORTIONS[token]
+        elif token in _NUMBER_WORDS:
+            count = _NUMBER_WORDS[token]
+        elif token[0].isdigit() and 0 < float(token) <= 10:
+            # Small numbers are counts ("2 eggs"); larger ones are likely grams or minutes
+            count = float(token)
+    return count * portion
+
+
+def match_foods(text: str) -> "np.ndarray":
+    """Servings of each food in ``FOODS`` mentioned in ``text``, longest name first."""
+    import numpy as np
+
+    servings = np.zeros(len(FOODS))
+    tokens = _TOKEN.findall(text.lower())
+    index = floor = 0
+    while index < len(tokens):
+        for length in range(min(_LONGEST_ALIAS, len(tokens) - index), 0, -1):
+            food = _ALIASES.get(tuple(tokens[index:index + length]))
+            if food is not None:
+                servings[food] += _quantity(tokens, floor, index)
+                index = floor = index + length
+                break
+        else:
+            index += 1
+    return servings
+
+
+def match_meal(text: str) -> "np.ndarray":
+    """Servings of one meal; alternatives ("jollof rice or waakye") are averaged."""
+    import numpy as np
+
+    return np.mean([match_foods(option) for option in _ALTERNATIVES.split(text)], axis=0)
+
+
+def split_meals(text: str) -> dict:
+    """Split a diet day into its labelled meals; unlabelled text counts as one ``meals`` entry."""
+    parts = _MEAL_LABEL.split(text or "")
+    if len(parts) == 1:
+        return {"meals": text or ""}
+    # Text before the first label ("Jollof rice with chicken. Dinner: banku") is eaten too
+    meals = {"meals": parts[0].strip()} if parts[0].strip() else {}
+    for label, body in zip(parts[1::2], parts[2::2]):
+        label = label.lower()
+        if label.startswith(_NOT_MEALS):
+            continue
+        label = "snacks" if label.startswith("snack") else label
+        meals[label] = (meals.get(label, "") + " " + body).strip()
+    return meals
+
+
+class DayServings:
+    """Servings matrix (meals x foods) of one diet day, with the meal labels."""
+
+    def __init__(self, labels: list, servings: "np.ndarray"):
+        self.labels = labels
+        self.servings = servings
+
+
+class ServingsCache:
+    """
+    LRU cache of matched diet days keyed by the SHA-256 of their text.
+
+    Args:
+        size: Entries kept
+    """
+
+    def __init__(self, size: int = NUTRITION_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str) -> DayServings:
+        import numpy as np
+
+        key = hashlib.sha256(text.encode()).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            cache_counter.inc(result="hit")
+            return entry
+        cache_counter.inc(result="miss")
+        meals = split_meals(text)
+        # Always (meals x foods), also for a day holding only notes or tips
+        servings = np.array([match_meal(body) for body in meals.values()]).reshape(len(meals), len(FOODS))
+        entry = DayServings(list(meals), servings)
+        for label, row in zip(entry.labels, entry.servings):
+            if not row.any():
+                unmatched_counter.inc()
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+servings_cache = ServingsCache()
+
+
+def estimate_days(meal_texts: list) -> List[DayNutrition]:
+    """
+    Estimate per-meal and per-day nutrients for a list of diet days.
+
+    All meals of all days are stacked into one servings matrix and multiplied by
+    the nutrient table at once.
+    """
+    import numpy as np
+
+    days = [servings_cache.get(text) for text in meal_texts]
+    stacked = np.vstack([day.servings for day in days]) if days else np.zeros((0, len(FOODS)))
+    per_meal = stacked @ nutrient_table()
+    results, row = [], 0
+    for day in days:
+        meal_rows = per_meal[row:row + len(day.labels)]
+        total = meal_rows.sum(axis=0)
+        results.append({
+            **dict(zip(NUTRIENTS, np.round(total, 1).tolist())),
+            "meals": [
+                {
+                    "meal": label,
+                    "items": [FOOD_NAMES[food] for food in np.flatnonzero(day.servings[position])],
+                    **dict(zip(NUTRIENTS, np.round(meal_rows[position], 1).tolist())),
+                }
+                for position, label in enumerate(day.labels)
+            ],
+        })
+        row += len(day.labels)
+    return results
+
+
+def attach_nutrition(result: CoachResult) -> CoachResult:
+    """Fill ``result.nutrition`` with the estimate for each diet day (unless disabled)."""
+    if NUTRITION_ENABLED:
+        estimates = estimate_days([entry.meals for entry in result.diet_plan])
+        result.nutrition = [
+            DayNutrition(day=entry.day, **estimate) for entry, estimate in zip(result.diet_plan, estimates)
+        ]
+    return result
@@ -0,0 +1,139 @@
+"""
+progression.py: Multi-week programs expanded locally from one generated week.
+
+The coach generates a single 7-day plan. A program of 1-12 weeks is derived from
+it with a few rules instead of asking the model for up to 84 days:
+
+- progressive overload: each training week scales the workload by
+  ``overload_percent``, capped at ``PROGRAM_MAX_INTENSITY`` times the base week.
+  One quantity per exercise is scaled (reps, else duration, else distance) and
+  set counts are kept, so the volume grows by the intensity and not its square;
+- deload weeks: every ``deload_every``-th week drops the workload by
+  ``deload_percent`` and does not count towards the overload;
+- meal rotation: the diet days shift by one day each week, so the same meals do
+  not land on the same weekday for the whole program.
+
+Only the base week (the plan's day rows) and the ``ProgramSettings`` are stored.
+Weeks are computed when they are requested, one page at a time.
+"""
+import json
+import os
+import re
+from functools import lru_cache
+
+from app.core.metrics import REGISTRY
+from app.db.models import UserPlan
+from app.diet_fit_app.models import CoachResult, ProgramPage, ProgramSettings, ProgramWeek
+
+PROGRAM_MAX_INTENSITY = float(os.getenv("PROGRAM_MAX_INTENSITY", "1.5"))
+DEFAULT_PAGE_SIZE = 4
+MAX_PAGE_SIZE = 12
+
+# Workload quantities; each exercise scales only the first kind found, in this order
+_REPS = re.compile(r"\b(\d+)(\s*)(reps?|repetitions)\b", re.IGNORECASE)
+# Reps written as "3 sets of 12" (no "reps" unit)
+_SETS_OF = re.compile(r"\b(sets? of )(\d+)\b(?!\s*(?:reps?|repetitions)\b)", re.IGNORECASE)
+_DURATION = re.compile(r"\b(\d+(?:\.\d+)?)(\s*)(minutes?|mins?)\b", re.IGNORECASE)
+_DISTANCE = re.compile(r"\b(\d+(?:\.\d+)?)(\s*)(km|miles?)\b", re.IGNORECASE)
+# Exercises within one activity description
+_EXERCISE_SEPARATOR = re.compile(r"(,|;|\bthen\b)", re.IGNORECASE)
+
+weeks_expanded_counter = REGISTRY.counter("program_weeks_expanded_total", "Program weeks computed from a base week")
+
+
+def _round(value: float, unit: str) -> str:
+    unit = unit.lower()
+    if unit.startswith("min"):
+        # Whole 5-minute steps for longer blocks
+        return str(max(5, int(5 * round(value / 5)))) if value >= 10 else str(max(1, round(value)))
+    if unit in ("km", "mile", "miles"):
+        return f"{max(0.5, round(value * 2) / 2):g}"
+    return str(max(1, round(value)))
+
+
+def _scale_exercise(text: str, intensity: float) -> str:
+    def quantity(match):
+        return f"{_round(float(match.group(1)) * intensity, match.group(3))}{match.group(2)}{match.group(3)}"
+
+    if _REPS.search(text):
+        return _REPS.sub(quantity, text)
+    if _SETS_OF.search(text):
+        return _SETS_OF.sub(lambda m: f"{m.group(1)}{_round(int(m.group(2)) * intensity, 'reps')}", text)
+    if _DURATION.search(text):
+        return _DURATION.sub(quantity, text)
+    return _DISTANCE.sub(quantity, text)
+
+
+@lru_cache(maxsize=4096)
+def scale_activity(activity: str, intensity: float) -> str:
+    """
+    Scale the workload of an activity description by ``intensity``.
+
+    Each exercise scales one quantity (reps, else duration, else distance); set
+    counts stay as they are, so total volume changes by ``intensity`` at most.
+    """
+    if intensity == 1.0:
+        return activity
+    return "".join(
+        part if _EXERCISE_SEPARATOR.fullmatch(part) else _scale_exercise(part, intensity)
+        for part in _EXERCISE_SEPARATOR.split(activity)
+    )
+
+
+def week_intensity(week: int, settings: ProgramSettings):
+    """
+    Workload of ``week`` (1-based) relative to the base week.
+
+    Returns:
+        tuple: (phase, intensity) with phase "build" or "deload"
+    """
+    deloads_before = (week - 1) // settings.deload_every if settings.deload_every else 0
+    training_weeks_before = week - 1 - deloads_before
+    intensity = min(PROGRAM_MAX_INTENSITY, (1 + settings.overload_percent / 100) ** training_weeks_before)
+    if settings.deload_every and week % settings.deload_every == 0:
+        return "deload", round(intensity * (1 - settings.deload_percent / 100), 3)
+    return "build", round(intensity, 3)
+
+
+def expand_week(base: CoachResult, settings: ProgramSettings, week: int) -> ProgramWeek:
+    """Compute one week of the program from the base week."""
+    phase, intensity = week_intensity(week, settings)
+    shift = (week - 1) % 7 if settings.rotate_meals else 0
+    meals = [entry.meals for entry in base.diet_plan]
+    weeks_expanded_counter.inc()
+    return ProgramWeek(
+        week=week,
+        phase=phase,
+        intensity=intensity,
+        workout_plan=[
+            {"day": entry.day, "activity": scale_activity(entry.activity, intensity)} for entry in base.workout_plan
+        ],
+        diet_plan=[
+            {"day": entry.day, "meals": meals[(index + shift) % 7]} for index, entry in enumerate(base.diet_plan)
+        ],
+    )
+
+
+def load_settings(plan: UserPlan) -> ProgramSettings:
+    """The plan's stored program settings, or the defaults."""
+    return ProgramSettings.model_validate_json(plan.program) if plan.program else ProgramSettings()
+
+
+def save_settings(plan: UserPlan, settings: ProgramSettings):
+    plan.program = json.dumps(settings.model_dump())
+
+
+def program_page(plan: UserPlan, base: CoachResult, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> ProgramPage:
+    """Compute the weeks on one page of the plan's program; other weeks are not computed."""
+    settings = load_settings(plan)
+    first = (page - 1) * page_size + 1
+    last = min(settings.weeks, first + page_size - 1)
+    return ProgramPage(
+        plan_id=plan.id,
+        settings=settings,
+        total_weeks=settings.weeks,
+        page=page,
+        page_size=page_size,
+        next_page=page + 1 if last < settings.weeks else None,
+        weeks=[expand_week(base, settings, week) for week in range(first, last + 1)],
+    )
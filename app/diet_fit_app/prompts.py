@@ -0,0 +1,214 @@
+"""
+prompts.py: Prompt layout and compaction for the plan agents.
+
+Prompts are laid out so the provider can cache their prefix: the static
+instructions come first and are byte-for-byte identical on every request, and
+everything user-specific follows in one block with a fixed field order. OpenAI
+caches prompt prefixes of 1024 tokens and more automatically, so the static part
+(instructions, output schema and tool definitions) must not vary between calls.
+
+User fields are free text and sometimes whole pasted paragraphs. Before they go
+into the prompt each field is:
+
+- normalized: Unicode NFKC, whitespace collapsed, repeated punctuation squeezed;
+- deduplicated: repeated items inside a field are dropped, and a field identical
+  to an earlier one is replaced by a reference to it;
+- budgeted: items are kept while they fit in the field's token budget
+  (``FIELD_TOKEN_BUDGETS``); an item that alone exceeds the budget is cut.
+
+Token counts use tiktoken when it is installed and a word/punctuation estimate
+otherwise. They are reported per prompt part before the request is sent.
+"""
+import importlib.util
+import re
+import unicodedata
+from functools import lru_cache
+
+from app.core.metrics import REGISTRY
+from app.diet_fit_app.models import UserInput
+
+# tiktoken is optional; without it token counts are estimated
+TIKTOKEN_AVAILABLE = importlib.util.find_spec("tiktoken") is not None
+TOKENIZER_ENCODING = "o200k_base"
+
+COACH_SYSTEM_PROMPT = (
+    "You are a fitness and nutrition AI coach. Based on the user's dietary preferences "
+    "(typical meals, restrictions, favorites, and eating habits), "
+    "current weight, weight goal, and workout frequency, provide:\n"
+    "1. A 7-day workout plan\n"
+    "2. A 7-day culturally sensitive diet plan\n"
+    "Do not estimate the number of days to reach the goal.\n"
+    "The user's profile follows. Fields may be shortened; "
+    "\"same as ...\" means the field repeats an earlier one."
+)
+
+ESTIMATOR_SYSTEM_PROMPT = (
+    "You are a health progress analyst AI. Given a workout and diet plan, estimate how many days "
+    "it will take the user to reach their weight goal. Consider the user's consistency, frequency, "
+    "and intensity of the routine when making the prediction."
+)
+
+REPAIR_SYSTEM_PROMPT = (
+    "You complete a 7-day fitness and diet plan that is missing some days. "
+    "Write entries only for the missing days listed, in the same style and intensity as the existing days, "
+    "and keep the week balanced (no more hard sessions than the user's workout frequency). "
+    "Do not repeat or change the existing days."
+)
+
+# User fields in prompt order, with their labels and token budgets
+FIELD_TOKEN_BUDGETS = {
+    "current_weight": ("Current weight", 16),
+    "weight_goal": ("Weight goal", 32),
+    "workout_frequency": ("Workout frequency", 24),
+    "typical_breakfast": ("Typical breakfast", 48),
+    "typical_lunch": ("Typical lunch", 48),
+    "typical_dinner": ("Typical dinner", 48),
+    "typical_snacks": ("Typical snacks", 32),
+    "dietary_restrictions": ("Dietary restrictions", 48),
+    "favorite_meals": ("Favorite meals", 48),
+    "comfort_foods": ("Comfort foods", 32),
+    "eating_out_frequency": ("Eating out frequency", 16),
+    "eating_out_choices": ("Eating out choices", 40),
+}
+
+prompt_tokens_histogram = REGISTRY.histogram(
+    "llm_prompt_tokens", "Prompt tokens per request by part, counted before sending", ["agent", "part"],
+    buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096, 8192),
+)
+prompt_tokens_saved_counter = REGISTRY.counter(
+    "llm_prompt_tokens_saved_total", "User-context tokens removed by normalization, deduplication and budgets", ["agent"]
+)
+prompt_truncations_counter = REGISTRY.counter(
+    "llm_prompt_truncations_total", "User fields cut to their token budget", ["field"]
+)
+
+_SPACES = re.compile(r"[^\S\n]+")
+_LINE_BREAKS = re.compile(r"\s*\n\s*")
+_REPEATED_PUNCTUATION = re.compile(r"([!?.,;:\-*_~])\1+")
+_ITEM_SEPARATOR = re.compile(r"\s*(?:[;\n|•]|,(?!\d)|\s-\s)\s*")
+_ESTIMATE_TOKENS = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+
+    return tiktoken.get_encoding(TOKENIZER_ENCODING)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken, or estimate one per word or punctuation mark without it."""
+    if TIKTOKEN_AVAILABLE:
+        return len(_encoding().encode(text))
+    return len(_ESTIMATE_TOKENS.findall(text))
+
+
+def normalize_text(text: str) -> str:
+    """Apply NFKC, squeeze repeated punctuation and collapse whitespace (line breaks separate items)."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _REPEATED_PUNCTUATION.sub(r"\1", text)
+    return _LINE_BREAKS.sub("\n", _SPACES.sub(" ", text)).strip()
+
+
+def split_items(text: str) -> list:
+    """Split a field into its listed items, dropping empty and repeated ones (case-insensitive)."""
+    items, seen = [], set()
+    for item in _ITEM_SEPARATOR.split(text):
+        item = item.strip(" .!?:")
+        key = item.casefold()
+        if item and key not in seen:
+            seen.add(key)
+            items.append(item)
+    return items
+
+
+def fit_budget(items: list, budget: int):
+    """
+    Keep whole items while they fit in ``budget`` tokens.
+
+    Returns:
+        tuple: (text, truncated)
+    """
+    kept, used = [], 0
+    for item in items:
+        cost = count_tokens(item) + (1 if kept else 0)
+        if used + cost > budget:
+            if not kept:
+                # A single item longer than the budget: keep its first words
+                words, used = [], 1
+                for word in item.split():
+                    cost = count_tokens(f" {word}")
+                    if used + cost > budget:
+                        break
+                    words.append(word)
+                    used += cost
+                kept.append(" ".join(words) + "…")
+            return ", ".join(kept), True
+        kept.append(item)
+        used += cost
+    return ", ".join(kept), False
+
+
+class PromptReport:
+    """Token counts for one prompt, computed before it is sent."""
+
+    def __init__(self, static_tokens: int, raw_tokens: int, context_tokens: int, fields: dict, truncated: list):
+        self.static_tokens = static_tokens
+        self.raw_tokens = raw_tokens
+        self.context_tokens = context_tokens
+        self.fields = fields
+        self.truncated = truncated
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.context_tokens)
+
+    def as_dict(self) -> dict:
+        return {
+            "static_tokens": self.static_tokens,
+            "raw_tokens": self.raw_tokens,
+            "context_tokens": self.context_tokens,
+            "saved_tokens": self.saved_tokens,
+            "fields": self.fields,
+            "truncated": self.truncated,
+        }
+
+
+def build_user_context(user: UserInput):
+    """
+    Build the compact user-profile block for the coach prompt.
+
+    Returns:
+        tuple: (text, PromptReport)
+    """
+    lines, fields, truncated = ["User profile:"], {}, []
+    raw_tokens = 0
+    rendered = {}
+    for name, (label, budget) in FIELD_TOKEN_BUDGETS.items():
+        raw = getattr(user, name) or ""
+        raw_tokens += count_tokens(f"- {label}: {raw}")
+        value, cut = fit_budget(split_items(normalize_text(raw)), budget)
+        if cut:
+            truncated.append(name)
+        key = value.casefold()
+        if key and key in rendered:
+            value = f"same as {rendered[key].lower()}"
+        elif key:
+            rendered[key] = label
+        if not value:
+            continue
+        line = f"- {label}: {value}"
+        fields[name] = count_tokens(line)
+        lines.append(line)
+    text = "\n".join(lines)
+    report = PromptReport(count_tokens(COACH_SYSTEM_PROMPT), raw_tokens, count_tokens(text), fields, truncated)
+    return text, report
+
+
+def record_prompt(agent: str, report: PromptReport):
+    """Export a prompt's token counts as metrics."""
+    prompt_tokens_histogram.observe(report.static_tokens, agent=agent, part="static")
+    prompt_tokens_histogram.observe(report.context_tokens, agent=agent, part="context")
+    prompt_tokens_saved_counter.inc(report.saved_tokens, agent=agent)
+    for name in report.truncated:
+        prompt_truncations_counter.inc(field=name)
@@ -0,0 +1,195 @@
+"""
+repair.py: Weekday coverage checks and targeted repair of coach output.
+
+``CoachResult`` requires each weekday exactly once in both the workout and the
+diet plan. The coach agent itself returns a lenient ``CoachDraft``, so a reply
+with a missing, duplicate or malformed day is not rejected by pydantic_ai (which
+would re-run the whole generation). Instead the pipeline repairs the draft:
+
+1. ``check_week`` maps entries to weekdays (``Mon``, ``TUESDAY``, ``Day 3``...),
+   keeps the first usable entry per day and lists the days still missing;
+2. if too few days are usable (fewer than ``REPAIR_MIN_VALID_DAYS``) the plan is
+   regenerated once: the only full retry;
+3. otherwise, with ``REPAIR_MODE=targeted`` (default), a small model call
+   generates only the missing days;
+4. whatever is still missing is filled locally: workouts become rest days and
+   meals are copied from the closest earlier day.
+"""
+import os
+import re
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from app.core.metrics import REGISTRY
+from app.diet_fit_app.models import CoachResult, Weekday
+
+REPAIR_MODE = os.getenv("REPAIR_MODE", "targeted")
+REPAIR_MIN_VALID_DAYS = int(os.getenv("REPAIR_MIN_VALID_DAYS", "4"))
+REPAIR_TIMEOUT_SECONDS = float(os.getenv("REPAIR_TIMEOUT_SECONDS", "20"))
+REPAIR_MODEL = os.getenv("REPAIR_MODEL", "gpt-4o-mini")
+
+LOCAL_REST = "Rest day or light stretching"
+# Stored plans only: shown for a day when the plan has no meals at all to copy from
+LOCAL_NO_MEALS = "No meals planned for this day"
+
+validation_counter = REGISTRY.counter(
+    "plan_validation_total", "Coach outputs by validation outcome (valid, repaired, retried)", ["outcome"]
+)
+repaired_days_counter = REGISTRY.counter(
+    "plan_repaired_days_total", "Plan days filled in by repair", ["section", "method"]
+)
+
+WEEKDAYS = list(Weekday)
+_ALIASES = {day.value[:3]: day for day in Weekday}
+_ALIASES.update({"tues": Weekday.tuesday, "thur": Weekday.thursday, "thurs": Weekday.thursday})
+_DAY_NUMBER = re.compile(r"^day\s*([1-7])$")
+
+
+class DraftWorkoutDay(BaseModel):
+    # Workout entry as returned by the model, before weekday validation
+    day: str = ""
+    activity: str = ""
+
+
+class DraftDietDay(BaseModel):
+    # Diet entry as returned by the model, before weekday validation
+    day: str = ""
+    meals: str = ""
+
+
+class CoachDraft(BaseModel):
+    # Lenient coach output: days may be missing, repeated or malformed
+    workout_plan: List[DraftWorkoutDay] = []
+    diet_plan: List[DraftDietDay] = []
+    estimated_days_to_goal: int = 0
+
+
+class DayPatch(BaseModel):
+    # Output of a targeted repair call: only the requested days
+    workout_plan: List[DraftWorkoutDay] = []
+    diet_plan: List[DraftDietDay] = []
+
+
+def parse_weekday(text: str) -> Optional[Weekday]:
+    """Map ``Monday``, ``mon``, ``TUES.`` or ``Day 1`` to a weekday; None if it is not one."""
+    key = re.sub(r"[^a-z0-9 ]", "", (text or "").strip().lower()).strip()
+    if key in Weekday._value2member_map_:
+        return Weekday(key)
+    if key in _ALIASES:
+        return _ALIASES[key]
+    number = _DAY_NUMBER.match(key)
+    return WEEKDAYS[int(number.group(1)) - 1] if number else None
+
+
+def _index(entries, field: str) -> dict:
+    days = {}
+    for entry in entries:
+        day = parse_weekday(entry.day)
+        text = (getattr(entry, field) or "").strip()
+        if day is not None and text and day not in days:
+            days[day] = text
+    return days
+
+
+class WeekCheck:
+    """Usable workout and diet text per weekday, and the days still missing."""
+
+    def __init__(self, draft: CoachDraft):
+        self.workout = _index(draft.workout_plan, "activity")
+        self.diet = _index(draft.diet_plan, "meals")
+        self.estimated_days_to_goal = draft.estimated_days_to_goal
+        # Entries that were dropped: unknown day, empty text or a repeat
+        self.invalid_entries = len(draft.workout_plan) + len(draft.diet_plan) - len(self.workout) - len(self.diet)
+
+    @property
+    def missing_workout(self) -> list:
+        return [day for day in WEEKDAYS if day not in self.workout]
+
+    @property
+    def missing_diet(self) -> list:
+        return [day for day in WEEKDAYS if day not in self.diet]
+
+    @property
+    def complete(self) -> bool:
+        return not self.missing_workout and not self.missing_diet
+
+    @property
+    def valid_days(self) -> int:
+        """Days usable in both sections."""
+        return sum(1 for day in WEEKDAYS if day in self.workout and day in self.diet)
+
+    def apply(self, patch: DayPatch, method: str = "targeted") -> int:
+        """Fill missing days from ``patch``, ignoring days that were not missing; return days filled."""
+        filled = 0
+        for section, field, entries in (("workout", "activity", patch.workout_plan), ("diet", "meals", patch.diet_plan)):
+            current = getattr(self, section)
+            for day, text in _index(entries, field).items():
+                if day not in current:
+                    current[day] = text
+                    filled += 1
+                    repaired_days_counter.inc(section=section, method=method)
+        return filled
+
+    def fill_locally(self) -> int:
+        """Fill remaining gaps without a model call; return days filled (diet days need one to copy)."""
+        filled = 0
+        for day in self.missing_workout:
+            self.workout[day] = LOCAL_REST
+            filled += 1
+            repaired_days_counter.inc(section="workout", method="local")
+        for day in self.missing_diet:
+            index = WEEKDAYS.index(day)
+            source = next(
+                (WEEKDAYS[(index - step) % 7] for step in range(1, 7) if WEEKDAYS[(index - step) % 7] in self.diet), None
+            )
+            if source is None:
+                break
+            self.diet[day] = self.diet[source]
+            filled += 1
+            repaired_days_counter.inc(section="diet", method="local")
+        return filled
+
+    def result(self) -> CoachResult:
+        return CoachResult(
+            workout_plan=[{"day": day, "activity": self.workout[day]} for day in WEEKDAYS],
+            diet_plan=[{"day": day, "meals": self.diet[day]} for day in WEEKDAYS],
+            estimated_days_to_goal=self.estimated_days_to_goal,
+        )
+
+
+def check_week(output) -> WeekCheck:
+    """Check a ``CoachDraft`` (or an already valid ``CoachResult``) for weekday coverage."""
+    if not isinstance(output, CoachDraft):
+        output = CoachDraft.model_validate(output.model_dump(mode="json"))
+    return WeekCheck(output)
+
+
+def repair_prompt(check: WeekCheck, profile: str) -> str:
+    """Prompt for a targeted repair call asking for the missing days only."""
+    lines = []
+    if check.missing_workout:
+        lines.append("Missing workout days: " + ", ".join(day.value for day in check.missing_workout))
+    if check.missing_diet:
+        lines.append("Missing diet days: " + ", ".join(day.value for day in check.missing_diet))
+    lines.append("Existing plan:")
+    for day in WEEKDAYS:
+        if day in check.workout:
+            lines.append(f"- {day.value} workout: {check.workout[day]}")
+        if day in check.diet:
+            lines.append(f"- {day.value} meals: {check.diet[day]}")
+    lines.append(profile)
+    return "\n".join(lines)
+
+
+def complete_week(workout_plan: list, diet_plan: list, estimated_days_to_goal: int) -> CoachResult:
+    """Build a ``CoachResult`` from stored rows, filling days missing from older plans locally."""
+    check = check_week(CoachDraft(
+        workout_plan=workout_plan, diet_plan=diet_plan, estimated_days_to_goal=estimated_days_to_goal or 0
+    ))
+    check.fill_locally()
+    for day in check.missing_diet:
+        check.diet[day] = LOCAL_NO_MEALS
+    result = check.result()
+    result.estimated_days_to_goal = estimated_days_to_goal
+    return result
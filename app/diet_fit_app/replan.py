@@ -0,0 +1,160 @@
+"""
+replan.py: Incremental re-planning when a stored plan is updated.
+
+``PUT /api/my-plans/{plan_id}`` may change the current weight, the weight goal or
+the workout frequency. Rather than leaving the plan stale or generating a new one,
+only the parts that depend on the changed fields are recomputed:
+
+- a new current weight or weight goal recomputes the days-to-goal estimate;
+- a new workout frequency regenerates the workout days only, by spreading the
+  plan's existing workouts over the new number of sessions.
+
+Both are computed locally unless the caller asks for model re-planning
+(``replan=model``), which the route guards like plan generation. Then the estimate
+goes through the estimator chain with ``REPLAN_ESTIMATE=estimator`` (default
+``local``), and the workout days through one targeted repair call with
+``REPLAN_WORKOUTS=targeted`` (default).
+
+The diet days are never touched. Day rows are written as a diff: rows whose text
+did not change are left alone, so a weight update writes one row.
+"""
+import os
+
+from sqlalchemy.orm import Session
+
+from app.core.deadline import Deadline
+from app.core.metrics import REGISTRY
+from app.db.models import UserPlan, WorkoutPlan as DBWorkoutPlan
+from app.diet_fit_app import repair, service
+from app.diet_fit_app.fallback import _sessions_per_week, estimator_chain, fit_sessions, local_estimate
+from app.diet_fit_app.models import CoachResult, UserInput, UserPlanUpdate
+from app.diet_fit_app.usage import record_run
+
+REPLAN_ESTIMATE = os.getenv("REPLAN_ESTIMATE", "local")
+REPLAN_WORKOUTS = os.getenv("REPLAN_WORKOUTS", "targeted")
+
+# Parts of a plan and the stored fields they depend on
+PLAN_DEPENDENCIES = {
+    "estimate": ("current_weight", "weight_goal"),
+    "workouts": ("workout_frequency",),
+}
+
+replanned_counter = REGISTRY.counter(
+    "replan_parts_total", "Plan parts recomputed after an update", ["part", "method"]
+)
+rows_written_counter = REGISTRY.counter(
+    "replan_rows_written_total", "Day rows written by incremental re-planning", ["operation"]
+)
+
+
+def affected_parts(plan: UserPlan, update: UserPlanUpdate) -> list:
+    """Return the plan parts whose inputs ``update`` changes, e.g. ``["estimate"]``."""
+    changed = {
+        field for field, value in update.model_dump(exclude_none=True).items() if value != getattr(plan, field)
+    }
+    return [part for part, fields in PLAN_DEPENDENCIES.items() if changed.intersection(fields)]
+
+
+def plan_profile(plan: UserPlan) -> UserInput:
+    """The stored fields of ``plan`` as a ``UserInput``; meal fields are not stored and left empty."""
+    empty = {field: "" for field in UserInput.model_fields}
+    return UserInput(**{
+        **empty,
+        "current_weight": plan.current_weight or "",
+        "weight_goal": plan.weight_goal or "",
+        "workout_frequency": plan.workout_frequency or "",
+    })
+
+
+def current_result(plan: UserPlan) -> CoachResult:
+    return repair.complete_week(
+        [{"day": row.day, "activity": row.activity} for row in plan.workout_plans],
+        [{"day": row.day, "meals": row.meals} for row in plan.diet_plans],
+        plan.estimated_days_to_goal,
+    )
+
+
+async def regenerate_workouts(result: CoachResult, profile: UserInput, db: Session, user_id: int,
+                              deadline: Deadline = None, use_model: bool = False) -> CoachResult:
+    """Replace the workout days of ``result`` for the profile's workout frequency, keeping the diet."""
+    if use_model and REPLAN_WORKOUTS == "targeted":
+        check = repair.check_week(repair.CoachDraft(
+            diet_plan=result.model_dump(mode="json")["diet_plan"],
+            estimated_days_to_goal=result.estimated_days_to_goal or 0,
+        ))
+        await service.repair_days(check, profile, db, user_id, deadline)
+        if not check.missing_workout:
+            replanned_counter.inc(part="workouts", method="targeted")
+            check.estimated_days_to_goal = result.estimated_days_to_goal
+            return check.result()
+    replanned_counter.inc(part="workouts", method="local")
+    return fit_sessions(result, _sessions_per_week(profile.workout_frequency))
+
+
+async def recompute_estimate(result: CoachResult, profile: UserInput, db: Session, user_id: int,
+                             deadline: Deadline = None, use_model: bool = False) -> int:
+    """Days-to-goal estimate for the updated weights."""
+    if use_model and REPLAN_ESTIMATE == "estimator":
+        served = await estimator_chain.run(service.get_agent("estimator_agent"), result, profile, deadline)
+        if served.run is not None:
+            record_run(db, user_id, "estimator", served.run, served.elapsed, default_model=served.tier)
+        replanned_counter.inc(part="estimate", method="estimator" if served.run is not None else "local")
+        return served.output
+    replanned_counter.inc(part="estimate", method="local")
+    return local_estimate(result, profile)
+
+
+def write_workout_diff(db: Session, plan: UserPlan, result: CoachResult) -> dict:
+    """
+    Bring the plan's workout rows in line with ``result``, touching only rows that differ.
+
+    Returns:
+        dict: Rows inserted, updated and deleted
+    """
+    counts = {"insert": 0, "update": 0, "delete": 0}
+    wanted = {entry.day: entry.activity for entry in result.workout_plan}
+    for row in plan.workout_plans:
+        day = repair.parse_weekday(row.day)
+        if day is None or day not in wanted:
+            # Unreadable day or a repeat of a day already kept
+            db.delete(row)
+            counts["delete"] += 1
+            continue
+        activity = wanted.pop(day)
+        if row.activity != activity:
+            row.activity = activity
+            counts["update"] += 1
+    for day, activity in wanted.items():
+        db.add(DBWorkoutPlan(user_plan_id=plan.id, day=day.value, activity=activity))
+        counts["insert"] += 1
+    for operation, count in counts.items():
+        if count:
+            rows_written_counter.inc(count, operation=operation)
+    return counts
+
+
+async def replan(db: Session, plan: UserPlan, update: UserPlanUpdate, user_id: int,
+                 deadline: Deadline = None, use_model: bool = False):
+    """
+    Apply ``update`` to ``plan`` and recompute the parts it affects, in one commit.
+
+    Model calls are made only with ``use_model``; the caller must have admitted
+    the request as an LLM-backed one.
+
+    Returns:
+        tuple: (CoachResult, list of the parts recomputed)
+    """
+    parts = affected_parts(plan, update)
+    for field, value in update.model_dump(exclude_none=True).items():
+        setattr(plan, field, value)
+    result = current_result(plan)
+    profile = plan_profile(plan)
+
+    if "workouts" in parts:
+        result = await regenerate_workouts(result, profile, db, user_id, deadline, use_model)
+        write_workout_diff(db, plan, result)
+    if "estimate" in parts:
+        result.estimated_days_to_goal = await recompute_estimate(result, profile, db, user_id, deadline, use_model)
+        plan.estimated_days_to_goal = result.estimated_days_to_goal
+    db.commit()
+    return result, parts
@@ -2,45 +2,107 @@
 service.py: Core pipeline for generating fitness and diet plans and estimating progress using AI agents.
 
 This module contains the AI-powered service layer for the Diet Fitness application.
-It uses two AI agents:
+It uses three AI agents:
 1. A fitness coach agent that generates personalized workout and diet plans
 2. An estimator agent that predicts how long it will take to reach fitness goals
+3. A small repair agent that fills in days missing from the coach's plan (see repair.py)
+
+A request whose profile closely matches an approved plan template is served from
+the template library without any agent call (see templates.py).
+
+Each agent call goes through its model fallback chain (see fallback.py), so a
+failing or slow model is skipped in favour of the next tier.
+
+The agents are built on first use, or at startup by the application lifespan, so
+importing this module does not pull in pydantic_ai, openai and the provider SDKs.
 """
+import asyncio
+import logging
 import os
-from pydantic_ai import Agent, RunContext
-from pydantic_ai.providers.openai import OpenAIProvider
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
 from sqlalchemy.orm import Session
 from app.diet_fit_app.models import UserInput, CoachResult
 from app.db.models import UserPlan, WorkoutPlan as DBWorkoutPlan, DietPlan as DBDietPlan
+from app.core.metrics import REGISTRY
+from app.core.instrumentation import record_stage
+from app.core.capture import record_cassette
+from app.diet_fit_app.usage import record_run
+from app.diet_fit_app.fallback import coach_chain, estimator_chain, local_coach_plan
+from app.core.deadline import Deadline
+from app.diet_fit_app.prompts import (
+    COACH_SYSTEM_PROMPT, ESTIMATOR_SYSTEM_PROMPT, REPAIR_SYSTEM_PROMPT, build_user_context, record_prompt,
+)
+from app.diet_fit_app import nutrition, repair, templates
+
+if TYPE_CHECKING:
+    from pydantic_ai import RunContext
+
+logger = logging.getLogger(__name__)
 
 # Load OpenAI API key for AI providers from environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# GPT-03 Agent – Primary AI coach that generates workout and diet plans based on user input
-# This agent takes user preferences and goals as input and produces a structured fitness plan
-gpt03_agent = Agent(
-    model="o3",                     # Using OpenAI's o3 model for plan generation
-    deps_type=UserInput,            # Input type: User's fitness data and preferences
-    result_type=CoachResult,        # Output type: Structured workout and diet plans
-    providers=[OpenAIProvider(api_key=OPENAI_API_KEY)],  # Using OpenAI as the AI provider
-    system_prompt=(
-        "You are a fitness and nutrition AI coach. Based on the user's dietary preferences "
-        "(typical meals, restrictions, favorites, and eating habits), "
-        "current weight, weight goal, and workout frequency, provide:\n"
-        "1. A 7-day workout plan\n"
-        "2. A 7-day culturally sensitive diet plan\n"
-        "Do not estimate the number of days to reach the goal."
-    )
+# Pipeline metrics exposed at /metrics
+stage_histogram = REGISTRY.histogram(
+    "pipeline_stage_duration_seconds", "Latency of each plan pipeline stage", ["stage"]
+)
+stage_errors_counter = REGISTRY.counter("pipeline_errors_total", "Pipeline stages that raised", ["stage"])
+stage_cancelled_counter = REGISTRY.counter(
+    "pipeline_stage_cancelled_total", "Pipeline stages interrupted by cancellation", ["stage"]
+)
+llm_retries_counter = REGISTRY.counter(
+    "llm_retries_total", "Model requests repeated because the output failed validation", ["agent"]
 )
+pipeline_in_flight_gauge = REGISTRY.gauge("pipeline_generations_in_flight", "Plan generations currently running")
+
+
+class StageTiming:
+    """Elapsed time of a pipeline stage, filled in when the stage finishes."""
+
+    elapsed = 0.0
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Time a pipeline stage and count it as an error if it raises, or as cancelled."""
+    timing = StageTiming()
+    started = time.perf_counter()
+    try:
+        yield timing
+    except asyncio.CancelledError:
+        stage_cancelled_counter.inc(stage=stage)
+        raise
+    except BaseException:
+        stage_errors_counter.inc(stage=stage)
+        raise
+    finally:
+        timing.elapsed = time.perf_counter() - started
+        stage_histogram.observe(timing.elapsed, stage=stage)
+        record_stage(stage, timing.elapsed)
+
+
+def count_retries(agent: str, run) -> None:
+    """Record validation retries pydantic_ai performed during an agent run."""
+    from pydantic_ai.messages import ModelRequest, RetryPromptPart
+
+    retries = sum(
+        1 for message in run.all_messages() if isinstance(message, ModelRequest)
+        for part in message.parts if isinstance(part, RetryPromptPart)
+    )
+    if retries:
+        llm_retries_counter.inc(retries, agent=agent)
 
 
-@gpt03_agent.system_prompt
-async def gpt03_context(ctx: RunContext[UserInput]):
+async def gpt03_context(ctx: "RunContext[UserInput]"):
     """
     Dynamic context generator for the fitness coach agent.
 
     This function extracts user information from the input and formats it
-    into a detailed context that helps the AI generate personalized plans.
+    into a compact profile block that follows the static instructions, so the
+    prompt prefix stays cacheable. Token counts are reported before sending.
 
     Args:
         ctx: Run context containing the user input data
@@ -48,118 +110,300 @@ async def gpt03_context(ctx: RunContext[UserInput]):
     Returns:
         str: Formatted user context for the AI prompt
     """
-    # Inject dynamic user context into the system prompt
-    user = ctx.deps
-    return (
-        f"The user weighs {user.current_weight}, wants to {user.weight_goal}, and works out {user.workout_frequency}.\n"
-        f"Dietary information:\n"
-        f"- Typical breakfast: {user.typical_breakfast}\n"
-        f"- Typical lunch: {user.typical_lunch}\n"
-        f"- Typical dinner: {user.typical_dinner}\n"
-        f"- Typical snacks: {user.typical_snacks}\n"
-        f"- Dietary restrictions: {user.dietary_restrictions}\n"
-        f"- Favorite meals: {user.favorite_meals}\n"
-        f"- Comfort foods: {user.comfort_foods}\n"
-        f"- Eating out frequency: {user.eating_out_frequency}\n"
-        f"- Eating out choices: {user.eating_out_choices}"
+    # Inject dynamic user context after the static system prompt
+    context, report = build_user_context(ctx.deps)
+    record_prompt("coach", report)
+    return context
+
+
+def build_coach_agent():
+    """
+    GPT-03 Agent – Primary AI coach that generates workout and diet plans based on user input.
+    This agent takes user preferences and goals as input and produces a structured fitness plan.
+    """
+    from pydantic_ai import Agent
+    from pydantic_ai.providers.openai import OpenAIProvider
+
+    agent = Agent(
+        model="o3",                     # Using OpenAI's o3 model for plan generation
+        deps_type=UserInput,            # Input type: User's fitness data and preferences
+        result_type=repair.CoachDraft,  # Output type: Workout and diet plans, weekdays checked by repair
+        providers=[OpenAIProvider(api_key=OPENAI_API_KEY)],  # Using OpenAI as the AI provider
+        system_prompt=COACH_SYSTEM_PROMPT
     )
+    agent.system_prompt(gpt03_context)
+    return agent
 
 
-# Estimator Agent – Secondary AI that predicts days to goal from the generated fitness plan
-# This agent analyzes the workout and diet plan to estimate time to reach the weight goal
-estimator_agent = Agent(
-    model="gpt-4o",                 # Using GPT-4o for more accurate time estimation
-    deps_type=CoachResult,          # Input type: The generated fitness plan
-    result_type=int,                # Output type: Number of days to reach goal
-    providers=[OpenAIProvider(api_key=OPENAI_API_KEY)],  # Using OpenAI as the AI provider
-    system_prompt=(
-        "You are a health progress analyst AI. Given a workout and diet plan, estimate how many days "
-        "it will take the user to reach their weight goal. Consider the user's consistency, frequency, "
-        "and intensity of the routine when making the prediction."
+def build_estimator_agent():
+    """
+    Estimator Agent – Secondary AI that predicts days to goal from the generated fitness plan.
+    This agent analyzes the workout and diet plan to estimate time to reach the weight goal.
+    """
+    from pydantic_ai import Agent, RunContext
+    from pydantic_ai.providers.openai import OpenAIProvider
+
+    agent = Agent(
+        model="gpt-4o",                 # Using GPT-4o for more accurate time estimation
+        deps_type=CoachResult,          # Input type: The generated fitness plan
+        result_type=int,                # Output type: Number of days to reach goal
+        providers=[OpenAIProvider(api_key=OPENAI_API_KEY)],  # Using OpenAI as the AI provider
+        system_prompt=ESTIMATOR_SYSTEM_PROMPT
     )
-)
 
+    @agent.tool
+    async def estimate_days_to_goal(ctx: RunContext[CoachResult], result: CoachResult) -> int:
+        """
+        Tool function for the estimator agent to predict goal achievement time.
 
-@estimator_agent.tool
-async def estimate_days_to_goal(ctx: RunContext[CoachResult], result: CoachResult) -> int:
+        This function is called by the estimator agent to analyze the fitness plan
+        and predict how many days it will take to reach the weight goal.
+
+        Args:
+            ctx: Run context containing the fitness plan
+            result: The generated fitness plan (workout and diet)
+
+        Returns:
+            int: Estimated number of days to reach the weight goal
+        """
+        return 0  # Placeholder - Estimator agent will generate this value dynamically
+
+    return agent
+
+
+def build_repair_agent():
     """
-    Tool function for the estimator agent to predict goal achievement time.
+    Repair Agent – Small model that writes only the days missing from a coach plan.
+    Much cheaper than regenerating the whole week when one or two days are missing or malformed.
+    """
+    from pydantic_ai import Agent
+    from pydantic_ai.providers.openai import OpenAIProvider
+
+    return Agent(
+        model=repair.REPAIR_MODEL,      # Small model: the output is a few days of text
+        result_type=repair.DayPatch,    # Output type: Entries for the requested days only
+        providers=[OpenAIProvider(api_key=OPENAI_API_KEY)],
+        system_prompt=REPAIR_SYSTEM_PROMPT
+    )
 
-    This function is called by the estimator agent to analyze the fitness plan
-    and predict how many days it will take to reach the weight goal.
 
-    Args:
-        ctx: Run context containing the fitness plan
-        result: The generated fitness plan (workout and diet)
+_AGENT_BUILDERS = {
+    "gpt03_agent": build_coach_agent,
+    "estimator_agent": build_estimator_agent,
+    "repair_agent": build_repair_agent,
+}
+_agents_lock = threading.Lock()
+
+
+def get_agent(name: str):
+    """Return the named agent, building it on first use."""
+    agent = globals().get(name)
+    if agent is None:
+        with _agents_lock:
+            agent = globals().get(name)
+            if agent is None:
+                agent = globals()[name] = _AGENT_BUILDERS[name]()
+    return agent
+
+
+def init_agents():
+    """Build every agent now instead of on the first plan request."""
+    for name in _AGENT_BUILDERS:
+        get_agent(name)
+
+
+def __getattr__(name):
+    # Keeps ``service.gpt03_agent`` / ``service.estimator_agent`` working while building them lazily
+    if name in _AGENT_BUILDERS:
+        return get_agent(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async def _run_coach(user_input: UserInput, db: Session, user_id: int, deadline: Deadline):
+    with observe_stage("coach") as stage:
+        served = await coach_chain.run(get_agent("gpt03_agent"), user_input, user_input, deadline)
+    if served.run is not None:
+        count_retries("coach", served.run)
+        record_run(db, user_id, "coach", served.run, served.elapsed, default_model=served.tier)
+    record_cassette("coach", stage.elapsed, served.output.model_dump(mode="json"))
+    return served
+
+
+async def repair_days(check: "repair.WeekCheck", user_input: UserInput, db: Session, user_id: int,
+                      deadline: Deadline) -> int:
+    """Ask the repair agent for the missing days; return how many were filled."""
+    timeout = repair.REPAIR_TIMEOUT_SECONDS if deadline is None else deadline.bound(repair.REPAIR_TIMEOUT_SECONDS)
+    if timeout <= 0:
+        return 0
+    profile, _ = build_user_context(user_input)
+    started = time.perf_counter()
+    try:
+        run = await asyncio.wait_for(
+            get_agent("repair_agent").run(repair.repair_prompt(check, profile)), timeout
+        )
+    except Exception as e:
+        logger.warning("Targeted plan repair failed, filling days locally: %s", e)
+        return 0
+    record_run(db, user_id, "repair", run, time.perf_counter() - started, default_model=repair.REPAIR_MODEL)
+    return check.apply(run.output)
+
+
+async def complete_coach_output(served, user_input: UserInput, db: Session = None, user_id: int = None,
+                                deadline: Deadline = None):
+    """
+    Turn the coach's draft into a ``CoachResult`` covering every weekday exactly once.
+
+    Only a draft with fewer than ``REPAIR_MIN_VALID_DAYS`` usable days is regenerated;
+    otherwise the missing days are written by the repair agent or filled locally.
 
     Returns:
-        int: Estimated number of days to reach the weight goal
+        tuple: (CoachResult, Served of the coach run that was kept)
     """
-    return 0  # Placeholder - Estimator agent will generate this value dynamically
+    check = repair.check_week(served.output)
+    if check.complete:
+        repair.validation_counter.inc(outcome="valid")
+        return check.result(), served
+
+    with observe_stage("repair"):
+        outcome = "repaired_local"
+        if check.valid_days < repair.REPAIR_MIN_VALID_DAYS:
+            # Too little to build on: the one full retry
+            outcome = "retried"
+            served = await _run_coach(user_input, db, user_id, deadline)
+            check = repair.check_week(served.output)
+        if not check.complete and repair.REPAIR_MODE == "targeted":
+            if await repair_days(check, user_input, db, user_id, deadline) and outcome != "retried":
+                outcome = "repaired_targeted"
+        if not check.complete:
+            check.fill_locally()
+        if not check.complete:
+            # Nothing to copy from (e.g. no diet days at all): use the local plan's days
+            local = local_coach_plan(user_input, user_input)
+            check.apply(repair.DayPatch.model_validate(local.model_dump(mode="json")), method="local")
+    repair.validation_counter.inc(outcome=outcome)
+    return check.result(), served
 
 
-async def run_fitness_pipeline(user_input: UserInput, db: Session = None, user_id: int = None) -> CoachResult:
+async def run_fitness_pipeline(user_input: UserInput, db: Session = None, user_id: int = None,
+                               deadline: Deadline = None) -> CoachResult:
     """
     Orchestrates the complete fitness and diet planning pipeline.
 
     This is the main service function that:
-    1. Generates a personalized 7-day workout plan and diet plan using the coach agent
+    0. Returns a personalized template instead if an approved one matches closely
+    1. Generates a personalized 7-day workout plan and diet plan using the coach agent,
+       repairing any missing or malformed days
     2. Estimates days to reach weight goal using the estimator agent
-    3. Combines the results into a complete fitness plan
+    3. Combines the results into a complete fitness plan with per-day nutrition estimates
     4. Optionally stores the plan in the database for the user
 
     Args:
         user_input: User's fitness data and dietary preferences
         db: Optional database session for storing results
         user_id: Optional user ID for associating plans with a user
+        deadline: Optional request deadline bounding every agent call
 
     Returns:
         CoachResult: Complete fitness plan with workout schedule, diet plan, and goal estimate
+
+    Raises:
+        DeadlineExceeded: If an agent could not finish before the deadline
     """
-    # Step 1: Generate workout and diet recommendations using the coach agent
-    coach_run = await gpt03_agent.run(deps=user_input)
-    coach_result = coach_run.output
-
-    # Step 2: Predict how many days until the user reaches their goal using the estimator agent
-    estimated_run = await estimator_agent.run(deps=coach_result)
-    estimated_days = estimated_run.output
-
-    # Step 3: Combine recommendations with progress estimate to create complete plan
-    coach_result.estimated_days_to_goal = estimated_days
-
-    # Step 4: Store the generated plan in the database if db session and user_id are provided
-    if db and user_id:
-        # Create user plan record with basic information
-        db_plan = UserPlan(
-            user_id=user_id,                                # Link plan to specific user
-            current_weight=user_input.current_weight,       # Store starting weight
-            weight_goal=user_input.weight_goal,             # Store target weight
-            workout_frequency=user_input.workout_frequency, # Store workout frequency
-            estimated_days_to_goal=estimated_days           # Store time estimate
-        )
-        db.add(db_plan)
-        db.flush()  # Get plan ID without committing transaction yet
-
-        # Store each day's workout plan in the database
-        for workout in coach_result.workout_plan:
-            db_workout = DBWorkoutPlan(
-                user_plan_id=db_plan.id,  # Link to parent plan
-                day=workout.day,          # Day of the week
-                activity=workout.activity # Workout details
-            )
-            db.add(db_workout)
-
-        # Store each day's diet plan in the database
-        for diet in coach_result.diet_plan:
-            db_diet = DBDietPlan(
-                user_plan_id=db_plan.id,  # Link to parent plan
-                day=diet.day,             # Day of the week
-                meals=diet.meals          # Meal details
+    pipeline_in_flight_gauge.inc()
+    try:
+        # Step 0: Serve a close match from the template library without calling the models
+        with observe_stage("template"):
+            match = templates.find_template(user_input, db)
+        if match is not None:
+            nutrition.attach_nutrition(match.result)
+            if db and user_id:
+                with observe_stage("db_write"):
+                    store_plan(db, user_id, user_input, match.result, model_tier=templates.TEMPLATE_TIER)
+            elif db:
+                db.commit()
+            return match.result
+
+        # Step 1: Generate workout and diet recommendations using the coach agent,
+        # falling back along the coach model chain if a tier is failing
+        coach_served = await _run_coach(user_input, db, user_id, deadline)
+        # Missing or malformed days are repaired rather than regenerating the whole week
+        coach_result, coach_served = await complete_coach_output(coach_served, user_input, db, user_id, deadline)
+
+        # Step 2: Predict how many days until the user reaches their goal using the estimator agent
+        with observe_stage("estimator") as stage:
+            estimator_served = await estimator_chain.run(
+                get_agent("estimator_agent"), coach_result, user_input, deadline
             )
-            db.add(db_diet)
+        if estimator_served.run is not None:
+            count_retries("estimator", estimator_served.run)
+            record_run(db, user_id, "estimator", estimator_served.run, estimator_served.elapsed,
+                       default_model=estimator_served.tier)
+        estimated_days = estimator_served.output
+        record_cassette("estimator", stage.elapsed, estimated_days)
 
-        # Commit all changes to the database in a single transaction
-        db.commit()
+        # Step 3: Combine recommendations with progress estimate and local nutrition estimates
+        coach_result.estimated_days_to_goal = estimated_days
+        nutrition.attach_nutrition(coach_result)
+
+        # Step 4: Store the generated plan in the database if db session and user_id are provided
+        if db and user_id:
+            with observe_stage("db_write"):
+                if coach_served.run is not None:
+                    # Model-generated plans become template candidates, served once approved
+                    templates.add_candidate(db, user_input, coach_result, coach_served.tier)
+                store_plan(db, user_id, user_input, coach_result, model_tier=coach_served.tier)
+    finally:
+        pipeline_in_flight_gauge.dec()
 
     # Return the complete fitness plan to the caller
     return coach_result
+
+
+def store_plan(db: Session, user_id: int, user_input: UserInput, coach_result: CoachResult,
+               model_tier: str = None) -> UserPlan:
+    """
+    Store a generated plan and its daily workout and diet rows in one transaction.
+
+    Args:
+        db: Database session
+        user_id: Owner of the plan
+        user_input: Input the plan was generated from
+        coach_result: Generated plan including the days-to-goal estimate
+        model_tier: Coach model tier that generated the plan
+
+    Returns:
+        UserPlan: The committed plan record
+    """
+    # Create user plan record with basic information
+    db_plan = UserPlan(
+        user_id=user_id,                                          # Link plan to specific user
+        current_weight=user_input.current_weight,                 # Store starting weight
+        weight_goal=user_input.weight_goal,                       # Store target weight
+        workout_frequency=user_input.workout_frequency,           # Store workout frequency
+        estimated_days_to_goal=coach_result.estimated_days_to_goal,  # Store time estimate
+        model_tier=model_tier                                     # Record which model tier served it
+    )
+    db.add(db_plan)
+    db.flush()  # Get plan ID without committing transaction yet
+
+    # Store each day's workout plan in the database
+    for workout in coach_result.workout_plan:
+        db_workout = DBWorkoutPlan(
+            user_plan_id=db_plan.id,  # Link to parent plan
+            day=workout.day,          # Day of the week
+            activity=workout.activity # Workout details
+        )
+        db.add(db_workout)
+
+    # Store each day's diet plan in the database
+    for diet in coach_result.diet_plan:
+        db_diet = DBDietPlan(
+            user_plan_id=db_plan.id,  # Link to parent plan
+            day=diet.day,             # Day of the week
+            meals=diet.meals          # Meal details
+        )
+        db.add(db_diet)
+
+    # Commit all changes to the database in a single transaction
+    db.commit()
+    return db_plan
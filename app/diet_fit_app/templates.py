@@ -0,0 +1,311 @@
+"""
+templates.py: Library of approved plans served to users with similar profiles.
+
+Many requests describe near-identical profiles ("lose 10 lbs, 3 times a week, no
+restrictions"). Generated plans are kept as template candidates, and once a
+candidate is approved it can be served to a similar request instead of calling
+the coach model. A profile already in the library adds no second candidate, and
+at most ``TEMPLATE_MAX_CANDIDATES`` unapproved candidates are kept: the oldest
+make room for new ones.
+
+Each template is indexed by a feature vector of the ``UserInput`` it came from:
+
+- goal direction (lose, maintain, gain), size of the goal and sessions per week;
+- dietary restriction flags (vegetarian, lactose-free, halal...);
+- cuisine tokens: words from the meal fields, hashed into ``CUISINE_BUCKETS``.
+
+A lookup is one matrix-vector product over all approved templates. Templates with
+a different goal direction or different restriction flags are never served. The
+best remaining match is used if its cosine similarity reaches
+``TEMPLATE_MATCH_THRESHOLD``; otherwise the request goes to the coach model as usual.
+A served template is lightly personalized: workout days are adjusted to the
+requested sessions per week and the days-to-goal estimate is computed locally.
+
+Usage:
+    python -m app.diet_fit_app.templates list
+    python -m app.diet_fit_app.templates approve 12 15
+    python -m app.diet_fit_app.templates revoke 12
+"""
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.orm import Session
+
+from app.core.metrics import REGISTRY
+from app.db.models import PlanTemplate
+from app.diet_fit_app.fallback import _sessions_per_week, fit_sessions, local_estimate
+from app.diet_fit_app.goals import parse_goal
+from app.diet_fit_app.models import CoachResult, UserInput
+
+if TYPE_CHECKING:
+    import numpy as np
+
+TEMPLATES_ENABLED = os.getenv("TEMPLATES_ENABLED", "1") == "1"
+TEMPLATE_COLLECT = os.getenv("TEMPLATE_COLLECT", "1") == "1"
+TEMPLATE_MATCH_THRESHOLD = float(os.getenv("TEMPLATE_MATCH_THRESHOLD", "0.9"))
+TEMPLATE_REFRESH_SECONDS = float(os.getenv("TEMPLATE_REFRESH_SECONDS", "300"))
+TEMPLATE_MAX_CANDIDATES = int(os.getenv("TEMPLATE_MAX_CANDIDATES", "500"))
+TEMPLATE_TIER = "template"
+
+RESTRICTION_FLAGS = {
+    "vegetarian": r"vegetarian|no meat",
+    "vegan": r"vegan|plant[- ]based",
+    "lactose_free": r"lactose|dairy[- ]free|no dairy|no milk",
+    "gluten_free": r"gluten|coeliac|celiac",
+    "halal": r"halal|no pork",
+    "nut_free": r"nut allerg|peanut allerg|no nuts",
+    "pescatarian": r"pescatarian",
+    "low_sugar": r"diabet|low[- ]sugar|no sugar",
+}
+CUISINE_FIELDS = (
+    "typical_breakfast", "typical_lunch", "typical_dinner", "typical_snacks", "favorite_meals", "comfort_foods",
+)
+CUISINE_BUCKETS = 64
+# Largest goal (lbs) distinguished by the magnitude feature
+MAX_GOAL_LBS = 60.0
+# Block weights: the goal block counts as much as all cuisine tokens together
+GOAL_WEIGHT, FLAG_WEIGHT, CUISINE_WEIGHT = 1.0, 1.0, 1.0
+
+# Layout of a feature vector
+DIRECTION, MAGNITUDE, FREQUENCY = 0, 1, 2
+FLAGS = slice(3, 3 + len(RESTRICTION_FLAGS))
+CUISINE = slice(FLAGS.stop, FLAGS.stop + CUISINE_BUCKETS)
+FEATURES = CUISINE.stop
+
+_STOPWORDS = {"with", "and", "the", "for", "some", "usually", "sometimes", "occasionally", "other", "like"}
+_WORD = re.compile(r"[a-z]{3,}")
+_FLAG_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in RESTRICTION_FLAGS.values()]
+
+lookups_counter = REGISTRY.counter("template_lookups_total", "Template library lookups", ["result"])
+match_score_histogram = REGISTRY.histogram(
+    "template_match_score", "Similarity of the best eligible template",
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0),
+)
+library_size_gauge = REGISTRY.gauge("template_library_size", "Approved templates loaded for matching")
+candidates_counter = REGISTRY.counter(
+    "template_candidates_total", "Generated plans offered as template candidates", ["result"]
+)
+
+
+def goal_features(user: UserInput):
+    """
+    Read the goal direction and size from the free-text weight fields.
+
+    Returns:
+        tuple: (direction, pounds) with direction -1 (lose), 0 (maintain) or 1 (gain)
+    """
+    direction, pounds, _ = parse_goal(user.current_weight, user.weight_goal)
+    return direction, pounds
+
+
+def cuisine_tokens(user: UserInput) -> set:
+    """Food words from the meal fields, e.g. {"jollof", "rice", "banku", "tilapia"}."""
+    text = " ".join(getattr(user, field) or "" for field in CUISINE_FIELDS).lower()
+    return {word for word in _WORD.findall(text) if word not in _STOPWORDS}
+
+
+def feature_vector(user: UserInput) -> "np.ndarray":
+    """Raw feature vector of a profile (see the module docstring for the layout)."""
+    # numpy is slow to import, so it is loaded by the first lookup rather than with the app
+    import numpy as np
+
+    vector = np.zeros(FEATURES, dtype=np.float32)
+    direction, pounds = goal_features(user)
+    vector[DIRECTION] = direction
+    vector[MAGNITUDE] = min(pounds, MAX_GOAL_LBS) / MAX_GOAL_LBS
+    vector[FREQUENCY] = _sessions_per_week(user.workout_frequency) / 7
+    vector[FLAGS] = [bool(pattern.search(user.dietary_restrictions or "")) for pattern in _FLAG_PATTERNS]
+    for token in cuisine_tokens(user):
+        vector[CUISINE.start + zlib.crc32(token.encode()) % CUISINE_BUCKETS] = 1.0
+    return vector
+
+
+def _weighted(vectors: "np.ndarray") -> "np.ndarray":
+    """Weight the feature blocks of an (n, FEATURES) array and scale each row to unit length."""
+    import numpy as np
+
+    weighted = vectors.copy()
+    weighted[:, DIRECTION:FREQUENCY + 1] *= GOAL_WEIGHT
+    weighted[:, FLAGS] *= FLAG_WEIGHT
+    cuisine = weighted[:, CUISINE]
+    norms = np.linalg.norm(cuisine, axis=1, keepdims=True)
+    weighted[:, CUISINE] = CUISINE_WEIGHT * np.divide(cuisine, norms, out=np.zeros_like(cuisine), where=norms > 0)
+    norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+    return np.divide(weighted, norms, out=np.zeros_like(weighted), where=norms > 0)
+
+
+class TemplateMatch:
+    """A template chosen for a request, with its similarity score."""
+
+    def __init__(self, template_id: int, score: float, result: CoachResult):
+        self.template_id = template_id
+        self.score = score
+        self.result = result
+
+
+class TemplateLibrary:
+    """
+    Approved templates held in memory as one feature matrix.
+
+    Args:
+        threshold: Minimum cosine similarity for a template to be served
+        refresh_seconds: How long the loaded templates are used before reloading
+    """
+
+    def __init__(self, threshold: float = TEMPLATE_MATCH_THRESHOLD, refresh_seconds: float = TEMPLATE_REFRESH_SECONDS):
+        self.threshold = threshold
+        self.refresh_seconds = refresh_seconds
+        # Arrays once loaded; nothing to match before that
+        self.ids = ()
+        self.raw = None
+        self.matrix = None
+        self.results = []
+        self.loaded_at = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def invalidate(self):
+        """Reload on the next lookup (after templates are approved or revoked)."""
+        self.loaded_at = None
+
+    def load(self, db: Session):
+        import numpy as np
+
+        rows = db.query(PlanTemplate.id, PlanTemplate.features, PlanTemplate.result).filter(
+            PlanTemplate.approved.is_(True)
+        ).all()
+        raw = np.array([json.loads(row.features) for row in rows], dtype=np.float32).reshape(-1, FEATURES)
+        with self._lock:
+            self.ids = np.array([row.id for row in rows], dtype=np.int64)
+            self.raw = raw
+            self.matrix = _weighted(raw)
+            self.results = [row.result for row in rows]
+            self.loaded_at = time.monotonic()
+        library_size_gauge.set(len(rows))
+
+    def ensure_loaded(self, db: Session = None):
+        if db is not None and (self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds):
+            self.load(db)
+
+    def match(self, user: UserInput):
+        """Return the closest eligible template as a ``TemplateMatch``, or None below the threshold."""
+        import numpy as np
+
+        with self._lock:
+            ids, raw, matrix, results = self.ids, self.raw, self.matrix, self.results
+        if not len(ids):
+            lookups_counter.inc(result="miss")
+            return None
+        query = feature_vector(user)
+        eligible = (raw[:, DIRECTION] == query[DIRECTION]) & (raw[:, FLAGS] == query[FLAGS]).all(axis=1)
+        scores = np.where(eligible, matrix @ _weighted(query[None, :])[0], -1.0)
+        best = int(np.argmax(scores))
+        if scores[best] >= 0:
+            match_score_histogram.observe(float(scores[best]))
+        if scores[best] < self.threshold:
+            lookups_counter.inc(result="miss")
+            return None
+        lookups_counter.inc(result="hit")
+        return TemplateMatch(int(ids[best]), float(scores[best]), CoachResult.model_validate_json(results[best]))
+
+
+template_library = TemplateLibrary()
+
+
+def personalize(result: CoachResult, user: UserInput) -> CoachResult:
+    """Adjust a template's workout days to the user's sessions per week and estimate days to goal locally."""
+    result = fit_sessions(result, _sessions_per_week(user.workout_frequency))
+    result.estimated_days_to_goal = local_estimate(result, user)
+    return result
+
+
+def find_template(user: UserInput, db: Session = None):
+    """Return a personalized ``TemplateMatch`` for ``user``, or None if the coach model should run."""
+    if not TEMPLATES_ENABLED:
+        return None
+    template_library.ensure_loaded(db)
+    match = template_library.match(user)
+    if match is None:
+        return None
+    match.result = personalize(match.result, user)
+    if db is not None:
+        db.execute(update(PlanTemplate).where(PlanTemplate.id == match.template_id).values(uses=PlanTemplate.uses + 1))
+    return match
+
+
+def add_candidate(db: Session, user: UserInput, result: CoachResult, source_tier: str):
+    """
+    Add a generated plan as an unapproved template; the caller commits.
+
+    Profiles already in the library are skipped. When ``TEMPLATE_MAX_CANDIDATES``
+    candidates are waiting for review, the oldest ones are dropped to make room.
+    """
+    if not TEMPLATE_COLLECT:
+        return
+    features = json.dumps(feature_vector(user).tolist())
+    if db.query(PlanTemplate.id).filter(PlanTemplate.features == features).first() is not None:
+        candidates_counter.inc(result="duplicate")
+        return
+    unapproved = PlanTemplate.approved.is_not(True)
+    waiting = db.query(func.count(PlanTemplate.id)).filter(unapproved).scalar()
+    if waiting >= TEMPLATE_MAX_CANDIDATES:
+        oldest = [
+            row.id for row in
+            db.query(PlanTemplate.id).filter(unapproved).order_by(PlanTemplate.id)
+            .limit(waiting - TEMPLATE_MAX_CANDIDATES + 1)
+        ]
+        db.execute(delete(PlanTemplate).where(PlanTemplate.id.in_(oldest)))
+        candidates_counter.inc(len(oldest), result="evicted")
+    candidates_counter.inc(result="added")
+    week = result.model_copy(update={"estimated_days_to_goal": 0})
+    db.add(PlanTemplate(
+        features=features,
+        result=week.model_dump_json(),
+        source_tier=source_tier,
+        approved=False,
+        uses=0,
+    ))
+
+
+def set_approved(db: Session, template_ids: list, approved: bool) -> int:
+    """Approve or revoke templates; return how many rows changed."""
+    changed = db.execute(
+        update(PlanTemplate).where(PlanTemplate.id.in_(template_ids)).values(approved=approved)
+    ).rowcount
+    db.commit()
+    template_library.invalidate()
+    return changed
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Review plan templates")
+    parser.add_argument("action", choices=("list", "approve", "revoke"))
+    parser.add_argument("ids", nargs="*", type=int, help="template ids to approve or revoke")
+    args = parser.parse_args()
+
+    from app.db.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        if args.action == "list":
+            for row in db.query(PlanTemplate).order_by(PlanTemplate.id):
+                print(f"{row.id}\t{'approved' if row.approved else 'candidate'}\t{row.source_tier}\tuses={row.uses}")
+        else:
+            changed = set_approved(db, args.ids, args.action == "approve")
+            print(f"{args.action}d {changed} templates")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
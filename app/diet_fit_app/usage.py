@@ -0,0 +1,308 @@
+"""
+usage.py: LLM token usage and cost accounting.
+
+Every agent run in the plan pipeline reports its prompt, completion and cached
+token counts, the model that served it and its latency. Runs are:
+
+- exported as metrics (tokens, cost and model latency by agent and model);
+- buffered in memory and written to ``llm_usage`` in batches, so accounting adds
+  no per-request INSERT to the plan generation path. A background task flushes
+  rows older than ``USAGE_FLUSH_SECONDS`` on quiet workers, and the buffer is
+  flushed at shutdown;
+- aggregated per user for the usage endpoint and for budget enforcement.
+
+Prices are per million tokens and only used for estimates; update ``MODEL_PRICES``
+when provider pricing changes.
+"""
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.auth.dependencies import get_current_user
+from app.core.metrics import REGISTRY
+from app.db.database import get_db
+from app.db.models import LLMUsage, User
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens: (prompt, cached prompt, completion)
+MODEL_PRICES = {
+    "o3": (2.00, 0.50, 8.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+# Per-user budgets over rolling windows (0 disables the budget)
+LLM_USER_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_USER_DAILY_TOKEN_BUDGET", "0"))
+LLM_USER_MONTHLY_COST_BUDGET_USD = float(os.getenv("LLM_USER_MONTHLY_COST_BUDGET_USD", "0"))
+
+# Batched write settings
+USAGE_FLUSH_BATCH_SIZE = int(os.getenv("USAGE_FLUSH_BATCH_SIZE", "50"))
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "10"))
+
+tokens_counter = REGISTRY.counter("llm_tokens_total", "LLM tokens by agent, model and kind", ["agent", "model", "kind"])
+cost_counter = REGISTRY.counter("llm_cost_usd_total", "Estimated LLM cost in USD", ["agent", "model"])
+model_latency_histogram = REGISTRY.histogram(
+    "llm_model_latency_seconds", "Agent run latency by model", ["agent", "model"]
+)
+
+
+def model_price(model: str):
+    """Return (prompt, cached, completion) USD per million tokens, matching dated model names by prefix."""
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model == name or model.startswith(f"{name}-"):
+            return MODEL_PRICES[name]
+    return (0.0, 0.0, 0.0)
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """Estimate the USD cost of a run; cached prompt tokens are billed at the cached rate."""
+    prompt_price, cached_price, completion_price = model_price(model)
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * prompt_price + cached_tokens * cached_price + completion_tokens * completion_price) / 1_000_000
+
+
+def run_model_name(run, default: str = "unknown") -> str:
+    """Return the model name reported by the last response of an agent run."""
+    from pydantic_ai.messages import ModelResponse
+
+    for message in reversed(run.all_messages()):
+        if isinstance(message, ModelResponse) and message.model_name:
+            return message.model_name
+    return default
+
+
+def usage_from_run(agent: str, run, latency_seconds: float, default_model: str = "unknown") -> dict:
+    """
+    Extract a usage row from a pydantic_ai agent run.
+
+    Args:
+        agent: Pipeline agent name ("coach", "estimator")
+        run: Completed agent run result
+        latency_seconds: Wall-clock duration of the run
+        default_model: Model name to use if the responses don't report one
+
+    Returns:
+        dict: Column values for an LLMUsage row (without user_id)
+    """
+    usage = run.usage()
+    details = usage.details or {}
+    prompt_tokens = usage.request_tokens or 0
+    completion_tokens = usage.response_tokens or 0
+    cached_tokens = details.get("cached_tokens", 0)
+    model = run_model_name(run, default_model)
+    return {
+        "agent": agent,
+        "model": model,
+        "requests": usage.requests,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "latency_ms": int(latency_seconds * 1000),
+        "cost_usd": estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens),
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+class UsageRecorder:
+    """
+    In-memory buffer of usage rows written to the database in batches.
+
+    Rows are flushed when ``batch_size`` rows are pending or the oldest pending row
+    is older than ``flush_seconds``, and before usage is read back. Between
+    requests the periodic task started with ``start()`` flushes stale rows.
+    """
+
+    def __init__(self, batch_size: int = USAGE_FLUSH_BATCH_SIZE, flush_seconds: float = USAGE_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._pending = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._task = None
+
+    def record(self, engine, row: dict):
+        """Buffer a usage row destined for ``engine``, flushing if the batch is due."""
+        with self._lock:
+            self._pending.append((engine, row))
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = len(self._pending) >= self.batch_size or time.monotonic() - self._oldest >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def pending_for(self, user_id: int, since: datetime):
+        """Return buffered rows for ``user_id`` created at or after ``since``."""
+        with self._lock:
+            return [row for _, row in self._pending if row["user_id"] == user_id and row["created_at"] >= since]
+
+    def discard(self):
+        """Drop all buffered rows without writing them."""
+        with self._lock:
+            self._pending, self._oldest = [], None
+
+    def flush(self):
+        """Write all buffered rows, one executemany per engine."""
+        with self._lock:
+            pending, self._pending, self._oldest = self._pending, [], None
+        by_engine = {}
+        for engine, row in pending:
+            by_engine.setdefault(engine, []).append(row)
+        for engine, rows in by_engine.items():
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(LLMUsage), rows)
+            except Exception as e:
+                # Usage accounting must never fail a plan request
+                logger.warning("Dropping %d usage rows after write failure: %s", len(rows), e)
+
+    def flush_if_stale(self):
+        """Flush if the oldest pending row is older than ``flush_seconds``."""
+        with self._lock:
+            stale = self._oldest is not None and time.monotonic() - self._oldest >= self.flush_seconds
+        if stale:
+            self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await asyncio.to_thread(self.flush_if_stale)
+
+    def start(self):
+        """Start flushing stale rows in the background."""
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the periodic flush and write everything still buffered (at shutdown)."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(self.flush)
+
+
+usage_recorder = UsageRecorder()
+
+
+def record_run(db: Session, user_id: int, agent: str, run, latency_seconds: float, default_model: str = "unknown") -> dict:
+    """
+    Account for one agent run: update metrics and buffer the row for persistence.
+
+    Rows are only persisted when both ``db`` and ``user_id`` are given.
+    """
+    row = usage_from_run(agent, run, latency_seconds, default_model)
+    labels = {"agent": agent, "model": row["model"]}
+    tokens_counter.inc(row["prompt_tokens"], kind="prompt", **labels)
+    tokens_counter.inc(row["completion_tokens"], kind="completion", **labels)
+    tokens_counter.inc(row["cached_tokens"], kind="cached", **labels)
+    cost_counter.inc(row["cost_usd"], **labels)
+    model_latency_histogram.observe(latency_seconds, **labels)
+    if db is not None and user_id:
+        row["user_id"] = user_id
+        usage_recorder.record(db.get_bind(), row)
+    return row
+
+
+def user_usage_totals(db: Session, user_id: int, since: datetime) -> dict:
+    """
+    Return a user's total tokens and cost since ``since``, including buffered rows.
+    """
+    stored = db.query(
+        func.coalesce(func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens), 0),
+        func.coalesce(func.sum(LLMUsage.cost_usd), 0.0),
+    ).filter(LLMUsage.user_id == user_id, LLMUsage.created_at >= since).one()
+    pending = usage_recorder.pending_for(user_id, since)
+    return {
+        "tokens": int(stored[0]) + sum(row["prompt_tokens"] + row["completion_tokens"] for row in pending),
+        "cost_usd": float(stored[1]) + sum(row["cost_usd"] for row in pending),
+    }
+
+
+def usage_report(db: Session, user_id: int, since: datetime) -> list:
+    """
+    Aggregate a user's usage since ``since`` by agent and model.
+
+    Returns:
+        list: One dict per (agent, model) with run count, token totals, cost and mean latency
+    """
+    usage_recorder.flush()
+    rows = db.query(
+        LLMUsage.agent,
+        LLMUsage.model,
+        func.count(LLMUsage.id),
+        func.sum(LLMUsage.requests),
+        func.sum(LLMUsage.prompt_tokens),
+        func.sum(LLMUsage.completion_tokens),
+        func.sum(LLMUsage.cached_tokens),
+        func.sum(LLMUsage.cost_usd),
+        func.avg(LLMUsage.latency_ms),
+    ).filter(
+        LLMUsage.user_id == user_id,
+        LLMUsage.created_at >= since
+    ).group_by(LLMUsage.agent, LLMUsage.model).order_by(LLMUsage.agent, LLMUsage.model).all()
+    return [
+        {
+            "agent": agent,
+            "model": model,
+            "runs": runs,
+            "requests": int(requests or 0),
+            "prompt_tokens": int(prompt or 0),
+            "completion_tokens": int(completion or 0),
+            "cached_tokens": int(cached or 0),
+            "cost_usd": round(float(cost or 0.0), 6),
+            "avg_latency_ms": round(float(latency or 0.0), 1),
+        }
+        for agent, model, runs, requests, prompt, completion, cached, cost, latency in rows
+    ]
+
+
+def _budget_exceeded(db: Session, user_id: int, now: datetime, window: timedelta, detail: str):
+    # The earliest the budget can free up is when the oldest run in the window ages out
+    since = now - window
+    oldest = db.query(func.min(LLMUsage.created_at)).filter(
+        LLMUsage.user_id == user_id,
+        LLMUsage.created_at >= since
+    ).scalar()
+    if oldest is not None and oldest.tzinfo is None:
+        oldest = oldest.replace(tzinfo=timezone.utc)
+    retry_after = (oldest + window - now) if oldest is not None else window
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after.total_seconds())))}
+    )
+
+
+def check_budget(db: Session, user_id: int):
+    """
+    Refuse a new generation if the user is over a configured budget.
+
+    Raises:
+        HTTPException: 429 when the daily token or monthly cost budget is used up
+    """
+    now = datetime.now(timezone.utc)
+    if LLM_USER_DAILY_TOKEN_BUDGET > 0:
+        day = timedelta(days=1)
+        if user_usage_totals(db, user_id, now - day)["tokens"] >= LLM_USER_DAILY_TOKEN_BUDGET:
+            usage_recorder.flush()
+            _budget_exceeded(db, user_id, now, day, "Daily AI usage budget reached. Please try again later.")
+    if LLM_USER_MONTHLY_COST_BUDGET_USD > 0:
+        month = timedelta(days=30)
+        if user_usage_totals(db, user_id, now - month)["cost_usd"] >= LLM_USER_MONTHLY_COST_BUDGET_USD:
+            usage_recorder.flush()
+            _budget_exceeded(db, user_id, now, month, "Monthly AI usage budget reached. Please try again later.")
+
+
+def enforce_usage_budget(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """FastAPI dependency refusing LLM-backed requests from users over budget."""
+    check_budget(db, current_user.id)
@@ -0,0 +1,229 @@
+"""
+weight_log.py: Weight log time series and trend-based goal estimates.
+
+Weigh-ins are stored in ``weight_entries``, one narrow append-only row each
+(grams as an integer, no update path). Everything is read through the
+``(user_id, recorded_at)`` index:
+
+- entries are added in batches, one executemany per ``WEIGHT_LOG_INSERT_BATCH_SIZE`` rows;
+- charts read a time range either raw or rolled up per day or week, with the
+  rollups grouped in SQL so only one row per period leaves the database;
+- the trend is a weighted least-squares line (NumPy) over the last
+  ``TREND_WINDOW_DAYS`` only, so its cost does not grow with years of history.
+  Recent entries weigh more (half-life ``TREND_HALF_LIFE_DAYS``).
+
+When entries are added, the trend replaces the ``estimated_days_to_goal`` of the
+user's latest plan with a projection from actual progress, without a model call.
+"""
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from app.core.metrics import REGISTRY
+from app.db.models import UserPlan, WeightEntry
+from app.diet_fit_app.goals import KG_TO_LBS
+from app.diet_fit_app.models import WeightEntryIn, WeightUnit
+
+if TYPE_CHECKING:
+    import numpy as np
+
+WEIGHT_LOG_INSERT_BATCH_SIZE = int(os.getenv("WEIGHT_LOG_INSERT_BATCH_SIZE", "500"))
+WEIGHT_LOG_MAX_RAW_POINTS = int(os.getenv("WEIGHT_LOG_MAX_RAW_POINTS", "2000"))
+TREND_WINDOW_DAYS = int(os.getenv("TREND_WINDOW_DAYS", "42"))
+TREND_HALF_LIFE_DAYS = float(os.getenv("TREND_HALF_LIFE_DAYS", "14"))
+TREND_MIN_ENTRIES = int(os.getenv("TREND_MIN_ENTRIES", "4"))
+TREND_MIN_SPAN_DAYS = float(os.getenv("TREND_MIN_SPAN_DAYS", "7"))
+# Within this distance of the target the goal counts as reached
+TREND_GOAL_TOLERANCE_KG = 0.5
+# Projections further out than this are not useful estimates
+TREND_MAX_DAYS = 3650
+
+RESOLUTIONS = ("raw", "day", "week")
+_SECONDS_PER_DAY = 86400.0
+
+entries_counter = REGISTRY.counter("weight_entries_inserted_total", "Weight log entries inserted")
+trend_counter = REGISTRY.counter("weight_trend_fits_total", "Weight trend fits by result", ["result"])
+
+
+def as_utc(value: datetime) -> datetime:
+    # SQLite returns naive datetimes; everything is stored in UTC
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def to_grams(weight: float, unit: WeightUnit) -> int:
+    kg = weight / KG_TO_LBS if unit == WeightUnit.lbs else weight
+    return round(kg * 1000)
+
+
+def add_entries(db: Session, user_id: int, entries: list[WeightEntryIn]) -> int:
+    """
+    Insert weigh-ins in batches (not committed).
+
+    Returns:
+        int: Number of rows inserted
+    """
+    now = datetime.now(timezone.utc)
+    rows = [
+        {
+            "user_id": user_id,
+            "recorded_at": as_utc(entry.recorded_at) if entry.recorded_at else now,
+            "weight_g": to_grams(entry.weight, entry.unit),
+            "note": entry.note,
+        }
+        for entry in entries
+    ]
+    for first in range(0, len(rows), WEIGHT_LOG_INSERT_BATCH_SIZE):
+        db.execute(insert(WeightEntry), rows[first:first + WEIGHT_LOG_INSERT_BATCH_SIZE])
+    entries_counter.inc(len(rows))
+    return len(rows)
+
+
+def _period(db: Session, resolution: str):
+    # Start of the day or (Monday-based) week of each entry, computed by the database
+    if db.get_bind().dialect.name == "postgresql":
+        return func.date_trunc(resolution, WeightEntry.recorded_at)
+    if resolution == "week":
+        return func.date(WeightEntry.recorded_at, "weekday 0", "-6 days")
+    return func.date(WeightEntry.recorded_at)
+
+
+def series(db: Session, user_id: int, start: datetime, end: datetime, resolution: str = "raw") -> list[dict]:
+    """
+    Entries of a user in ``[start, end)``, raw or rolled up per day or week.
+
+    Raw series are capped at ``WEIGHT_LOG_MAX_RAW_POINTS`` entries; use a rollup
+    for longer ranges.
+    """
+    in_range = (
+        WeightEntry.user_id == user_id,
+        WeightEntry.recorded_at >= start,
+        WeightEntry.recorded_at < end,
+    )
+    if resolution == "raw":
+        rows = (
+            db.query(WeightEntry.recorded_at, WeightEntry.weight_g)
+            .filter(*in_range)
+            .order_by(WeightEntry.recorded_at)
+            .limit(WEIGHT_LOG_MAX_RAW_POINTS)
+            .all()
+        )
+        return [
+            {"period": as_utc(at), "weight_kg": grams / 1000, "min_kg": grams / 1000, "max_kg": grams / 1000, "count": 1}
+            for at, grams in rows
+        ]
+    period = _period(db, resolution).label("period")
+    rows = (
+        db.query(
+            period,
+            func.avg(WeightEntry.weight_g),
+            func.min(WeightEntry.weight_g),
+            func.max(WeightEntry.weight_g),
+            func.count(),
+        )
+        .filter(*in_range)
+        .group_by(period)
+        .order_by(period)
+        .all()
+    )
+    return [
+        {
+            "period": as_utc(datetime.fromisoformat(str(start_of_period))),
+            "weight_kg": round(float(average) / 1000, 2),
+            "min_kg": lowest / 1000,
+            "max_kg": highest / 1000,
+            "count": count,
+        }
+        for start_of_period, average, lowest, highest, count in rows
+    ]
+
+
+def fit_trend(days: "np.ndarray", kilograms: "np.ndarray", half_life: float = TREND_HALF_LIFE_DAYS):
+    """
+    Weighted linear fit of weight over time, recent entries weighing more.
+
+    Args:
+        days: Entry times in days, the last one being "now" for the estimate
+        kilograms: Entry weights
+
+    Returns:
+        tuple: (slope in kg per day, trend weight at the last entry)
+    """
+    import numpy as np
+
+    weights = 0.5 ** ((days.max() - days) / half_life)
+    # polyfit weights multiply the residuals, so pass the square root of the sample weights
+    slope, intercept = np.polyfit(days - days.max(), kilograms, 1, w=np.sqrt(weights))
+    return float(slope), float(intercept)
+
+
+def goal_target_kg(plan: UserPlan):
+    """Target weight of a plan that aims to lose or gain, or None."""
+    return plan.target_weight_kg if plan.goal_direction else None
+
+
+def days_to_goal(current_kg: float, slope: float, target_kg: float):
+    """Days until the trend reaches ``target_kg``; None if it is not moving towards it."""
+    remaining = target_kg - current_kg
+    if abs(remaining) <= TREND_GOAL_TOLERANCE_KG:
+        return 0
+    if slope * remaining <= 0:
+        return None
+    days = math.ceil(remaining / slope)
+    return days if days <= TREND_MAX_DAYS else None
+
+
+def trend(db: Session, user_id: int, update_plan: bool = False) -> dict:
+    """
+    Fit the trend of a user's recent entries and project the latest plan's goal.
+
+    With ``update_plan`` the projection is written to the plan's
+    ``estimated_days_to_goal`` (not committed).
+    """
+    # numpy is only loaded once a trend is fitted; it adds noticeably to import time
+    import numpy as np
+
+    now = datetime.now(timezone.utc)
+    rows = (
+        db.query(WeightEntry.recorded_at, WeightEntry.weight_g)
+        .filter(
+            WeightEntry.user_id == user_id,
+            WeightEntry.recorded_at >= now - timedelta(days=TREND_WINDOW_DAYS),
+            # The last entry is "now" for the fit; a future one would extrapolate the current weight
+            WeightEntry.recorded_at <= now,
+        )
+        .all()
+    )
+    result = {"entries": len(rows)}
+    days = np.array([as_utc(at).timestamp() / _SECONDS_PER_DAY for at, _ in rows])
+    kilograms = np.array([grams / 1000 for _, grams in rows])
+    if len(rows) < TREND_MIN_ENTRIES or days.max() - days.min() < TREND_MIN_SPAN_DAYS:
+        trend_counter.inc(result="insufficient_data")
+        return result
+    slope, current = fit_trend(days, kilograms)
+    result.update(current_kg=round(current, 2), slope_kg_per_week=round(slope * 7, 3))
+
+    plan = (
+        db.query(UserPlan)
+        .filter(UserPlan.user_id == user_id)
+        .order_by(UserPlan.created_at.desc(), UserPlan.id.desc())
+        .first()
+    )
+    target = goal_target_kg(plan) if plan else None
+    if target is None:
+        trend_counter.inc(result="no_goal")
+        return result
+    estimate = days_to_goal(current, slope, target)
+    result.update(target_kg=round(target, 2), estimated_days_to_goal=estimate)
+    if estimate is None:
+        trend_counter.inc(result="no_progress")
+    elif update_plan:
+        plan.estimated_days_to_goal = estimate
+        result["plan_id"] = plan.id
+        trend_counter.inc(result="updated")
+    else:
+        trend_counter.inc(result="projected")
+    return result
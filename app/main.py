@@ -2,13 +2,23 @@
 main.py: Entry point for the Fitness And Diet FastAPI application.
 Loads environment variables, initializes the FastAPI app, and includes API routes.
 """
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from dotenv import load_dotenv
 
 from app.diet_fit_app.controller import router as diet_router
+from app.diet_fit_app.cancellation import generations
+from app.diet_fit_app.usage import usage_recorder
 from app.auth.controller import router as auth_router
+from app.core.controller import router as core_router
 from app.db.database import engine
 from app.db import models
+from app.core.compression import CompressionMiddleware
+from app.core.capture import TrafficCaptureMiddleware, configure_capture
+from app.core.warmup import Warmup
+from app.core.profiler import ProfilerMiddleware, install_signal_handler
+from app.core.instrumentation import MetricsMiddleware, ServerTimingMiddleware, install_db_instrumentation
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,8 +27,12 @@ load_dotenv()
 import os
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Create database tables when running normally (skip during tests/import)
-if os.getenv("TEST_MODE") != "1":
+# Record latency of every database statement for /metrics
+install_db_instrumentation()
+
+
+def create_tables():
+    """Create any missing database tables, reporting connection problems."""
     try:
         models.Base.metadata.create_all(bind=engine)
     except Exception as e:
@@ -29,14 +43,75 @@ if os.getenv("TEST_MODE") != "1":
             print("\033[93mContinuing without database connection...\033[0m\n")
         else:
             print("\033[93mExiting due to database connection error.\033[0m\n")
-            exit(1)
+            raise SystemExit(1)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application startup and shutdown.
+
+    Schema creation and the AI agents (which import pydantic_ai, openai and the
+    provider SDKs) are set up here rather than at import time, so importing the
+    app stays fast. The agents are built by the background warm-up, alongside
+    the database pool, schemas and auth paths; /health/ready reports ready once
+    it finishes. Both are skipped in test mode.
+
+    Buffered LLM usage rows are flushed periodically in the background. At
+    shutdown, plan generations still running are given
+    GENERATION_SHUTDOWN_DEADLINE_SECONDS to finish and are then cancelled, and
+    the usage rows they recorded are written before the process exits.
+    """
+    app.state.warmup = Warmup(app)
+    if os.getenv("TEST_MODE") != "1":
+        create_tables()
+        app.state.warmup.start()
+    else:
+        app.state.warmup.mark_ready()
+    usage_recorder.start()
+    yield
+    await app.state.warmup.stop()
+    await generations.drain()
+    await usage_recorder.stop()
+
 
 # Initialize FastAPI application
-app = FastAPI(title="Fitness And Diet App")
+app = FastAPI(title="Fitness And Diet App", lifespan=lifespan)
+
+# Count queries and time LLM stages per request (Server-Timing header + structured log line)
+app.add_middleware(ServerTimingMiddleware, emit_header=os.getenv("SERVER_TIMING_HEADER", "1") == "1")
+
+# Compress responses for clients that accept it (plan payloads are large, repetitive text)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "500")),
+    gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+    brotli_level=int(os.getenv("COMPRESSION_BROTLI_LEVEL", "4")),
+    zstd_level=int(os.getenv("COMPRESSION_ZSTD_LEVEL", "3")),
+)
+
+# Opt-in capture of sanitized traffic shapes and LLM cassettes for replay benchmarks
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH")
+if TRAFFIC_CAPTURE_PATH:
+    app.add_middleware(
+        TrafficCaptureMiddleware,
+        writer=configure_capture(TRAFFIC_CAPTURE_PATH, os.getenv("TRAFFIC_CAPTURE_CASSETTES")),
+        sample_rate=float(os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "1")),
+    )
+
+# Count requests towards on-demand profiling sessions (inert unless a session is running)
+app.add_middleware(ProfilerMiddleware)
+PROFILER_SIGNAL_DIR = os.getenv("PROFILER_SIGNAL_DIR")
+if PROFILER_SIGNAL_DIR:
+    install_signal_handler(app, PROFILER_SIGNAL_DIR, seconds=float(os.getenv("PROFILER_SIGNAL_SECONDS", "30")))
+
+# Record per-route latency for /metrics (outermost, so it includes compression)
+app.add_middleware(MetricsMiddleware)
 
 # Mount API routes
 app.include_router(auth_router, prefix="/auth")
 app.include_router(diet_router, prefix="/api")
+app.include_router(core_router)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,6 @@
+"""
+Benchmark package for the Diet Fitness application.
+
+Benchmarks are standalone scripts run with ``python -m benchmarks.<name>``; they
+are not collected by pytest.
+"""
@@ -0,0 +1,141 @@
+"""
+Compression benchmark for plan payloads.
+
+Builds realistic ``/api/my-plans`` response bodies (lists of 7-day CoachResults
+with verbose meal and activity text) and reports, for every available encoding
+and level, the bytes on the wire, the compression ratio and the CPU cost per
+response.
+
+Usage:
+    python -m benchmarks.bench_compression --plans 1 5 20 --repeat 50
+    python -m benchmarks.bench_compression --json results.json
+"""
+import argparse
+import json
+import time
+
+from app.core.compression import available_compressors
+from app.diet_fit_app.models import CoachResult, Weekday
+
+# Level ranges worth comparing for each encoding
+LEVELS = {
+    "gzip": [1, 3, 6, 9],
+    "br": [1, 4, 6, 9, 11],
+    "zstd": [1, 3, 6, 12, 19],
+}
+
+MEALS = [
+    "Breakfast: Hausa koko with a small portion of koose and a boiled egg. "
+    "Lunch: Jollof rice (1 cup) with grilled chicken, skin removed, and a side salad. "
+    "Dinner: Light soup with a fist-sized ball of fufu and lean goat meat. "
+    "Snacks: An orange or a small handful of unsalted groundnuts.",
+    "Breakfast: Tea with whole grain bread and two boiled eggs. "
+    "Lunch: Banku (small portion) with okra stew and grilled tilapia. "
+    "Dinner: Boiled yam with palava sauce, keeping the palm oil light. "
+    "Snacks: Pawpaw slices or a cup of plain yogurt.",
+    "Breakfast: Oatmeal with sliced banana and a teaspoon of honey. "
+    "Lunch: Red red (bean stew) with a small portion of plantain, baked rather than fried. "
+    "Dinner: Waakye with a boiled egg, vegetable stew and no gari. "
+    "Snacks: Kelewele in a small portion, baked in the oven.",
+]
+
+ACTIVITIES = [
+    "Warm up with 10 minutes of brisk walking, then 30 minutes of moderate cardio "
+    "(jogging or cycling), followed by 15 minutes of core work: planks, bicycle crunches "
+    "and leg raises, 3 sets of 12 each. Cool down with 5 minutes of stretching.",
+    "Full-body strength session: squats, push-ups, lunges and dumbbell rows, 3 sets of "
+    "10-12 repetitions with 60 seconds of rest between sets. Finish with 10 minutes of "
+    "light stretching focusing on hamstrings, hips and shoulders.",
+    "Active recovery day: a 30-minute walk at a comfortable pace and 15 minutes of yoga "
+    "or mobility work. Stay hydrated and aim for at least 7 hours of sleep.",
+]
+
+
+def build_payload(plan_count: int) -> bytes:
+    """
+    Build a JSON body equivalent to a ``/api/my-plans`` response.
+
+    Args:
+        plan_count: Number of stored plans in the response
+
+    Returns:
+        bytes: Serialized response body
+    """
+    plans = []
+    for index in range(plan_count):
+        days = list(Weekday)
+        plans.append(CoachResult(
+            workout_plan=[
+                {"day": day, "activity": ACTIVITIES[(index + offset) % len(ACTIVITIES)]}
+                for offset, day in enumerate(days)
+            ],
+            diet_plan=[
+                {"day": day, "meals": MEALS[(index + offset) % len(MEALS)]}
+                for offset, day in enumerate(days)
+            ],
+            estimated_days_to_goal=30 + index,
+        ).model_dump(mode="json"))
+    return json.dumps(plans).encode()
+
+
+def measure(compressor_cls, level: int, payload: bytes, repeat: int) -> dict:
+    """
+    Compress ``payload`` ``repeat`` times and return size and timing figures.
+
+    Args:
+        compressor_cls: Compressor class from ``app.core.compression``
+        level: Compression level to use
+        payload: Uncompressed response body
+        repeat: Number of timed iterations
+
+    Returns:
+        dict: Compressed size, ratio and mean CPU time per response in microseconds
+    """
+    compressed = b""
+    start = time.process_time()
+    for _ in range(repeat):
+        compressor = compressor_cls(level)
+        compressed = compressor.compress(payload) + compressor.finish()
+    elapsed = time.process_time() - start
+    return {
+        "compressed_bytes": len(compressed),
+        "ratio": round(len(payload) / len(compressed), 2),
+        "cpu_us": round(elapsed / repeat * 1_000_000, 1),
+    }
+
+
+def run(plan_counts, repeat: int) -> list:
+    """Run the benchmark matrix and return one result row per combination."""
+    results = []
+    compressors = available_compressors()
+    for plan_count in plan_counts:
+        payload = build_payload(plan_count)
+        for encoding, compressor_cls in compressors.items():
+            for level in LEVELS[encoding]:
+                row = {"plans": plan_count, "raw_bytes": len(payload), "encoding": encoding, "level": level}
+                row.update(measure(compressor_cls, level, payload, repeat))
+                results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark response compression on plan payloads")
+    parser.add_argument("--plans", type=int, nargs="+", default=[1, 5, 20], help="plans per response")
+    parser.add_argument("--repeat", type=int, default=50, help="timed iterations per combination")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.plans, args.repeat)
+    print(f"{'plans':>5} {'raw':>8} {'enc':>5} {'lvl':>4} {'wire':>8} {'ratio':>6} {'cpu_us':>9}")
+    for row in results:
+        print(
+            f"{row['plans']:>5} {row['raw_bytes']:>8} {row['encoding']:>5} {row['level']:>4} "
+            f"{row['compressed_bytes']:>8} {row['ratio']:>6} {row['cpu_us']:>9}"
+        )
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
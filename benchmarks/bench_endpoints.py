@@ -0,0 +1,290 @@
+"""
+Load and latency benchmark for the HTTP API.
+
+Boots the application in-process against a temporary SQLite database with both
+AI agents replaced by local stubs, then drives the user journey at a
+configurable concurrency. Each virtual user repeatedly runs:
+
+    signup -> login -> fitness-plan -> my-plans -> export -> update -> delete
+
+(``export`` looks up the new plan's id, which ``my-plans`` does not return.)
+Throughput and p50/p95/p99 latency are reported per endpoint. Results can be
+written as JSON and compared against a stored baseline; the exit status is 1
+if any endpoint regressed beyond the tolerance.
+
+Usage:
+    python -m benchmarks.bench_endpoints --users 20 --iterations 5
+    python -m benchmarks.bench_endpoints --json results.json
+    python -m benchmarks.bench_endpoints --baseline baseline.json --tolerance 0.25
+"""
+import os
+
+# Use the test-mode database fallback so importing the app needs no DATABASE_URL
+os.environ.setdefault("TEST_MODE", "1")
+
+import argparse
+import asyncio
+import json
+import math
+import platform
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import httpx
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.core import admission
+from app.db.database import Base, get_db
+from app.diet_fit_app import service
+from app.diet_fit_app.models import Weekday
+from app.main import app
+
+OPERATIONS = ("signup", "login", "fitness-plan", "my-plans", "export", "update", "delete")
+PERCENTILES = (50, 95, 99)
+
+USER_INPUT = {
+    "typical_breakfast": "Hausa koko with koose, tea with bread and eggs",
+    "typical_lunch": "Jollof rice with fried chicken, Banku with okra stew",
+    "typical_dinner": "Waakye with gari and spaghetti, Light soup with fufu",
+    "typical_snacks": "Fruits, nuts, kelewele",
+    "dietary_restrictions": "No specific restrictions",
+    "favorite_meals": "Jollof rice with chicken, Banku with tilapia",
+    "comfort_foods": "Kelewele, Waakye, Fufu with palm nut soup",
+    "eating_out_frequency": "Once a week",
+    "eating_out_choices": "Local restaurants serving traditional Ghanaian dishes",
+    "current_weight": "190 lbs",
+    "weight_goal": "Lose 15 lbs (target: 175 lbs)",
+    "workout_frequency": "Workout 3 times per week",
+}
+
+
+def stub_coach_args() -> dict:
+    """Return a full 7-day plan in the shape the coach agent produces."""
+    return {
+        "workout_plan": [
+            {"day": day.value, "activity": "Warm up for 10 minutes, then 30 minutes of brisk walking and core work."}
+            for day in Weekday
+        ],
+        "diet_plan": [
+            {"day": day.value, "meals": "Breakfast: Oatmeal. Lunch: Jollof rice with grilled chicken. "
+                                        "Dinner: Light soup with a small ball of fufu."}
+            for day in Weekday
+        ],
+        "estimated_days_to_goal": 0,
+    }
+
+
+@contextmanager
+def stubbed_app(database_url: str, llm_latency: float = 0.0, coach=None, estimator=None):
+    """
+    Point the app at ``database_url`` and stub the AI agents for the duration.
+
+    By default the stubs sleep ``llm_latency`` seconds per call to model provider
+    latency without doing any work; ``coach`` and ``estimator`` replace them with
+    other ``FunctionModel`` functions. Per-user rate limits are disabled so the
+    benchmark measures the server, not the limiter; admission control stays in place.
+    """
+    engine = create_engine(database_url, connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def bench_get_db():
+        db = session_factory()
+        try:
+            db.execute(text("SELECT 1"))
+            yield db
+        finally:
+            db.close()
+
+    async def default_coach(messages, info):
+        await asyncio.sleep(llm_latency)
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, stub_coach_args())])
+
+    async def default_estimator(messages, info):
+        await asyncio.sleep(llm_latency)
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"response": 60})])
+
+    previous_overrides = dict(app.dependency_overrides)
+    previous_rate = admission.llm_rate_limiter.rate
+    app.dependency_overrides[get_db] = bench_get_db
+    admission.llm_rate_limiter.rate = 0
+    try:
+        with service.gpt03_agent.override(model=FunctionModel(coach or default_coach)), \
+                service.estimator_agent.override(model=FunctionModel(estimator or default_estimator)):
+            yield
+    finally:
+        app.dependency_overrides = previous_overrides
+        admission.llm_rate_limiter.rate = previous_rate
+        engine.dispose()
+
+
+async def timed(samples: dict, operation: str, request):
+    """Await ``request``, record its latency under ``operation`` and return the response."""
+    started = time.perf_counter()
+    response = await request
+    samples[operation].append((time.perf_counter() - started, response.status_code < 400))
+    return response
+
+
+async def user_journey(client: httpx.AsyncClient, samples: dict, iterations: int):
+    """Run the full journey ``iterations`` times as a fresh user each time."""
+    for _ in range(iterations):
+        name = f"bench_{uuid.uuid4().hex[:12]}"
+        password = "bench-password"
+        await timed(samples, "signup", client.post(
+            "/auth/signup", json={"username": name, "email": f"{name}@example.com", "password": password}
+        ))
+        login = await timed(samples, "login", client.post(
+            "/auth/login", data={"username": name, "password": password}
+        ))
+        if login.status_code != 200:
+            continue
+        headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+        await timed(samples, "fitness-plan", client.post("/api/fitness-plan", json=USER_INPUT, headers=headers))
+        await timed(samples, "my-plans", client.get("/api/my-plans", headers=headers))
+        export = await timed(samples, "export", client.get("/api/my-plans/export", headers=headers))
+        lines = export.text.splitlines() if export.status_code == 200 else []
+        if not lines:
+            continue
+        plan_id = json.loads(lines[-1])["id"]
+        await timed(samples, "update", client.put(
+            f"/api/my-plans/{plan_id}", json={"current_weight": "188 lbs"}, headers=headers
+        ))
+        await timed(samples, "delete", client.delete(f"/api/my-plans/{plan_id}", headers=headers))
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def endpoint_stats(samples: list, elapsed: float) -> dict:
+    """Statistics for one endpoint's (latency, ok) samples (latencies in ms)."""
+    latencies = sorted(latency for latency, _ in samples)
+    stats = {
+        "requests": len(latencies),
+        "errors": sum(1 for _, ok in samples if not ok),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+    }
+    for pct in PERCENTILES:
+        stats[f"p{pct}_ms"] = round(percentile(latencies, pct) * 1000, 2)
+    return stats
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    """Turn raw (latency, ok) samples per endpoint into the results document."""
+    endpoints = {operation: endpoint_stats(operation_samples, elapsed) for operation, operation_samples in samples.items()}
+    total = sum(stats["requests"] for stats in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "total_errors": sum(stats["errors"] for stats in endpoints.values()),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def run(users: int, iterations: int, llm_latency: float = 0.05, database_url: str = None) -> dict:
+    """
+    Run the benchmark and return the results document.
+
+    Args:
+        users: Concurrent virtual users
+        iterations: Journeys per virtual user
+        llm_latency: Simulated seconds per stubbed agent call
+        database_url: SQLite URL to use; a temporary file database by default
+
+    Returns:
+        dict: Configuration, environment and per-endpoint statistics
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        url = database_url or f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+        async def drive():
+            samples = {operation: [] for operation in OPERATIONS}
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                started = time.perf_counter()
+                await asyncio.gather(*(user_journey(client, samples, iterations) for _ in range(users)))
+                return samples, time.perf_counter() - started
+
+        with stubbed_app(url, llm_latency):
+            samples, elapsed = asyncio.run(drive())
+
+    results = summarize(samples, elapsed)
+    results["config"] = {"users": users, "iterations": iterations, "llm_latency_s": llm_latency}
+    results["environment"] = {"python": platform.python_version(), "platform": platform.platform()}
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare results with a baseline run.
+
+    An endpoint regresses if its p95 latency grew, or its throughput dropped, by
+    more than ``tolerance`` (a fraction), or if it now has errors.
+
+    Returns:
+        list: Human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+    for operation, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(operation)
+        if not previous:
+            continue
+        if previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{operation}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{operation}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{operation}: errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API throughput and latency with a stubbed LLM")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=3, help="journeys per virtual user")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="simulated seconds per agent call")
+    parser.add_argument("--database-url", help="SQLite URL (default: temporary file database)")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    results = run(args.users, args.iterations, args.llm_latency, args.database_url)
+    print(f"{'endpoint':>12} {'reqs':>6} {'errs':>5} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for operation, stats in results["endpoints"].items():
+        print(
+            f"{operation:>12} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+            f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}"
+        )
+    print(f"{results['total_requests']} requests in {results['elapsed_s']}s ({results['throughput_rps']} req/s)")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
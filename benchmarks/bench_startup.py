@@ -0,0 +1,142 @@
+"""
+Startup-time benchmark.
+
+Starts fresh interpreters and measures, for each:
+
+- ``import_ms``: time to ``import app.main``;
+- ``startup_ms``: time to run the application lifespan (schema creation, agents);
+- ``first_request_ms``: latency of the first request once started;
+- ``time_to_first_request_ms``: the sum, i.e. what a cold worker costs before it
+  serves anything.
+
+It also lists which heavy modules (pydantic_ai, openai, pyarrow, numpy...) were
+already imported by ``import app.main``; they should only load during startup.
+The app runs against a temporary SQLite database with a dummy OpenAI key, so no
+network access is needed.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --json startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Modules that must not be imported by ``import app.main``
+HEAVY_MODULES = ("pydantic_ai", "openai", "pyarrow", "numpy", "google.generativeai")
+
+PROBE = r"""
+import asyncio, json, sys, time
+import httpx
+
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def serve():
+    async with app.main.app.router.lifespan_context(app.main.app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://startup") as client:
+            response = await client.get("/metrics")
+        return ready, time.perf_counter(), response.status_code
+
+ready, served, status = asyncio.run(serve())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_request_ms": (served - ready) * 1000,
+    "time_to_first_request_ms": (served - started) * 1000,
+    "status": status,
+    "heavy_modules_at_import": HEAVY_AT_IMPORT,
+}))
+"""
+
+METRICS = ("import_ms", "startup_ms", "first_request_ms", "time_to_first_request_ms")
+
+
+def probe_source() -> str:
+    """Return the probe script with the heavy-module check spliced in after the import."""
+    check = f"[m for m in {HEAVY_MODULES!r} if m in sys.modules]"
+    return PROBE.replace(
+        "imported = time.perf_counter()\n",
+        f"imported = time.perf_counter()\nHEAVY_AT_IMPORT = {check}\n",
+    )
+
+
+def measure_once(workdir: str) -> dict:
+    """Run the probe in a fresh interpreter and return its measurements."""
+    env = dict(os.environ)
+    env.pop("TEST_MODE", None)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY") or "sk-startup-benchmark",
+        "JWT_SECRET_KEY": env.get("JWT_SECRET_KEY") or "startup-benchmark",
+        "PYTHONWARNINGS": "ignore",
+    })
+    output = subprocess.run(
+        [sys.executable, "-c", probe_source()],
+        env=env, capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs: int = 5) -> dict:
+    """Measure ``runs`` cold starts and return medians plus the raw samples."""
+    with tempfile.TemporaryDirectory() as workdir:
+        samples = [measure_once(workdir) for _ in range(runs)]
+    results = {metric: round(statistics.median(s[metric] for s in samples), 1) for metric in METRICS}
+    results["heavy_modules_at_import"] = sorted({m for s in samples for m in s["heavy_modules_at_import"]})
+    results["runs"] = runs
+    results["samples"] = samples
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return regressions: any metric slower than the baseline by more than ``tolerance``."""
+    regressions = []
+    for metric in METRICS:
+        previous = baseline.get(metric)
+        if previous and results[metric] > previous * (1 + tolerance):
+            regressions.append(f"{metric}: {previous}ms -> {results[metric]}ms")
+    if results["heavy_modules_at_import"]:
+        regressions.append(f"heavy modules imported by app.main: {', '.join(results['heavy_modules_at_import'])}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark import time and time to first request")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to measure")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    for metric in METRICS:
+        print(f"{metric:>26} {results[metric]:>9.1f}")
+    print(f"{'heavy modules at import':>26} {', '.join(results['heavy_modules_at_import']) or '-'}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    elif results["heavy_modules_at_import"]:
+        regressions = compare(results, {}, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Replay captured traffic and compare latency distributions between builds.
+
+Reads a capture written by ``TrafficCaptureMiddleware`` (see ``app/core/capture.py``)
+and re-issues every request at its original offset, divided by ``--speed``
+(1 = real time, 10 = ten times faster). Requests are open-loop: each one starts
+on schedule whether or not earlier ones have finished, like real traffic.
+
+Sanitized bodies are re-inflated with filler text of the recorded lengths. Each
+captured client gets its own replay user, created before the clock starts;
+signup, login and account deletion run with fresh synthetic users, and
+``{plan_id}`` routes act on the client's most recent plan.
+
+By default the app runs in-process against a temporary SQLite database and the
+AI agents play back the capture's cassettes, with the recorded model latency
+multiplied by ``--llm-latency-scale``. With ``--url`` the capture is replayed
+against a running instance instead, using whatever model backend it has.
+
+Usage:
+    python -m benchmarks.replay_traffic capture.jsonl --speed 10 --json replay.json
+    python -m benchmarks.replay_traffic capture.jsonl --speed 10 --baseline replay.json
+    python -m benchmarks.replay_traffic capture.jsonl --url http://127.0.0.1:8000
+"""
+import os
+
+# Use the test-mode database fallback so importing the app needs no DATABASE_URL
+os.environ.setdefault("TEST_MODE", "1")
+
+import argparse
+import asyncio
+import contextvars
+import itertools
+import json
+import re
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+
+from benchmarks.bench_endpoints import compare, endpoint_stats, stub_coach_args, stubbed_app, summarize
+from app.main import app
+
+FILLER = "jollof rice with grilled chicken and a side of kontomire stew "
+PLAN_ROUTES = re.compile(r"\{plan_id\}")
+
+# Id of the captured request being replayed, so the agent stubs find its cassette
+_replaying = contextvars.ContextVar("replaying", default=None)
+
+
+def load_jsonl(path: str) -> list:
+    """Read a JSONL file, skipping blank lines."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def materialize(shape):
+    """Turn a sanitized body shape back into a concrete value of the same size."""
+    if isinstance(shape, str) and shape.startswith("$str:"):
+        length = int(shape[5:])
+        return (FILLER * (length // len(FILLER) + 1))[:length]
+    if isinstance(shape, dict):
+        return {key: materialize(value) for key, value in shape.items()}
+    if isinstance(shape, list):
+        return [materialize(value) for value in shape]
+    return shape
+
+
+class CassettePlayer:
+    """
+    Agent stubs serving recorded outputs.
+
+    The cassette recorded for the request being replayed is used when there is
+    one; otherwise recorded outputs for the agent are served round robin.
+    """
+
+    def __init__(self, cassettes: list, latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self.by_request = {(c["request_id"], c["agent"]): c for c in cassettes}
+        self.rotation = {
+            agent: itertools.cycle([c for c in cassettes if c["agent"] == agent])
+            for agent in {c["agent"] for c in cassettes}
+        }
+
+    def _next(self, agent: str):
+        cassette = self.by_request.get((_replaying.get(), agent))
+        if cassette is None and agent in self.rotation:
+            cassette = next(self.rotation[agent])
+        return cassette
+
+    async def coach(self, messages, info):
+        cassette = self._next("coach")
+        if cassette is not None:
+            await asyncio.sleep(cassette["latency_ms"] / 1000 * self.latency_scale)
+        output = cassette["output"] if cassette is not None else stub_coach_args()
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, output)])
+
+    async def estimator(self, messages, info):
+        cassette = self._next("estimator")
+        if cassette is not None:
+            await asyncio.sleep(cassette["latency_ms"] / 1000 * self.latency_scale)
+        output = cassette["output"] if cassette is not None else 60
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"response": output})])
+
+
+class Replayer:
+    """Issues captured requests on behalf of replay users and records their latency."""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.tokens = {}
+        self.samples = {}
+        self.skipped = 0
+
+    async def create_user(self):
+        """Sign up and log in a fresh user (untimed); return (username, password, token)."""
+        name = f"replay_{uuid.uuid4().hex[:12]}"
+        password = "replay-password"
+        await self.client.post("/auth/signup", json={"username": name, "email": f"{name}@example.com", "password": password})
+        login = await self.client.post("/auth/login", data={"username": name, "password": password})
+        return name, password, login.json().get("access_token")
+
+    async def setup(self, records: list):
+        """Create one replay user per captured client, plus one for anonymous logins."""
+        clients = {record["client"] for record in records if record["client"]} | {None}
+        users = await asyncio.gather(*(self.create_user() for _ in clients))
+        self.tokens = dict(zip(clients, users))
+
+    async def latest_plan_id(self, headers: dict):
+        export = await self.client.get("/api/my-plans/export", headers=headers)
+        lines = export.text.splitlines() if export.status_code == 200 else []
+        return json.loads(lines[-1])["id"] if lines else None
+
+    async def issue(self, record: dict):
+        """Replay one captured request."""
+        _replaying.set(record["id"])
+        key = f"{record['method']} {record['route']}"
+        route = record["route"]
+        headers = {}
+        if record.get("accept_encoding"):
+            headers["Accept-Encoding"] = record["accept_encoding"]
+        if record.get("idempotency_key"):
+            headers["Idempotency-Key"] = f"replay-{record['idempotency_key']}"
+        kwargs = {"params": record.get("query") or None}
+        body = materialize(record.get("body"))
+        if isinstance(body, dict) and "$bytes" in body:
+            body = None
+
+        if route == "/auth/signup":
+            name = f"replay_{uuid.uuid4().hex[:12]}"
+            kwargs["json"] = {"username": name, "email": f"{name}@example.com", "password": "replay-password"}
+        elif route == "/auth/login":
+            name, password, _ = self.tokens[None]
+            kwargs["data"] = {"username": name, "password": password}
+        elif route == "/auth/users/me":
+            _, _, token = await self.create_user()
+            headers["Authorization"] = f"Bearer {token}"
+        else:
+            if record.get("client"):
+                headers["Authorization"] = f"Bearer {self.tokens[record['client']][2]}"
+            if body is not None:
+                kwargs["json"] = body
+            if PLAN_ROUTES.search(route):
+                plan_id = await self.latest_plan_id(headers)
+                if plan_id is None:
+                    self.skipped += 1
+                    return
+                route = PLAN_ROUTES.sub(str(plan_id), route)
+
+        started = time.perf_counter()
+        response = await self.client.request(record["method"], route, headers=headers, **kwargs)
+        # A replayed request "fails" if it errors where the original did not
+        ok = response.status_code < 400 or response.status_code == record["status"]
+        self.samples.setdefault(key, []).append((time.perf_counter() - started, ok))
+
+
+async def replay(client: httpx.AsyncClient, records: list, speed: float):
+    """Replay ``records`` on their original schedule divided by ``speed``."""
+    replayer = Replayer(client)
+    await replayer.setup(records)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    first_ts = records[0]["ts"] if records else 0.0
+
+    async def scheduled(record):
+        delay = (record["ts"] - first_ts) / speed - (loop.time() - start)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await replayer.issue(record)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(asyncio.create_task(scheduled(record)) for record in records))
+    return replayer, time.perf_counter() - started
+
+
+def captured_stats(records: list) -> dict:
+    """Latency statistics of the original capture, in the same layout as a replay."""
+    samples = {}
+    for record in records:
+        key = f"{record['method']} {record['route']}"
+        samples.setdefault(key, []).append((record["duration_ms"] / 1000, record["status"] < 400))
+    span = records[-1]["ts"] - records[0]["ts"] if len(records) > 1 else 0.0
+    return {key: endpoint_stats(values, span) for key, values in samples.items()}
+
+
+def run(capture_path: str, speed: float = 1.0, cassette_path: str = None, url: str = None,
+        llm_latency_scale: float = 1.0) -> dict:
+    """
+    Replay a capture and return the results document.
+
+    Args:
+        capture_path: JSONL written by TrafficCaptureMiddleware
+        speed: Replay speed multiplier (1 = original pace)
+        cassette_path: LLM cassettes (default ``<capture_path>.cassettes`` if it exists)
+        url: Replay against this running instance instead of in-process
+        llm_latency_scale: Multiplier for recorded model latency during in-process playback
+
+    Returns:
+        dict: Replay statistics per endpoint, the original statistics and skipped count
+    """
+    records = sorted(load_jsonl(capture_path), key=lambda record: record["ts"])
+    cassette_path = cassette_path or f"{capture_path}.cassettes"
+    cassettes = load_jsonl(cassette_path) if os.path.exists(cassette_path) else []
+
+    if url:
+        async def drive():
+            async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+                return await replay(client, records, speed)
+
+        replayer, elapsed = asyncio.run(drive())
+    else:
+        player = CassettePlayer(cassettes, llm_latency_scale)
+        with tempfile.TemporaryDirectory() as tmp:
+            async def drive():
+                transport = httpx.ASGITransport(app=app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://replay", timeout=None) as client:
+                    return await replay(client, records, speed)
+
+            with stubbed_app(f"sqlite:///{os.path.join(tmp, 'replay.db')}", coach=player.coach,
+                             estimator=player.estimator):
+                replayer, elapsed = asyncio.run(drive())
+
+    results = summarize(replayer.samples, elapsed)
+    results["skipped"] = replayer.skipped
+    results["captured"] = captured_stats(records) if records else {}
+    results["config"] = {"capture": capture_path, "speed": speed, "url": url, "cassettes": len(cassettes)}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic and report latency distributions")
+    parser.add_argument("capture", help="capture JSONL written by TrafficCaptureMiddleware")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed multiplier (1 = real time)")
+    parser.add_argument("--cassettes", help="LLM cassettes (default: <capture>.cassettes)")
+    parser.add_argument("--url", help="replay against a running instance instead of in-process")
+    parser.add_argument("--llm-latency-scale", type=float, default=1.0, help="multiplier for recorded model latency")
+    parser.add_argument("--json", dest="json_path", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against replay results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression as a fraction")
+    args = parser.parse_args()
+
+    results = run(args.capture, args.speed, args.cassettes, args.url, args.llm_latency_scale)
+    print(f"{'endpoint':>32} {'reqs':>6} {'errs':>5} {'p50':>9} {'p95':>9} {'p99':>9} {'orig p95':>9}")
+    for key, stats in sorted(results["endpoints"].items()):
+        original = results["captured"].get(key, {})
+        print(
+            f"{key:>32} {stats['requests']:>6} {stats['errors']:>5} {stats['p50_ms']:>9} "
+            f"{stats['p95_ms']:>9} {stats['p99_ms']:>9} {original.get('p95_ms', '-'):>9}"
+        )
+    print(f"{results['total_requests']} requests replayed in {results['elapsed_s']}s, {results['skipped']} skipped")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,7 @@ from sqlalchemy import pool
 from alembic import context
 # Import Base and all models to ensure they're included in Base.metadata
 # This is essential for Alembic to detect model changes for migrations
-from app.db.models import Base, User, UserPlan, WorkoutPlan, DietPlan
+from app.db.models import Base, User, UserPlan, WorkoutPlan, DietPlan, IdempotencyKey, LLMUsage
 from app.db.database import engine
 import os
 from dotenv import load_dotenv
@@ -0,0 +1,38 @@
+"""Add weight entries
+
+Revision ID: a4d7e2c91b68
+Revises: f18c6d2a9b35
+Create Date: 2026-10-19 15:21:47.530862
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d7e2c91b68'
+down_revision: Union[str, None] = 'f18c6d2a9b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('weight_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('recorded_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('weight_g', sa.Integer(), nullable=False),
+    sa.Column('note', sa.String(length=140), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_weight_entries_user_id_recorded_at', 'weight_entries', ['user_id', 'recorded_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_weight_entries_user_id_recorded_at', table_name='weight_entries')
+    op.drop_table('weight_entries')
@@ -0,0 +1,75 @@
+"""Add user plan goal columns
+
+Revision ID: b9e3f5a2c716
+Revises: a4d7e2c91b68
+Create Date: 2026-10-19 16:02:13.284519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.diet_fit_app.goals import GOAL_COLUMNS, goal_columns
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9e3f5a2c716'
+down_revision: Union[str, None] = 'a4d7e2c91b68'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill(connection) -> None:
+    """Parse the free-text fields of existing plans, one keyset-paginated batch at a time."""
+    plans = sa.table(
+        'user_plans',
+        sa.column('id'), sa.column('current_weight'), sa.column('weight_goal'), sa.column('workout_frequency'),
+        *(sa.column(name) for name in GOAL_COLUMNS),
+    )
+    update = (
+        plans.update()
+        .where(plans.c.id == sa.bindparam('plan_id'))
+        .values({name: sa.bindparam(name) for name in GOAL_COLUMNS})
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(plans.c.id, plans.c.current_weight, plans.c.weight_goal, plans.c.workout_frequency)
+            .where(plans.c.id > last_id)
+            .order_by(plans.c.id)
+            .limit(BACKFILL_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(update, [
+            {"plan_id": row.id, **goal_columns(row.current_weight, row.weight_goal, row.workout_frequency)}
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_plans', sa.Column('weight_kg', sa.Float(), nullable=True))
+    op.add_column('user_plans', sa.Column('target_weight_kg', sa.Float(), nullable=True))
+    op.add_column('user_plans', sa.Column('sessions_per_week', sa.SmallInteger(), nullable=True))
+    op.add_column('user_plans', sa.Column('goal_direction', sa.SmallInteger(), nullable=True))
+    backfill(op.get_bind())
+    # Indexes are built once after the backfill rather than maintained row by row during it
+    op.create_index('ix_user_plans_goal_direction_weight_kg', 'user_plans', ['goal_direction', 'weight_kg'], unique=False)
+    op.create_index('ix_user_plans_target_weight_kg', 'user_plans', ['target_weight_kg'], unique=False)
+    op.create_index('ix_user_plans_sessions_per_week', 'user_plans', ['sessions_per_week'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_user_plans_sessions_per_week', table_name='user_plans')
+    op.drop_index('ix_user_plans_target_weight_kg', table_name='user_plans')
+    op.drop_index('ix_user_plans_goal_direction_weight_kg', table_name='user_plans')
+    op.drop_column('user_plans', 'goal_direction')
+    op.drop_column('user_plans', 'sessions_per_week')
+    op.drop_column('user_plans', 'target_weight_kg')
+    op.drop_column('user_plans', 'weight_kg')
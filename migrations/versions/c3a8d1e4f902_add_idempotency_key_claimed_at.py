@@ -0,0 +1,28 @@
+"""Add idempotency key claimed_at
+
+Revision ID: c3a8d1e4f902
+Revises: b9e3f5a2c716
+Create Date: 2026-10-19 17:34:52.906137
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a8d1e4f902'
+down_revision: Union[str, None] = 'b9e3f5a2c716'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('idempotency_keys', sa.Column('claimed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('idempotency_keys', 'claimed_at')
@@ -0,0 +1,28 @@
+"""Add user plan model tier
+
+Revision ID: c52a9e0f7d13
+Revises: 8d4e2b6c1a57
+Create Date: 2026-10-19 09:41:52.613027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52a9e0f7d13'
+down_revision: Union[str, None] = '8d4e2b6c1a57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_plans', sa.Column('model_tier', sa.String(length=32), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user_plans', 'model_tier')
@@ -0,0 +1,28 @@
+"""Add plan template features index
+
+Revision ID: d6b4e8f1a327
+Revises: c3a8d1e4f902
+Create Date: 2026-10-19 19:12:08.413526
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6b4e8f1a327'
+down_revision: Union[str, None] = 'c3a8d1e4f902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_plan_templates_features', 'plan_templates', ['features'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_plan_templates_features', table_name='plan_templates')
@@ -0,0 +1,39 @@
+"""Add plan templates
+
+Revision ID: e7b3a1c9f240
+Revises: c52a9e0f7d13
+Create Date: 2026-10-19 09:42:51.602317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3a1c9f240'
+down_revision: Union[str, None] = 'c52a9e0f7d13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('plan_templates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('features', sa.Text(), nullable=True),
+    sa.Column('result', sa.Text(), nullable=True),
+    sa.Column('source_tier', sa.String(length=32), nullable=True),
+    sa.Column('approved', sa.Boolean(), nullable=True),
+    sa.Column('uses', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_plan_templates_approved', 'plan_templates', ['approved'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_plan_templates_approved', table_name='plan_templates')
+    op.drop_table('plan_templates')
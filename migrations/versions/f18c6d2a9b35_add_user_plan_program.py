@@ -0,0 +1,28 @@
+"""Add user plan program
+
+Revision ID: f18c6d2a9b35
+Revises: e7b3a1c9f240
+Create Date: 2026-10-19 14:08:26.117940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f18c6d2a9b35'
+down_revision: Union[str, None] = 'e7b3a1c9f240'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user_plans', sa.Column('program', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user_plans', 'program')
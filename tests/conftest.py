@@ -1,6 +1,8 @@
 import os
 # Ensure test mode flag is set before importing the application (skip DB creation on import)
 os.environ["TEST_MODE"] = "1"
+from contextlib import contextmanager
+
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -62,6 +64,45 @@ TEST_USER = {
     "password": "password123"
 }
 
+@contextmanager
+def assert_max_queries(max_queries: int):
+    """
+    Assert that the block executes at most ``max_queries`` SQL statements.
+
+    Counts statements on every engine, including those issued by the app while
+    serving TestClient requests made inside the block.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "after_cursor_execute", count)
+    try:
+        yield statements
+    finally:
+        event.remove(Engine, "after_cursor_execute", count)
+    assert len(statements) <= max_queries, (
+        f"Expected at most {max_queries} queries, got {len(statements)}:\n" + "\n".join(statements)
+    )
+
+@pytest.fixture(autouse=True)
+def reset_rate_limits():
+    """
+    Give every test fresh per-user rate limit buckets and an empty usage buffer
+    (user ids restart at 1 per test).
+    """
+    from app.core.admission import llm_rate_limiter, InMemoryTokenBucketBackend
+    from app.diet_fit_app.usage import usage_recorder
+
+    llm_rate_limiter.backend = InMemoryTokenBucketBackend()
+    usage_recorder.discard()
+    yield
+    usage_recorder.discard()
+
 @pytest.fixture(scope="function")
 def db():
     """
@@ -185,3 +226,84 @@ def token(test_user):
     # Create an access token for the test user using the test secret key
     access_token = test_create_access_token(data={"sub": test_user.username})
     return access_token
+
+@pytest.fixture(scope="function")
+def sample_plan(db, test_user):
+    """
+    Create a stored 7-day plan for the test user.
+    """
+    from app.db.models import UserPlan, WorkoutPlan, DietPlan
+    from app.diet_fit_app.models import Weekday
+
+    plan = UserPlan(
+        user_id=test_user.id,
+        current_weight="190 lbs",
+        weight_goal="Lose 15 lbs (target: 175 lbs)",
+        workout_frequency="Workout 3 times per week",
+        estimated_days_to_goal=60
+    )
+    db.add(plan)
+    db.flush()
+    for day in Weekday:
+        db.add(WorkoutPlan(user_plan_id=plan.id, day=day.value, activity=f"30 minutes of cardio on {day.value}"))
+        db.add(DietPlan(user_plan_id=plan.id, day=day.value, meals=f"Breakfast: Oatmeal. Lunch: Jollof rice. Dinner: Light soup with fufu ({day.value})"))
+    db.commit()
+    db.refresh(plan)
+    return plan
+
+@pytest.fixture(scope="function")
+def user_input():
+    """
+    Return a representative UserInput payload.
+    """
+    from app.diet_fit_app.models import UserInput
+
+    return UserInput(
+        typical_breakfast="Hausa koko with koose, tea with bread and eggs",
+        typical_lunch="Jollof rice with fried chicken, Banku with okra stew",
+        typical_dinner="Waakye with gari and spaghetti, Light soup with fufu",
+        typical_snacks="Fruits, nuts, kelewele",
+        dietary_restrictions="No specific restrictions",
+        favorite_meals="Jollof rice with chicken, Banku with tilapia",
+        comfort_foods="Kelewele, Waakye, Fufu with palm nut soup",
+        eating_out_frequency="Once a week",
+        eating_out_choices="Local restaurants serving traditional Ghanaian dishes",
+        current_weight="190 lbs",
+        weight_goal="Lose 15 lbs (target: 175 lbs)",
+        workout_frequency="Workout 3 times per week"
+    )
+
+def stub_coach_args():
+    """Return the structured output used by the stubbed coach agent."""
+    from app.diet_fit_app.models import Weekday
+
+    return {
+        "workout_plan": [{"day": day.value, "activity": f"30 minutes of brisk walking on {day.value}"} for day in Weekday],
+        "diet_plan": [{"day": day.value, "meals": "Breakfast: Oatmeal. Lunch: Jollof rice with grilled chicken. Dinner: Light soup with fufu."} for day in Weekday],
+        "estimated_days_to_goal": 0
+    }
+
+@pytest.fixture(scope="function")
+def stub_agents():
+    """
+    Replace both AI agents with local function models.
+
+    Yields a dict counting how many times each agent was called.
+    """
+    from pydantic_ai.messages import ModelResponse, ToolCallPart
+    from pydantic_ai.models.function import FunctionModel
+    from app.diet_fit_app import service
+
+    calls = {"coach": 0, "estimator": 0}
+
+    def coach(messages, info):
+        calls["coach"] += 1
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, stub_coach_args())])
+
+    def estimator(messages, info):
+        calls["estimator"] += 1
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"response": 60})])
+
+    with service.gpt03_agent.override(model=FunctionModel(coach)), \
+            service.estimator_agent.override(model=FunctionModel(estimator)):
+        yield calls
@@ -0,0 +1,134 @@
+"""
+Admission control test script.
+
+This script verifies the per-user token bucket, the bounded concurrency queue
+for LLM-backed routes, and that refusals carry a Retry-After header and show up
+in the /metrics endpoint.
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import admission
+from app.core.admission import AdmissionController, InMemoryTokenBucketBackend, RateLimiter
+from app.core.deadline import Deadline
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_over_time():
+    """Test burst allowance, refusal, and refill"""
+    clock = FakeClock()
+    limiter = RateLimiter(per_minute=60, burst=2, backend=InMemoryTokenBucketBackend(clock=clock))
+    limiter.check(1)
+    limiter.check(1)
+    with pytest.raises(HTTPException) as exc:
+        limiter.check(1)
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "1"
+    # Other users have their own bucket
+    limiter.check(2)
+    clock.now += 1.0
+    limiter.check(1)
+
+
+def test_queue_full_is_refused_immediately():
+    """Test that requests beyond the wait queue get a fast 503"""
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=5)
+
+    async def hold(event):
+        async with controller.slot():
+            await event.wait()
+
+    async def scenario():
+        release = asyncio.Event()
+        running = asyncio.create_task(hold(release))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(hold(release))
+        await asyncio.sleep(0)
+        assert controller.waiting == 1
+        with pytest.raises(HTTPException) as exc:
+            async with controller.slot():
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+        return exc.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+
+
+def test_queue_timeout_is_refused():
+    """Test that a request waiting past the deadline is refused"""
+    controller = AdmissionController(max_concurrent=1, max_queue=5, queue_timeout=0.05)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        try:
+            async with controller.slot():
+                pass
+        finally:
+            release.set()
+            await running
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(scenario())
+    assert exc.value.status_code == 503
+
+
+def test_queue_wait_is_bounded_by_request_deadline():
+    """Test that a request with little time left is refused before the queue timeout"""
+    controller = AdmissionController(max_concurrent=1, max_queue=5, queue_timeout=5)
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        running = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        try:
+            with pytest.raises(HTTPException) as exc:
+                async with controller.slot(Deadline(0.05)):
+                    pass
+        finally:
+            release.set()
+            await running
+        return exc.value, time.perf_counter() - started
+
+    error, waited = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert waited < 1
+
+
+def test_fitness_plan_is_rate_limited(client, token, stub_agents, user_input, monkeypatch):
+    """Test that the plan route returns 429 once the user's bucket is empty"""
+    monkeypatch.setattr(admission, "llm_rate_limiter", RateLimiter(per_minute=1, burst=1))
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers).status_code == 200
+    response = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) > 0
+
+    metrics = client.get("/metrics").text
+    assert 'llm_admission_rejected_total{reason="rate_limited"}' in metrics
+    assert "llm_admission_wait_seconds_count" in metrics
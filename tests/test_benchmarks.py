@@ -0,0 +1,28 @@
+"""
+Benchmark suite test script.
+
+This script runs the endpoint benchmark at minimal size so that the suite keeps
+working as the API changes, and checks the baseline comparison.
+"""
+from benchmarks import bench_endpoints
+
+
+def test_endpoint_benchmark_smoke():
+    """Test a tiny benchmark run drives every endpoint without errors"""
+    results = bench_endpoints.run(users=2, iterations=1, llm_latency=0)
+    for operation in bench_endpoints.OPERATIONS:
+        stats = results["endpoints"][operation]
+        assert stats["requests"] == 2, operation
+        assert stats["errors"] == 0, operation
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+    assert results["total_requests"] == 2 * len(bench_endpoints.OPERATIONS)
+
+
+def test_compare_flags_regressions():
+    """Test that slower p95, lower throughput and new errors are reported"""
+    baseline = {"endpoints": {"my-plans": {"p95_ms": 10.0, "throughput_rps": 100.0, "errors": 0}}}
+    same = {"endpoints": {"my-plans": {"p95_ms": 11.0, "throughput_rps": 95.0, "errors": 0}}}
+    worse = {"endpoints": {"my-plans": {"p95_ms": 15.0, "throughput_rps": 50.0, "errors": 1}}}
+    assert bench_endpoints.compare(same, baseline, tolerance=0.2) == []
+    assert len(bench_endpoints.compare(worse, baseline, tolerance=0.2)) == 3
+    assert bench_endpoints.percentile([1, 2, 3, 4], 50) == 2
@@ -0,0 +1,106 @@
+"""
+Client-disconnect cancellation test script.
+
+This script verifies that a plan generation is cancelled when the client
+disconnects (or finished and stored, in finish mode), and that shutdown
+draining cancels generations still running after the deadline.
+"""
+import asyncio
+import json
+
+from app.db.models import UserPlan
+from app.diet_fit_app import cancellation
+from app.diet_fit_app.cancellation import Generations, disconnects_counter
+from app.diet_fit_app.service import stage_cancelled_counter
+from app.main import app
+from tests.conftest import stub_coach_args
+
+
+def slow_agents(coach_seconds: float):
+    """Override both agents with local models; the coach takes ``coach_seconds``."""
+    from pydantic_ai.messages import ModelResponse, ToolCallPart
+    from pydantic_ai.models.function import FunctionModel
+    from app.diet_fit_app import service
+
+    async def coach(messages, info):
+        await asyncio.sleep(coach_seconds)
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, stub_coach_args())])
+
+    async def estimator(messages, info):
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"response": 30})])
+
+    coach_override = service.gpt03_agent.override(model=FunctionModel(coach))
+    estimator_override = service.estimator_agent.override(model=FunctionModel(estimator))
+    return coach_override, estimator_override
+
+
+async def post_then_disconnect(token: str, body: dict, disconnect_after: float) -> list:
+    """Send a plan request straight to the ASGI app and hang up after ``disconnect_after`` seconds."""
+    payload = json.dumps(body).encode()
+    messages = [{"type": "http.request", "body": payload, "more_body": False}]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop()
+        await asyncio.sleep(disconnect_after)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/fitness-plan", "raw_path": b"/api/fitness-plan",
+        "query_string": b"", "root_path": "", "client": ("127.0.0.1", 50000), "server": ("test", 80),
+        "headers": [
+            (b"host", b"test"),
+            (b"content-type", b"application/json"),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+    }
+    await app(scope, receive, send)
+    return sent
+
+
+def test_disconnect_aborts_generation(client, token, db, user_input, monkeypatch):
+    """Test that a disconnect cancels the coach call and stores nothing"""
+    monkeypatch.setattr(cancellation, "GENERATION_ON_DISCONNECT", "abort")
+    aborted = disconnects_counter.value(action="aborted")
+    cancelled = stage_cancelled_counter.value(stage="coach")
+    coach_override, estimator_override = slow_agents(coach_seconds=5)
+    with coach_override, estimator_override:
+        sent = asyncio.run(post_then_disconnect(token, user_input.model_dump(), disconnect_after=0.05))
+
+    assert sent[0]["status"] == 499
+    assert disconnects_counter.value(action="aborted") == aborted + 1
+    assert stage_cancelled_counter.value(stage="coach") == cancelled + 1
+    assert db.query(UserPlan).count() == 0
+
+
+def test_disconnect_finishes_and_stores_in_finish_mode(client, token, db, user_input, monkeypatch):
+    """Test that finish mode completes the generation and stores the plan"""
+    monkeypatch.setattr(cancellation, "GENERATION_ON_DISCONNECT", "finish")
+    finished = disconnects_counter.value(action="finished")
+    coach_override, estimator_override = slow_agents(coach_seconds=0.2)
+    with coach_override, estimator_override:
+        sent = asyncio.run(post_then_disconnect(token, user_input.model_dump(), disconnect_after=0.01))
+
+    assert sent[0]["status"] == 200
+    assert disconnects_counter.value(action="finished") == finished + 1
+    assert db.query(UserPlan).count() == 1
+
+
+def test_drain_cancels_after_deadline():
+    """Test that shutdown draining waits for quick generations and cancels slow ones"""
+    async def scenario():
+        registry = Generations()
+        quick = registry.start(asyncio.sleep(0.01, result="done"))
+        slow = registry.start(asyncio.sleep(10))
+        await registry.drain(deadline=0.1)
+        return quick, slow, len(registry)
+
+    quick, slow, remaining = asyncio.run(scenario())
+    assert quick.result() == "done"
+    assert slow.cancelled()
+    assert remaining == 0
@@ -0,0 +1,83 @@
+"""
+Traffic capture and replay test script.
+
+This script verifies that captured requests keep their shape and timing but
+none of their content, that LLM outputs are recorded as cassettes, and that a
+capture can be replayed in-process.
+"""
+import json
+
+from fastapi.testclient import TestClient
+
+from app.core import capture
+from app.core.capture import TrafficCaptureMiddleware
+from app.main import app
+from benchmarks import replay_traffic
+from tests.conftest import stub_coach_args
+
+
+def read_jsonl(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_capture_records_sanitized_shapes(client, token, stub_agents, user_input, tmp_path):
+    """Test that captured requests are sanitized and LLM outputs recorded as cassettes"""
+    path = tmp_path / "capture.jsonl"
+    writer = capture.configure_capture(str(path))
+    try:
+        with TestClient(TrafficCaptureMiddleware(app, writer)) as capturing:
+            headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "retry-me"}
+            assert capturing.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers).status_code == 200
+            assert capturing.get("/api/my-plans", headers=headers).status_code == 200
+            capturing.get("/metrics")
+    finally:
+        capture.disable_capture()
+
+    raw = path.read_text()
+    assert token not in raw
+    assert "Jollof" not in raw and "retry-me" not in raw
+    post, listing = read_jsonl(path)
+    assert (post["method"], post["route"], post["status"]) == ("POST", "/api/fitness-plan", 200)
+    assert post["body"]["typical_lunch"] == f"$str:{len(user_input.typical_lunch)}"
+    assert post["client"] == listing["client"] is not None
+    assert post["idempotency_key"] is not None
+    assert listing["route"] == "/api/my-plans" and listing["response_bytes"] > 0
+
+    cassettes = read_jsonl(tmp_path / "capture.jsonl.cassettes")
+    assert [(c["request_id"], c["agent"]) for c in cassettes] == [(post["id"], "coach"), (post["id"], "estimator")]
+    assert cassettes[1]["output"] == 60
+
+
+def test_replay_drives_captured_traffic(tmp_path):
+    """Test an in-process replay of a small capture with cassette playback"""
+    body = {field: "$str:40" for field in (
+        "typical_breakfast", "typical_lunch", "typical_dinner", "typical_snacks", "dietary_restrictions",
+        "favorite_meals", "comfort_foods", "eating_out_frequency", "eating_out_choices", "current_weight",
+        "weight_goal", "workout_frequency",
+    )}
+    shapes = [
+        ("POST", "/auth/signup", None, {"username": "$str:8", "email": "$str:16", "password": "$str:11"}),
+        ("POST", "/auth/login", None, {"username": "$str:8", "password": "$str:11"}),
+        ("POST", "/api/fitness-plan", "c1", body),
+        ("GET", "/api/my-plans", "c1", None),
+        ("PUT", "/api/my-plans/{plan_id}", "c1", {"current_weight": "$str:7"}),
+        ("DELETE", "/api/my-plans/{plan_id}", "c1", None),
+    ]
+    records = [
+        {"id": f"r{index}", "ts": 1000.0 + 3 * index, "method": method, "route": route, "query": {},
+         "client": client_id, "idempotency_key": None, "accept_encoding": "", "body": shape,
+         "status": 200, "response_bytes": 0, "duration_ms": 10.0}
+        for index, (method, route, client_id, shape) in enumerate(shapes)
+    ]
+    capture_path = tmp_path / "capture.jsonl"
+    capture_path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    (tmp_path / "capture.jsonl.cassettes").write_text(
+        json.dumps({"request_id": "r2", "agent": "coach", "latency_ms": 5, "output": stub_coach_args()}) + "\n"
+        + json.dumps({"request_id": "r2", "agent": "estimator", "latency_ms": 5, "output": 45}) + "\n"
+    )
+
+    results = replay_traffic.run(str(capture_path), speed=10)
+    assert results["skipped"] == 0
+    assert results["total_errors"] == 0
+    assert set(results["endpoints"]) == {f"{method} {route}" for method, route, _, _ in shapes}
+    assert results["captured"]["POST /api/fitness-plan"]["p50_ms"] == 10.0
@@ -0,0 +1,92 @@
+"""
+Response compression test script.
+
+This script verifies that the compression middleware negotiates an encoding
+from the Accept-Encoding header, leaves small bodies alone, and compresses
+streamed NDJSON responses incrementally.
+"""
+import json
+import zlib
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware, select_encoding
+
+PLAN_TEXT = "Breakfast: Hausa koko with koose. Lunch: Jollof rice with grilled chicken. " * 20
+
+
+def build_app(minimum_size=500):
+    """Build a small app exposing a large, a tiny and a streamed endpoint."""
+    test_app = FastAPI()
+    test_app.add_middleware(CompressionMiddleware, minimum_size=minimum_size, encodings=["gzip"])
+
+    @test_app.get("/large")
+    def large():
+        return {"meals": PLAN_TEXT}
+
+    @test_app.get("/tiny")
+    def tiny():
+        return {"ok": True}
+
+    @test_app.get("/stream")
+    def stream():
+        def lines():
+            for day in range(7):
+                yield json.dumps({"day": day, "meals": PLAN_TEXT}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return test_app
+
+
+def test_select_encoding_honours_quality_values():
+    """Test that q-values win over server preference order"""
+    assert select_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert select_encoding("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert select_encoding("br;q=0", ["br", "gzip"]) is None
+    assert select_encoding("*", ["zstd", "gzip"]) == "zstd"
+
+
+def test_large_body_is_gzipped():
+    """Test that bodies above the minimum size are compressed"""
+    client = TestClient(build_app())
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json()["meals"] == PLAN_TEXT
+
+
+def test_small_body_is_not_compressed():
+    """Test that bodies below the minimum size pass through untouched"""
+    client = TestClient(build_app())
+    response = client.get("/tiny", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.json() == {"ok": True}
+
+
+def test_streamed_ndjson_is_compressed_incrementally():
+    """Test that each streamed chunk is flushed as a decodable gzip fragment"""
+    client = TestClient(build_app())
+    with client.stream("GET", "/stream", headers={"Accept-Encoding": "gzip"}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        chunks = [chunk for chunk in response.iter_raw() if chunk]
+    decoder = zlib.decompressobj(31)
+    first = decoder.decompress(chunks[0])
+    # The first line must be readable without the rest of the stream
+    assert json.loads(first.decode().splitlines()[0])["day"] == 0
+    lines = (first + b"".join(decoder.decompress(chunk) for chunk in chunks[1:])).decode().splitlines()
+    assert len(lines) == 7
+
+
+def test_app_skips_small_plan_lists(client, token):
+    """Test that the application middleware leaves small API responses alone"""
+    response = client.get(
+        "/api/my-plans",
+        headers={"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    # An empty plan list is below the minimum size and must not be encoded
+    assert "content-encoding" not in response.headers
@@ -0,0 +1,111 @@
+"""
+Model fallback chain test script.
+
+This script verifies that circuit breakers trip on error rate and on latency,
+recover through a half-open probe, that a chain falls through to the next tier
+when one fails, and that the serving tier is stored on the plan.
+"""
+import asyncio
+
+from app.db.models import UserPlan
+from app.diet_fit_app.fallback import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, FallbackChain, local_coach_plan, local_estimate,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_trips_on_errors_and_recovers_through_probe():
+    """Test the closed -> open -> half-open -> closed/open cycle"""
+    clock = FakeClock()
+    breaker = CircuitBreaker("coach", "o3", window=4, min_calls=4, error_rate=0.5, open_seconds=10, clock=clock)
+    for ok in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(ok, 1.0)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow(), "only one probe at a time"
+    breaker.record(False, 1.0)
+    assert breaker.state == OPEN
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record(True, 1.0)
+    assert breaker.state == CLOSED
+
+
+def test_breaker_trips_on_latency_slo():
+    """Test that successful but slow calls open the circuit"""
+    breaker = CircuitBreaker("coach", "o3", latency_slo=5, window=3, min_calls=3, slow_rate=0.6)
+    for latency in (1, 9, 9):
+        breaker.record(True, latency)
+    assert breaker.state == OPEN
+
+
+class FakeAgent:
+    """Stands in for a pydantic_ai agent; fails on the listed models."""
+
+    def __init__(self, failing):
+        self.failing = failing
+        self.calls = []
+
+    async def run(self, deps, model):
+        self.calls.append(model)
+        if model in self.failing:
+            raise RuntimeError(f"{model} unavailable")
+
+        class Run:
+            output = f"plan from {model}"
+        return Run()
+
+
+def make_chain(names):
+    chain = FallbackChain("coach", names, lambda deps, user_input: "local plan", timeout=1, latency_slo=1)
+    for tier in chain.tiers:
+        tier._model = tier.name
+    return chain
+
+
+def test_chain_falls_through_to_next_tier(user_input):
+    """Test that a failing tier is skipped and an open circuit is not called at all"""
+    chain = make_chain(["o3", "gpt-4o", "local"])
+    chain.tiers[0].breaker.min_calls = 1
+    agent = FakeAgent(failing={"o3"})
+
+    served = asyncio.run(chain.run(agent, user_input, user_input))
+    assert (served.tier, served.output) == ("gpt-4o", "plan from gpt-4o")
+    assert chain.tiers[0].breaker.state == OPEN
+
+    agent.failing = {"o3", "gpt-4o"}
+    served = asyncio.run(chain.run(agent, user_input, user_input))
+    assert (served.tier, served.output, served.run) == ("local", "local plan", None)
+    assert agent.calls == ["o3", "gpt-4o", "gpt-4o"]
+
+
+def test_local_fallbacks(user_input):
+    """Test that the local tier produces a valid week and a goal estimate"""
+    plan = local_coach_plan(user_input, user_input)
+    assert len({day.day for day in plan.workout_plan}) == 7
+    assert len({day.day for day in plan.diet_plan}) == 7
+    assert sum(1 for day in plan.workout_plan if not day.activity.startswith("Rest")) == 3
+    # 190 lbs -> 175 lbs at 1 lb per week
+    assert local_estimate(plan, user_input) == 105
+
+
+def test_stored_plan_records_tier(client, token, db, stub_agents, user_input):
+    """Test that the serving coach tier is stored on the plan"""
+    response = client.post(
+        "/api/fitness-plan", json=user_input.model_dump(), headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert db.query(UserPlan).one().model_tier == "o3"
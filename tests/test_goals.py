@@ -0,0 +1,68 @@
+"""
+Goal parsing test script.
+
+This script verifies that the free-text weight, goal and frequency fields are
+parsed into canonical numeric columns, that the columns follow every write, and
+that the migration backfills existing plans in batches.
+"""
+import importlib.util
+from pathlib import Path
+
+import pytest
+from sqlalchemy import func, insert
+
+from app.db.models import UserPlan
+from app.diet_fit_app.goals import goal_columns
+
+
+@pytest.mark.parametrize("current, goal, frequency, expected", [
+    ("190 lbs", "Lose 15 lbs (target: 175 lbs)", "Workout 3 times per week", (86.18, 79.38, 3, -1)),
+    ("95 kg", "Lose 10", "Daily", (95.0, 85.0, 7, -1)),
+    ("80kg", "Reach 90 kg", "twice a week", (80.0, 90.0, 2, 1)),
+    ("150 lbs", "Maintain", "5x", (68.04, 68.04, 5, 0)),
+    ("", "Gain weight", "", (None, None, None, 1)),
+])
+def test_goal_columns(current, goal, frequency, expected):
+    """Test units, explicit and implied targets, frequencies and goal directions"""
+    columns = goal_columns(current, goal, frequency)
+    assert (columns["weight_kg"], columns["target_weight_kg"],
+            columns["sessions_per_week"], columns["goal_direction"]) == expected
+
+
+def test_columns_follow_writes(client, token, db, sample_plan):
+    """Test that the columns are derived on insert and on update"""
+    assert (sample_plan.weight_kg, sample_plan.target_weight_kg, sample_plan.sessions_per_week) == (86.18, 79.38, 3)
+
+    client.put(f"/api/my-plans/{sample_plan.id}", params={"replan": "none"},
+               json={"current_weight": "84 kg", "workout_frequency": "4 times a week"},
+               headers={"Authorization": f"Bearer {token}"})
+    db.refresh(sample_plan)
+    assert (sample_plan.weight_kg, sample_plan.sessions_per_week) == (84.0, 4)
+
+    # Range filters and aggregates run in SQL
+    losing = db.query(func.count(), func.avg(UserPlan.target_weight_kg)).filter(
+        UserPlan.goal_direction == -1, UserPlan.weight_kg.between(80, 90)
+    ).one()
+    assert losing == (1, 79.38)
+
+
+def test_migration_backfills_in_batches(db, test_user, monkeypatch):
+    """Test that the migration parses plans written before the columns existed"""
+    path = next(Path(__file__).parent.parent.glob("migrations/versions/*_add_user_plan_goal_columns.py"))
+    spec = importlib.util.spec_from_file_location("goal_columns_migration", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    monkeypatch.setattr(migration, "BACKFILL_BATCH_SIZE", 2)
+
+    # Core inserts bypass the ORM hook, leaving the columns empty like plans stored before them
+    db.execute(insert(UserPlan), [
+        {"user_id": test_user.id, "current_weight": f"{180 + index} lbs", "weight_goal": "Lose 10 lbs",
+         "workout_frequency": "3 times"}
+        for index in range(5)
+    ])
+    assert db.query(UserPlan).filter(UserPlan.weight_kg.is_(None)).count() == 5
+    migration.backfill(db.connection())
+
+    rows = db.query(UserPlan.weight_kg, UserPlan.target_weight_kg, UserPlan.goal_direction).order_by(UserPlan.id).all()
+    assert len(rows) == 5 and all(row.goal_direction == -1 for row in rows)
+    assert rows[-1].weight_kg == 83.46 and rows[-1].target_weight_kg == 78.93
@@ -0,0 +1,106 @@
+"""
+Deadline and hedging test script.
+
+This script verifies that the request deadline bounds agent calls and flows
+from the X-Request-Timeout header, that a slow call is hedged and the faster
+duplicate wins, and that the hedge budget limits extra calls.
+"""
+import asyncio
+
+import pytest
+
+from app.core.deadline import Deadline, DeadlineExceeded
+from app.db.models import UserPlan
+from app.diet_fit_app.fallback import CLOSED, FallbackChain
+from app.diet_fit_app.hedging import HedgeBudget, HedgePolicy, hedged_call
+
+
+class SlowAgent:
+    """Stands in for a pydantic_ai agent whose calls take ``seconds``."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    async def run(self, deps, model):
+        await asyncio.sleep(self.seconds)
+
+        class Run:
+            output = f"plan from {model}"
+        return Run()
+
+
+def make_chain(names):
+    chain = FallbackChain("coach", names, lambda deps, user_input: "local plan", timeout=10, latency_slo=10)
+    for tier in chain.tiers:
+        tier._model = tier.name
+    return chain
+
+
+def test_deadline_bounds_agent_calls(user_input):
+    """Test that a call cut short by the deadline falls back without tripping the breaker"""
+    chain = make_chain(["o3", "local"])
+    served = asyncio.run(chain.run(SlowAgent(5), user_input, user_input, Deadline(0.05)))
+    assert served.tier == "local"
+    assert chain.tiers[0].breaker.state == CLOSED
+    assert len(chain.tiers[0].breaker.calls) == 0
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(make_chain(["o3"]).run(SlowAgent(5), user_input, user_input, Deadline(0.05)))
+
+
+def test_deadline_from_request_header(client, token, db, stub_agents, user_input):
+    """Test that an already expired client deadline skips the provider tiers"""
+    response = client.post(
+        "/api/fitness-plan",
+        json=user_input.model_dump(),
+        headers={"Authorization": f"Bearer {token}", "X-Request-Timeout": "0.000001"},
+    )
+    assert response.status_code == 200
+    assert stub_agents["coach"] == 0
+    assert db.query(UserPlan).one().model_tier == "local"
+
+
+def test_slow_call_is_hedged_and_loser_cancelled():
+    """Test that the duplicate call wins when the primary is stuck"""
+    budget = HedgeBudget(ratio=1.0)
+    policy = HedgePolicy("coach", "o3", enabled=True, min_samples=1, budget=budget)
+    policy.observe(0.01)
+    cancelled = []
+    delays = iter([5, 0.01])
+
+    async def call():
+        try:
+            await asyncio.sleep(next(delays))
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return "done"
+
+    assert asyncio.run(hedged_call(call, policy, timeout=2)) == "done"
+    assert (policy.calls, policy.hedges, policy.wins) == (1, 1, 1)
+    assert cancelled == [True]
+    # The winner's latency and the abandoned primary's elapsed time are both recorded
+    assert len(policy.latencies) == 3
+    assert max(policy.latencies) >= 0.02
+
+
+def test_timed_out_primary_is_recorded():
+    """Test that a call abandoned at the timeout still feeds the latency history"""
+    policy = HedgePolicy("coach", "o3", enabled=True, min_samples=5)
+
+    async def call():
+        await asyncio.sleep(5)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(hedged_call(call, policy, timeout=0.05))
+    assert len(policy.latencies) == 1 and policy.latencies[0] >= 0.05
+
+
+def test_hedge_budget_limits_extra_calls():
+    """Test that 5% budget allows one hedge per twenty primary calls"""
+    budget = HedgeBudget(ratio=0.05)
+    spent = 0
+    for _ in range(40):
+        budget.deposit()
+        spent += budget.try_spend()
+    assert spent == 2
@@ -0,0 +1,101 @@
+"""
+Idempotency-Key test script.
+
+This script verifies that retried plan generation requests carrying the same
+Idempotency-Key replay the stored response instead of calling the AI agents
+again, that concurrent duplicates wait for the original, that key reuse
+with a different body is rejected, and that a crashed original's claim is
+taken over once its lease expires.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from app.db.models import IdempotencyKey, UserPlan
+from app.diet_fit_app import idempotency
+from app.diet_fit_app.idempotency import run_idempotent
+from app.diet_fit_app.models import CoachResult
+from tests.conftest import TestingSessionLocal, stub_coach_args
+
+
+def test_retry_replays_stored_response(client, token, db, stub_agents, user_input):
+    """Test that a retry with the same key does not generate a second plan"""
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "retry-1"}
+    first = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+    second = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+
+    assert first.status_code == 200
+    assert second.status_code == 200
+    assert second.headers["idempotent-replayed"] == "true"
+    assert second.json() == first.json()
+    assert stub_agents["coach"] == 1
+    assert db.query(UserPlan).count() == 1
+
+
+def test_key_reuse_with_different_body_is_rejected(client, token, stub_agents, user_input):
+    """Test that a key cannot be reused for a different request"""
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "retry-2"}
+    client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+    changed = user_input.model_copy(update={"current_weight": "200 lbs"})
+    response = client.post("/api/fitness-plan", json=changed.model_dump(), headers=headers)
+    assert response.status_code == 422
+
+
+def test_concurrent_duplicate_waits_for_original(db, test_user, user_input):
+    """Test that a duplicate arriving mid-generation waits instead of generating"""
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return CoachResult.model_validate(stub_coach_args())
+
+    async def scenario():
+        other_db = TestingSessionLocal()
+        try:
+            return await asyncio.gather(
+                run_idempotent(db, test_user.id, "inflight", user_input, produce),
+                run_idempotent(other_db, test_user.id, "inflight", user_input, produce),
+            )
+        finally:
+            other_db.close()
+
+    (first, first_replayed), (second, second_replayed) = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert (first_replayed, second_replayed) == (False, True)
+    assert first == second
+
+
+def test_failed_generation_releases_key(db, test_user, user_input):
+    """Test that a failed original lets a later retry generate again"""
+    async def failing():
+        raise RuntimeError("provider timeout")
+
+    async def succeeding():
+        return CoachResult.model_validate(stub_coach_args())
+
+    try:
+        asyncio.run(run_idempotent(db, test_user.id, "flaky", user_input, failing))
+    except RuntimeError:
+        pass
+    result, replayed = asyncio.run(run_idempotent(db, test_user.id, "flaky", user_input, succeeding))
+    assert replayed is False
+    assert result.estimated_days_to_goal == 0
+
+
+def test_crashed_original_lease_is_taken_over(db, test_user, user_input, monkeypatch):
+    """Test that a claim left in progress by a crashed worker is taken over once its lease expires"""
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LEASE_SECONDS", 0.3)
+    now = datetime.now(timezone.utc)
+    db.add(IdempotencyKey(user_id=test_user.id, key="crashed", status="in_progress", claimed_at=now,
+                          request_hash=idempotency.request_fingerprint(user_input),
+                          expires_at=now + timedelta(days=1)))
+    db.commit()
+
+    async def produce():
+        return CoachResult.model_validate(stub_coach_args())
+
+    # Waits while the lease is live, then runs instead of failing with 409
+    result, replayed = asyncio.run(run_idempotent(db, test_user.id, "crashed", user_input, produce))
+    assert replayed is False
+    db.expire_all()
+    assert db.query(IdempotencyKey).filter_by(key="crashed").one().status == "completed"
@@ -0,0 +1,107 @@
+"""
+Bulk plan import test script.
+
+This script verifies that JSONL plan histories are validated in chunks, written
+with executemany on SQLite, that invalid records and unknown users are rejected
+without aborting the import, and that an import resumes from its checkpoint
+without losing or repeating a chunk.
+"""
+import json
+
+import pytest
+
+from app.db.models import UserPlan, WorkoutPlan, DietPlan
+from app.diet_fit_app import importer
+from app.diet_fit_app.importer import import_plans
+from app.diet_fit_app.models import Weekday
+
+
+def make_record(user_input, user_id, days_to_goal):
+    """Build one valid import record."""
+    return {
+        "user_id": user_id,
+        "input": user_input.model_dump(),
+        "result": {
+            "workout_plan": [{"day": day.value, "activity": "Brisk walk"} for day in Weekday],
+            "diet_plan": [{"day": day.value, "meals": "Jollof rice with chicken"} for day in Weekday],
+            "estimated_days_to_goal": days_to_goal,
+        },
+    }
+
+
+def write_jsonl(path, records, mode="w"):
+    with open(path, mode) as f:
+        for record in records:
+            f.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+
+
+def test_import_validates_and_inserts(db, test_user, user_input, tmp_path):
+    """Test chunked import with one invalid record"""
+    source = tmp_path / "plans.jsonl"
+    rejects = tmp_path / "rejects.jsonl"
+    write_jsonl(source, [make_record(user_input, test_user.id, 30), "{\"user_id\": \"oops\"}", make_record(user_input, test_user.id, 40)])
+
+    stats = import_plans(db.get_bind(), str(source), chunk_size=2, rejects_path=str(rejects))
+
+    assert stats.imported == 2
+    assert stats.rejected == 1
+    assert sorted(p.estimated_days_to_goal for p in db.query(UserPlan).all()) == [30, 40]
+    assert db.query(WorkoutPlan).count() == 14
+    assert db.query(DietPlan).count() == 14
+    assert len(rejects.read_text().splitlines()) == 1
+
+
+def test_import_resumes_from_checkpoint(db, test_user, user_input, tmp_path):
+    """Test that a second run only imports lines added after the checkpoint"""
+    source = tmp_path / "plans.jsonl"
+    checkpoint = tmp_path / "plans.ckpt"
+    write_jsonl(source, [make_record(user_input, test_user.id, day) for day in range(3)])
+    import_plans(db.get_bind(), str(source), chunk_size=2, checkpoint_path=str(checkpoint))
+
+    write_jsonl(source, [make_record(user_input, test_user.id, 99)], mode="a")
+    stats = import_plans(db.get_bind(), str(source), chunk_size=2, checkpoint_path=str(checkpoint))
+
+    assert stats.imported == 4
+    assert stats.session_imported == 1
+    assert db.query(UserPlan).count() == 4
+
+
+def test_unknown_users_are_rejected(db, test_user, user_input, tmp_path):
+    """Test that a record for a missing user is rejected without failing its chunk"""
+    source = tmp_path / "plans.jsonl"
+    rejects = tmp_path / "rejects.jsonl"
+    write_jsonl(source, [make_record(user_input, test_user.id, 30), make_record(user_input, test_user.id + 99, 40)])
+
+    stats = import_plans(db.get_bind(), str(source), chunk_size=2, rejects_path=str(rejects))
+
+    assert (stats.imported, stats.rejected) == (1, 1)
+    assert db.query(UserPlan).count() == 1
+    assert json.loads(rejects.read_text())["error"] == f"unknown user_id {test_user.id + 99}"
+
+
+@pytest.mark.parametrize("crash_on_pending", [True, False])
+def test_crash_around_commit_imports_chunk_once(db, test_user, user_input, tmp_path, monkeypatch,
+                                                crash_on_pending):
+    """Test that a crash before or after a chunk's commit neither loses nor duplicates it or its rejects"""
+    source = tmp_path / "plans.jsonl"
+    checkpoint = tmp_path / "plans.ckpt"
+    rejects = tmp_path / "rejects.jsonl"
+    write_jsonl(source, [make_record(user_input, test_user.id, day) for day in range(2)]
+                + ["{not json", make_record(user_input, test_user.id + 99, 40)])
+    options = {"chunk_size": 4, "checkpoint_path": str(checkpoint), "rejects_path": str(rejects)}
+    save_checkpoint = importer.save_checkpoint
+
+    def crashing_save(path, state):
+        if ("pending" in state) == crash_on_pending:
+            raise KeyboardInterrupt
+        save_checkpoint(path, state)
+
+    monkeypatch.setattr(importer, "save_checkpoint", crashing_save)
+    with pytest.raises(KeyboardInterrupt):
+        import_plans(db.get_bind(), str(source), **options)
+    monkeypatch.setattr(importer, "save_checkpoint", save_checkpoint)
+
+    stats = import_plans(db.get_bind(), str(source), **options)
+    assert db.query(UserPlan).count() == 2
+    assert (stats.imported, stats.rejected) == (2, 2)
+    assert len(rejects.read_text().splitlines()) == 2
@@ -0,0 +1,76 @@
+"""
+Metrics endpoint test script.
+
+This script verifies the Prometheus text rendering of the metrics registry, that
+plan generation records per-stage, per-route and per-statement latencies, and
+that per-request query counts and timings are reported in Server-Timing.
+"""
+from app.core.metrics import Registry
+from app.db.models import UserPlan, WorkoutPlan
+from tests.conftest import assert_max_queries
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test Prometheus text output for a labelled histogram"""
+    registry = Registry()
+    histogram = registry.histogram("demo_seconds", "Demo latency", ["stage"], buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="coach")
+    histogram.observe(0.5, stage="coach")
+    histogram.observe(5, stage="coach")
+    text = registry.render()
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{stage="coach",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{stage="coach",le="1"} 2' in text
+    assert 'demo_seconds_bucket{stage="coach",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{stage="coach"} 3' in text
+
+
+def test_pipeline_stages_and_routes_are_recorded(client, token, stub_agents, user_input):
+    """Test that a plan request shows up per stage, route and DB operation"""
+    response = client.post(
+        "/api/fitness-plan",
+        json=user_input.model_dump(),
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    text = metrics.text
+    for stage in ("coach", "estimator", "db_write"):
+        assert f'pipeline_stage_duration_seconds_count{{stage="{stage}"}}' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/fitness-plan",status="200"}' in text
+    assert 'db_query_duration_seconds_count{operation="insert"}' in text
+    assert "pipeline_generations_in_flight 0" in text
+
+
+def test_my_plans_query_budget(client, token, db, test_user):
+    """Test that listing plans does not issue queries per plan (no N+1)"""
+    for index in range(5):
+        plan = UserPlan(user_id=test_user.id, current_weight="190 lbs", weight_goal="Lose 10 lbs",
+                        workout_frequency="3 times per week", estimated_days_to_goal=30 + index)
+        db.add(plan)
+        db.flush()
+        db.add(WorkoutPlan(user_plan_id=plan.id, day="monday", activity="Brisk walk"))
+    db.commit()
+
+    # SELECT 1 ping, current user, plans, workout plans, diet plans
+    with assert_max_queries(5):
+        response = client.get("/api/my-plans", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert len(response.json()) == 5
+
+
+def test_server_timing_header(client, token, stub_agents, user_input):
+    """Test that responses report DB and LLM stage timings"""
+    response = client.post(
+        "/api/fitness-plan",
+        json=user_input.model_dump(),
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    timing = response.headers["server-timing"]
+    assert timing.startswith("db;dur=")
+    assert "queries" in timing
+    for stage in ("coach", "estimator", "db_write", "total"):
+        assert f"{stage};dur=" in timing
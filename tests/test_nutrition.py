@@ -0,0 +1,64 @@
+"""
+Nutrition estimation test script.
+
+This script verifies food matching (longest names, counts, portions, negations
+and alternatives), the per-meal and per-day totals with their text-hash cache,
+and that plans are returned with nutrition estimates.
+"""
+import numpy as np
+import pytest
+
+from app.diet_fit_app import nutrition
+
+
+def servings(text):
+    return {nutrition.FOOD_NAMES[food]: value for food, value in enumerate(nutrition.match_meal(text)) if value}
+
+
+def test_food_matching():
+    """Test longest-name matching, counts, portions, negations and alternatives"""
+    assert servings("Jollof rice with fried chicken and rice") == {"jollof rice": 1, "fried chicken": 1, "rice": 1}
+    assert servings("2 boiled eggs, a small portion of banku with okro stew") == {
+        "egg": 2, "banku": 0.75, "okra stew": 1,
+    }
+    assert servings("Kelewele, no nuts") == {"kelewele": 1}
+    assert servings("Waakye or fufu with light soup") == {"waakye": 0.5, "fufu": 0.5, "light soup": 0.5}
+
+
+def test_day_totals_and_cache():
+    """Test that days add up their meals and repeated texts are served from the cache"""
+    day = "Breakfast: Hausa koko with koose\nLunch: Banku with tilapia\nRestrictions: none"
+    before = nutrition.cache_counter.value(result="hit")
+    first, second = nutrition.estimate_days([day, day])
+    assert nutrition.cache_counter.value(result="hit") == before + 1
+
+    assert [meal["meal"] for meal in first["meals"]] == ["breakfast", "lunch"]
+    assert first["meals"][1]["items"] == ["banku", "tilapia"]
+    assert first["calories"] == pytest.approx(180 + 280 + 350 + 260)
+    assert first["protein_g"] == sum(meal["protein_g"] for meal in first["meals"])
+    assert first == second
+
+    cache = nutrition.ServingsCache(size=2)
+    for text in ("fufu", "banku", "kenkey"):
+        cache.get(text)
+    assert len(cache._entries) == 2
+    assert np.array_equal(cache.get("kenkey").servings, [nutrition.match_meal("kenkey")])
+
+
+def test_days_without_meals_and_leading_text():
+    """Test that note-only days count as empty and text before the first label is kept"""
+    notes, leading = nutrition.estimate_days(["Notes: rest day\nTips: drink water", "Fufu. Dinner: banku"])
+    assert notes == {"calories": 0.0, "protein_g": 0.0, "carbs_g": 0.0, "fat_g": 0.0, "meals": []}
+    assert [(meal["meal"], meal["items"]) for meal in leading["meals"]] == [("meals", ["fufu"]), ("dinner", ["banku"])]
+
+
+def test_plans_include_nutrition(client, token, user_input, stub_agents):
+    """Test that generated and listed plans carry a nutrition estimate per day"""
+    headers = {"Authorization": f"Bearer {token}"}
+    plan = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers).json()
+    assert [day["day"] for day in plan["nutrition"]] == [day["day"] for day in plan["diet_plan"]]
+    # Stub meals: oatmeal, jollof rice with grilled chicken, light soup with fufu
+    assert plan["nutrition"][0]["calories"] == 160 + 480 + 250 + 180 + 400
+
+    listed = client.get("/api/my-plans", headers=headers).json()
+    assert listed[0]["nutrition"] == plan["nutrition"]
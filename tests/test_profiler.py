@@ -0,0 +1,74 @@
+"""
+Sampling profiler test script.
+
+This script verifies that samples are attributed to the endpoint on the stack,
+that both export formats are produced, and that the admin endpoints are
+restricted to administrators and stop after the requested number of requests.
+"""
+import threading
+
+from app.auth import dependencies
+from app.core.profiler import ProfileSession, profiler
+
+
+def busy_endpoint(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_samples_are_attributed_to_endpoints():
+    """Test that a CPU-bound endpoint shows up under its route label in both formats"""
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_endpoint, args=(stop,))
+    worker.start()
+    session = ProfileSession({busy_endpoint.__code__: "busy_endpoint"}, seconds=0.3, interval=0.002)
+    session.start()
+    session.wait()
+    stop.set()
+    worker.join()
+
+    assert session.routes()["busy_endpoint"] > 0
+    lines = session.collapsed().splitlines()
+    assert any(line.startswith("busy_endpoint;") and "busy_endpoint (test_profiler.py" in line for line in lines)
+    document = session.speedscope()
+    profile = next(p for p in document["profiles"] if p["name"] == "busy_endpoint")
+    assert len(profile["samples"]) == len(profile["weights"])
+    assert all(index < len(document["shared"]["frames"]) for sample in profile["samples"] for index in sample)
+
+
+def test_profile_endpoints_require_admin(client, token):
+    """Test that non-administrators cannot start a profile"""
+    response = client.post("/admin/profile?seconds=1", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+
+def test_profile_next_requests(client, token, test_user, monkeypatch):
+    """Test a session limited to the next N requests and its exports"""
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {test_user.username})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    started = client.post("/admin/profile?seconds=30&requests=2&interval_ms=1", headers=headers)
+    assert started.status_code == 202
+    assert client.post("/admin/profile?seconds=30", headers=headers).status_code == 409
+    assert client.get("/admin/profile?format=collapsed", headers=headers).status_code == 409
+    client.get("/api/my-plans", headers=headers)
+
+    profiler.session.wait(timeout=5)
+    summary = client.get("/admin/profile", headers=headers).json()
+    assert summary["running"] is False
+    assert summary["requests"] >= 2
+    assert summary["elapsed"] < 30
+    assert client.get("/admin/profile?format=collapsed", headers=headers).status_code == 200
+    speedscope = client.get("/admin/profile?format=speedscope", headers=headers).json()
+    assert speedscope["$schema"].startswith("https://www.speedscope.app")
+
+
+def test_reports_while_sampling():
+    """Test that status and exports can be read while the sampler keeps adding stacks"""
+    session = ProfileSession({}, seconds=0.3, interval=0.0005)
+    session.start()
+    while session.running:
+        session.status()
+        session.collapsed()
+        session.speedscope()
+    assert session.status()["samples"] == sum(session.snapshot().values())
@@ -0,0 +1,77 @@
+"""
+Multi-week program test script.
+
+This script verifies the overload and deload rules, the scaling of workload
+quantities in activity text, and that program weeks are stored as settings only
+and computed a page at a time through the API.
+"""
+import re
+
+import pytest
+
+from app.db.models import DietPlan, WorkoutPlan
+from app.diet_fit_app import progression
+from app.diet_fit_app.models import ProgramSettings
+
+
+def test_overload_and_deload_schedule():
+    """Test build weeks, deload weeks and the intensity cap"""
+    settings = ProgramSettings(weeks=8)
+    schedule = [progression.week_intensity(week, settings) for week in range(1, 9)]
+    assert schedule[:5] == [("build", 1.0), ("build", 1.05), ("build", 1.103), ("deload", 0.695), ("build", 1.158)]
+    assert schedule[7][0] == "deload"
+
+    steep = ProgramSettings(weeks=12, overload_percent=20, deload_every=0)
+    assert progression.week_intensity(12, steep) == ("build", progression.PROGRAM_MAX_INTENSITY)
+
+
+def test_scale_activity():
+    """Test that each exercise scales one quantity, set counts are kept and rest days are unchanged"""
+    scaled = progression.scale_activity("30 minutes of cardio, 3 sets of 12 reps, then 5 km run", 1.2)
+    assert scaled == "35 minutes of cardio, 3 sets of 14 reps, then 6 km run"
+    assert progression.scale_activity("Squats: 3 sets of 10", 1.25) == "Squats: 3 sets of 12"
+    assert progression.scale_activity("Rest day or light stretching", 0.6) == "Rest day or light stretching"
+
+
+def test_volume_stays_within_intensity_cap():
+    """Test that total volume (sets x reps) grows by the intensity, not its square"""
+    def volume(activity):
+        sets, reps = re.search(r"(\d+) sets of (\d+)", activity).groups()
+        return int(sets) * int(reps)
+
+    intensity = progression.PROGRAM_MAX_INTENSITY
+    for activity in ("4 sets of 10 push-ups", "3 sets of 12 reps of squats", "Circuit: squats and rows, 5 sets of 8"):
+        assert volume(progression.scale_activity(activity, intensity)) <= intensity * volume(activity)
+    assert progression.scale_activity("4 sets of 10 push-ups", 1.5) == "4 sets of 15 push-ups"
+
+
+def test_program_is_paginated_and_computed_lazily(client, token, db, sample_plan):
+    """Test that only settings are stored and each page computes only its own weeks"""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.put(f"/api/my-plans/{sample_plan.id}/program", json={"weeks": 6}, headers=headers)
+    assert response.status_code == 200
+    first = response.json()
+    assert [week["week"] for week in first["weeks"]] == [1, 2, 3, 4]
+    assert first["next_page"] == 2 and first["total_weeks"] == 6
+    assert first["weeks"][3]["phase"] == "deload"
+    # Meals rotate by one day per week
+    assert first["weeks"][1]["diet_plan"][0]["meals"] == first["weeks"][0]["diet_plan"][1]["meals"]
+
+    expanded = progression.weeks_expanded_counter.value()
+    response = client.get(f"/api/my-plans/{sample_plan.id}/program", params={"page": 2}, headers=headers)
+    page = response.json()
+    assert [week["week"] for week in page["weeks"]] == [5, 6] and page["next_page"] is None
+    assert progression.weeks_expanded_counter.value() == expanded + 2
+    assert page["weeks"][0]["workout_plan"][0]["activity"] == "35 minutes of cardio on monday"
+
+    db.refresh(sample_plan)
+    assert ProgramSettings.model_validate_json(sample_plan.program).weeks == 6
+    assert db.query(WorkoutPlan).count() == 7 and db.query(DietPlan).count() == 7
+
+
+@pytest.mark.parametrize("method", ["get", "put"])
+def test_program_of_missing_plan(client, token, method):
+    """Test that another user's or a missing plan is not found"""
+    response = client.request(method.upper(), "/api/my-plans/999/program", json={"weeks": 4},
+                              headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 404
@@ -0,0 +1,60 @@
+"""
+Prompt builder test script.
+
+This script verifies that user fields are normalized, deduplicated and cut to
+their token budgets, and that every coach prompt starts with the same static
+prefix so the provider can cache it.
+"""
+import asyncio
+
+from app.diet_fit_app.prompts import COACH_SYSTEM_PROMPT, FIELD_TOKEN_BUDGETS, build_user_context, count_tokens
+from tests.conftest import stub_coach_args
+
+
+def test_fields_are_normalized_and_deduplicated(user_input):
+    """Test that repeats inside and across fields are collapsed"""
+    pasted = user_input.model_copy(update={
+        "typical_breakfast": "Tea  with bread,\n\ntea with bread!!!\nHausa koko;   Hausa koko",
+        "typical_dinner": user_input.typical_lunch,
+        "current_weight": "82,5 kg",
+    })
+    text, report = build_user_context(pasted)
+    assert "- Typical breakfast: Tea with bread, Hausa koko\n" in text
+    assert "- Typical dinner: same as typical lunch\n" in text
+    assert "- Current weight: 82,5 kg\n" in text
+    assert report.truncated == []
+    assert report.saved_tokens > 0
+
+
+def test_long_fields_are_cut_to_budget(user_input):
+    """Test that a pasted paragraph is truncated to its field budget"""
+    paragraph = "I usually eat a big plate of waakye with everything on it " * 40
+    text, report = build_user_context(user_input.model_copy(update={"typical_dinner": paragraph}))
+    line = next(line for line in text.splitlines() if line.startswith("- Typical dinner:"))
+    value = line.split(": ", 1)[1]
+    assert value.endswith("…")
+    assert count_tokens(value) <= FIELD_TOKEN_BUDGETS["typical_dinner"][1] + 1
+    assert report.truncated == ["typical_dinner"]
+    assert report.context_tokens < report.raw_tokens
+
+
+def test_static_prefix_is_identical_across_users(user_input):
+    """Test that the static instructions come first and never vary"""
+    from pydantic_ai.messages import ModelResponse, SystemPromptPart, ToolCallPart
+    from pydantic_ai.models.function import FunctionModel
+    from app.diet_fit_app import service
+
+    prompts = []
+
+    def coach(messages, info):
+        prompts.append([part.content for part in messages[0].parts if isinstance(part, SystemPromptPart)])
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, stub_coach_args())])
+
+    other = user_input.model_copy(update={"current_weight": "80 kg", "typical_lunch": "Kenkey with fish"})
+    with service.gpt03_agent.override(model=FunctionModel(coach)):
+        for deps in (user_input, other):
+            asyncio.run(service.gpt03_agent.run(deps=deps))
+
+    first, second = prompts
+    assert first[0] == second[0] == COACH_SYSTEM_PROMPT
+    assert first[-1].startswith("User profile:") and first[-1] != second[-1]
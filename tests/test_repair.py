@@ -0,0 +1,120 @@
+"""
+Plan repair test script.
+
+This script verifies that CoachResult requires every weekday exactly once, that
+a coach reply with missing or duplicate days is completed by a targeted repair
+call (not a full regeneration), that days are filled locally when no repair call
+is made, and that a reply with too few usable days is regenerated once.
+"""
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+from pydantic import ValidationError
+
+from tests.conftest import stub_coach_args
+from app.diet_fit_app import repair, service
+from app.diet_fit_app.models import CoachResult, Weekday
+
+
+def test_coach_result_requires_each_weekday_once():
+    """Test that missing and repeated days are rejected and days are ordered"""
+    args = stub_coach_args()
+    args["workout_plan"].reverse()
+    result = CoachResult.model_validate(args)
+    assert [entry.day for entry in result.workout_plan] == list(Weekday)
+
+    missing = stub_coach_args()
+    missing["diet_plan"].pop()
+    with pytest.raises(ValidationError):
+        CoachResult.model_validate(missing)
+
+    repeated = stub_coach_args()
+    repeated["workout_plan"][6]["day"] = "monday"
+    with pytest.raises(ValidationError):
+        CoachResult.model_validate(repeated)
+
+
+def test_check_week_and_local_fill():
+    """Test weekday aliases, dropped entries and the local fill"""
+    draft = repair.CoachDraft(
+        workout_plan=[{"day": "Mon", "activity": "Run"}, {"day": "TUES.", "activity": "Swim"},
+                      {"day": "monday", "activity": "Duplicate"}, {"day": "Funday", "activity": "?"}],
+        diet_plan=[{"day": "Day 1", "meals": "Rice"}, {"day": "wednesday", "meals": "Beans"},
+                   {"day": "thursday", "meals": ""}],
+    )
+    check = repair.check_week(draft)
+    assert check.workout == {Weekday.monday: "Run", Weekday.tuesday: "Swim"}
+    assert check.invalid_entries == 3
+    assert check.missing_diet[0] == Weekday.tuesday
+
+    check.fill_locally()
+    result = check.result()
+    assert result.workout_plan[6].activity == repair.LOCAL_REST
+    # Tuesday copies Monday, Thursday..Sunday copy Wednesday
+    assert [entry.meals for entry in result.diet_plan] == ["Rice", "Rice"] + ["Beans"] * 5
+
+
+@contextmanager
+def stubbed(coach_outputs, patch=None):
+    """Stub the coach (one output per call), estimator and repair agents; yield call counts."""
+    from pydantic_ai.messages import ModelResponse, ToolCallPart
+    from pydantic_ai.models.function import FunctionModel
+
+    calls = {"coach": 0, "repair": 0, "prompts": []}
+
+    def respond(info, args):
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, args)])
+
+    def coach(messages, info):
+        calls["coach"] += 1
+        return respond(info, coach_outputs[min(calls["coach"], len(coach_outputs)) - 1])
+
+    def repair_model(messages, info):
+        calls["repair"] += 1
+        calls["prompts"].append(messages[-1].parts[-1].content)
+        return respond(info, patch)
+
+    with service.gpt03_agent.override(model=FunctionModel(coach)), \
+            service.estimator_agent.override(model=FunctionModel(lambda m, info: respond(info, {"response": 60}))), \
+            service.repair_agent.override(model=FunctionModel(repair_model)):
+        yield calls
+
+
+def test_missing_days_repaired_by_targeted_call(user_input):
+    """Test that only the missing days are requested and the plan is not regenerated"""
+    draft = stub_coach_args()
+    draft["workout_plan"] = draft["workout_plan"][:5] + [{"day": "monday", "activity": "Duplicate"}]
+    patch = {"workout_plan": [{"day": "saturday", "activity": "Yoga"}, {"day": "sunday", "activity": "Hike"},
+                              {"day": "monday", "activity": "Should be ignored"}]}
+    before = repair.validation_counter.value(outcome="repaired_targeted")
+
+    with stubbed([draft], patch) as calls:
+        result = asyncio.run(service.run_fitness_pipeline(user_input))
+
+    assert calls["coach"] == 1 and calls["repair"] == 1
+    assert "Missing workout days: saturday, sunday" in calls["prompts"][0]
+    assert "Missing diet days" not in calls["prompts"][0]
+    assert [entry.activity for entry in result.workout_plan][-3:] == [draft["workout_plan"][4]["activity"], "Yoga", "Hike"]
+    assert result.workout_plan[0].activity != "Should be ignored"
+    assert repair.validation_counter.value(outcome="repaired_targeted") == before + 1
+
+
+def test_local_mode_and_full_retry(user_input, monkeypatch):
+    """Test local filling without a repair call, and a regeneration when too few days are usable"""
+    monkeypatch.setattr(repair, "REPAIR_MODE", "local")
+    draft = stub_coach_args()
+    draft["diet_plan"] = draft["diet_plan"][:6]
+    with stubbed([draft]) as calls:
+        result = asyncio.run(service.run_fitness_pipeline(user_input))
+    assert calls == {"coach": 1, "repair": 0, "prompts": []}
+    assert result.diet_plan[6].meals == draft["diet_plan"][5]["meals"]
+
+    sparse = stub_coach_args()
+    sparse["workout_plan"] = sparse["workout_plan"][:2]
+    retried = repair.validation_counter.value(outcome="retried")
+    with stubbed([sparse, stub_coach_args()]) as calls:
+        result = asyncio.run(service.run_fitness_pipeline(user_input))
+    assert calls["coach"] == 2
+    assert result.model_dump(mode="json")["workout_plan"] == stub_coach_args()["workout_plan"]
+    assert repair.validation_counter.value(outcome="retried") == retried + 1
@@ -0,0 +1,118 @@
+"""
+Incremental re-planning test script.
+
+This script verifies that updating a plan recomputes only the parts that depend
+on the changed fields: the estimate for weight changes and the workout days for
+frequency changes, writing only the rows that differ, and that models are only
+called when asked for, behind the same guards as plan generation.
+"""
+from pydantic_ai.messages import ModelResponse, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+from app.core import admission
+from app.core.admission import RateLimiter
+from app.db.models import DietPlan, WorkoutPlan
+from app.diet_fit_app import replan, service
+from app.diet_fit_app.models import Weekday
+
+
+def rows(db, model, field):
+    return {row.day: (row.id, getattr(row, field)) for row in db.query(model).all()}
+
+
+def put(client, token, plan_id, body, **params):
+    return client.put(f"/api/my-plans/{plan_id}", json=body, params=params,
+                      headers={"Authorization": f"Bearer {token}"})
+
+
+def test_weight_change_recomputes_only_the_estimate(client, token, db, sample_plan):
+    """Test that a new weight updates the estimate and leaves every day row alone"""
+    workouts, diets = rows(db, WorkoutPlan, "activity"), rows(db, DietPlan, "meals")
+    written = {op: replan.rows_written_counter.value(operation=op) for op in ("insert", "update", "delete")}
+
+    response = put(client, token, sample_plan.id, {"current_weight": "185 lbs"})
+    assert response.status_code == 200
+    assert response.headers["X-Replanned"] == "estimate"
+    assert response.json()["estimated_days_to_goal"] == 70  # 10 lbs at 1 lb per week
+
+    db.expire_all()
+    assert rows(db, WorkoutPlan, "activity") == workouts
+    assert rows(db, DietPlan, "meals") == diets
+    assert {op: replan.rows_written_counter.value(operation=op) for op in written} == written
+    assert sample_plan.estimated_days_to_goal == 70
+
+
+def test_frequency_change_rewrites_workouts_locally(client, token, db, sample_plan, monkeypatch):
+    """Test that a new frequency respreads the workouts and updates only changed rows"""
+    monkeypatch.setattr(replan, "REPLAN_WORKOUTS", "local")
+    workouts, diets = rows(db, WorkoutPlan, "activity"), rows(db, DietPlan, "meals")
+    updates = replan.rows_written_counter.value(operation="update")
+
+    unchanged = {"workout_frequency": "Workout 3 times per week", "current_weight": "190 lbs"}
+    response = put(client, token, sample_plan.id, unchanged)
+    assert response.headers["X-Replanned"] == "none", "unchanged values recompute nothing"
+
+    response = put(client, token, sample_plan.id, {"workout_frequency": "Twice a week, 2 sessions"})
+    assert response.headers["X-Replanned"] == "workouts"
+    plan = response.json()
+    assert plan["estimated_days_to_goal"] == 60
+    assert [entry["activity"] for entry in plan["workout_plan"]] == [
+        "30 minutes of cardio on monday", "Rest day or light stretching", "Rest day or light stretching",
+        "Rest day or light stretching", "30 minutes of cardio on tuesday", "Rest day or light stretching",
+        "Rest day or light stretching",
+    ]
+
+    db.expire_all()
+    after = rows(db, WorkoutPlan, "activity")
+    assert {day: row_id for day, (row_id, _) in after.items()} == {day: row_id for day, (row_id, _) in workouts.items()}
+    assert after["monday"] == workouts["monday"]
+    assert rows(db, DietPlan, "meals") == diets
+    assert replan.rows_written_counter.value(operation="update") == updates + 6
+
+
+def test_frequency_change_uses_one_targeted_call(client, token, db, sample_plan, stub_agents):
+    """Test that replan=model regenerates workouts with the repair agent, not a full generation"""
+    calls = []
+
+    def repair_model(messages, info):
+        calls.append(messages[-1].parts[-1].content)
+        days = [{"day": day.value, "activity": f"Strength session {day.value}"} for day in Weekday]
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, {"workout_plan": days})])
+
+    with service.repair_agent.override(model=FunctionModel(repair_model)):
+        response = put(client, token, sample_plan.id, {"workout_frequency": "Workout 5 times per week"},
+                       replan="model")
+
+    assert response.status_code == 200
+    assert len(calls) == 1 and "Workout frequency: Workout 5 times per week" in calls[0]
+    assert stub_agents == {"coach": 0, "estimator": 0}
+    assert response.json()["workout_plan"][0]["activity"] == "Strength session monday"
+
+
+def test_default_replan_makes_no_model_call(client, token, sample_plan, stub_agents, monkeypatch):
+    """Test that a plain update stays local and a model replan is rate limited like generation"""
+    def repair_model(messages, info):
+        raise AssertionError("the repair agent must not be called")
+
+    with service.repair_agent.override(model=FunctionModel(repair_model)):
+        response = put(client, token, sample_plan.id, {"workout_frequency": "Workout 5 times per week"})
+    assert response.status_code == 200
+    assert response.headers["X-Replanned"] == "workouts"
+
+    monkeypatch.setattr(admission, "llm_rate_limiter", RateLimiter(per_minute=1, burst=1))
+    monkeypatch.setattr(replan, "REPLAN_WORKOUTS", "local")
+    assert put(client, token, sample_plan.id, {"workout_frequency": "4x"}, replan="model").status_code == 200
+    response = put(client, token, sample_plan.id, {"workout_frequency": "3x"}, replan="model")
+    assert response.status_code == 429
+    # Local replanning is not rate limited
+    assert put(client, token, sample_plan.id, {"workout_frequency": "3x"}).status_code == 200
+
+
+def test_replan_none_only_stores_fields(client, token, db, sample_plan):
+    """Test that replan=none keeps the previous behaviour"""
+    response = put(client, token, sample_plan.id, {"current_weight": "180 lbs"}, replan="none")
+    assert response.status_code == 200
+    assert response.headers["X-Replanned"] == "none"
+    assert response.json()["estimated_days_to_goal"] == 60
+    db.refresh(sample_plan)
+    assert sample_plan.current_weight == "180 lbs"
@@ -0,0 +1,85 @@
+"""
+Slow-query log test script.
+
+This script verifies statement fingerprinting, that slow statements are
+aggregated per fingerprint with their route and EXPLAIN plan, and that the
+statistics are only served to administrators.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.auth import dependencies
+from app.db.slow_queries import fingerprint, normalize_statement, parameter_shape, slow_query_log
+from tests.conftest import engine
+
+
+@pytest.fixture
+def log_everything(monkeypatch):
+    """Treat every statement on the test engine as slow, with EXPLAIN capture."""
+    monkeypatch.setattr(slow_query_log, "threshold_ms", 0)
+    monkeypatch.setattr(slow_query_log, "explain", True)
+    slow_query_log.attach(engine)
+    slow_query_log.reset()
+    yield slow_query_log
+    slow_query_log.reset()
+
+
+def test_fingerprint_ignores_literals_and_in_lists():
+    """Test that statements differing only in values share a fingerprint"""
+    a = "SELECT * FROM user_plans WHERE user_id = 5 AND id IN (?, ?, ?)"
+    b = "SELECT *  FROM user_plans\nWHERE user_id = 17 AND id IN (?)"
+    assert fingerprint(a) == fingerprint(b)
+    assert normalize_statement("SELECT 'x' FROM t WHERE a = %(a_1)s") == "SELECT ? FROM t WHERE a = ?"
+    assert parameter_shape({"user_id": 3, "name": "x"}) == {"user_id": "int", "name": "str"}
+    assert parameter_shape([(1,), (2,)], executemany=True) == {"rows": 2, "row": ["int"]}
+
+
+def test_slow_queries_are_aggregated_per_route(client, token, test_user, sample_plan, log_everything, monkeypatch):
+    """Test that slow statements are attributed to routes, explained and served to admins"""
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(2):
+        assert client.get("/api/my-plans", headers=headers).status_code == 200
+
+    assert client.get("/admin/slow-queries", headers=headers).status_code == 403
+    monkeypatch.setattr(dependencies, "ADMIN_USERNAMES", {test_user.username})
+    data = client.get("/admin/slow-queries?order=count&limit=50", headers=headers).json()
+
+    plans_query = next(q for q in data["queries"] if "FROM user_plans" in q["statement"])
+    assert plans_query["count"] == 2
+    assert plans_query["routes"] == {"/api/my-plans": 2}
+    assert plans_query["explain"] and "EXPLAIN failed" not in plans_query["explain"]
+    assert "?" in plans_query["statement"]
+
+    assert client.delete("/admin/slow-queries", headers=headers).status_code == 204
+    assert all(q["routes"] != {"/api/my-plans": 2} for q in
+               client.get("/admin/slow-queries", headers=headers).json()["queries"])
+
+
+class _RecordingCursor:
+    """DBAPI cursor stand-in that records statements and fails EXPLAIN like PostgreSQL would."""
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, statement, parameters=None):
+        self.executed.append(statement.split(" SELECT")[0])
+        if statement.startswith("EXPLAIN"):
+            raise ValueError("could not determine data type of parameter $1")
+
+    def close(self):
+        pass
+
+
+def test_failed_explain_is_rolled_back_to_a_savepoint():
+    """Test that a failing EXPLAIN cannot abort the request's transaction on PostgreSQL"""
+    executed = []
+    dbapi_connection = SimpleNamespace(cursor=lambda: _RecordingCursor(executed))
+    conn = SimpleNamespace(dialect=SimpleNamespace(name="postgresql"),
+                           connection=SimpleNamespace(dbapi_connection=dbapi_connection))
+    plan = slow_query_log._explain(conn, "SELECT * FROM user_plans WHERE id = $1", ("x",))
+    assert plan.startswith("EXPLAIN failed: could not determine")
+    assert executed == [
+        "SAVEPOINT slow_query_explain", "EXPLAIN", "ROLLBACK TO SAVEPOINT slow_query_explain",
+        "RELEASE SAVEPOINT slow_query_explain",
+    ]
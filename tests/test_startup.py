@@ -0,0 +1,28 @@
+"""
+Startup test script.
+
+This script guards the cold-start path: importing the application must not load
+the AI SDKs, and the agents must still be available lazily.
+"""
+from benchmarks import bench_startup
+
+# Generous ceiling for ``import app.main`` (about 0.9 s locally) that slow CI machines
+# still meet; eager imports of the AI SDKs are caught by the heavy-module check
+IMPORT_MS_CEILING = 2500
+
+
+def test_import_does_not_load_heavy_modules():
+    """Test that a cold start defers pydantic_ai/openai to startup and serves a request"""
+    results = bench_startup.run(runs=1)
+    assert results["heavy_modules_at_import"] == []
+    assert results["samples"][0]["status"] == 200
+    assert bench_startup.compare(results, {"import_ms": IMPORT_MS_CEILING}, tolerance=0) == []
+
+
+def test_agents_are_built_on_first_access():
+    """Test that the lazily built agents are cached on the service module"""
+    from app.diet_fit_app import service
+
+    agent = service.gpt03_agent
+    assert service.get_agent("gpt03_agent") is agent
+    assert service.estimator_agent is service.get_agent("estimator_agent")
@@ -0,0 +1,126 @@
+"""
+Plan template library test script.
+
+This script verifies the profile feature vectors, that the similarity search only
+serves templates with the same goal direction and restrictions above the
+threshold, and that the pipeline serves an approved template without calling the
+coach model while collecting generated plans as candidates.
+"""
+import asyncio
+import json
+import time
+
+import numpy as np
+import pytest
+
+from tests.conftest import stub_coach_args
+from app.db.models import PlanTemplate, UserPlan
+from app.diet_fit_app import service, templates
+from app.diet_fit_app.models import CoachResult
+
+
+@pytest.fixture(autouse=True)
+def fresh_library():
+    templates.template_library.invalidate()
+    yield
+    templates.template_library.invalidate()
+
+
+def approve(db, user, result=None) -> PlanTemplate:
+    template = PlanTemplate(
+        features=json.dumps(templates.feature_vector(user).tolist()),
+        result=(result or CoachResult.model_validate(stub_coach_args())).model_dump_json(),
+        source_tier="o3", approved=True, uses=0,
+    )
+    db.add(template)
+    db.commit()
+    return template
+
+
+def test_feature_vector(user_input):
+    """Test goal, frequency, restriction and cuisine features"""
+    assert templates.goal_features(user_input) == (-1, 15.0)
+    gain = user_input.model_copy(update={"weight_goal": "Gain 5 kg", "dietary_restrictions": "Vegetarian, no nuts"})
+    direction, pounds = templates.goal_features(gain)
+    assert direction == 1 and pounds == pytest.approx(11.02, abs=0.01)
+
+    vector = templates.feature_vector(gain)
+    flags = dict(zip(templates.RESTRICTION_FLAGS, vector[templates.FLAGS]))
+    assert flags["vegetarian"] == 1 and flags["nut_free"] == 1 and flags["halal"] == 0
+    assert vector[templates.FREQUENCY] == pytest.approx(3 / 7)
+    assert "jollof" in templates.cuisine_tokens(user_input)
+
+
+def test_match_requires_same_goal_and_restrictions(db, user_input):
+    """Test hits for a similar profile and misses across restrictions, goals and cuisines"""
+    approve(db, user_input)
+    library = templates.TemplateLibrary(threshold=0.9)
+    library.load(db)
+
+    similar = user_input.model_copy(update={"current_weight": "185 lbs", "weight_goal": "Lose 12 lbs (target: 173 lbs)"})
+    match = library.match(similar)
+    assert match is not None and match.score > 0.95
+
+    assert library.match(user_input.model_copy(update={"dietary_restrictions": "Vegetarian"})) is None
+    assert library.match(user_input.model_copy(update={"weight_goal": "Gain 10 lbs"})) is None
+    other_cuisine = {field: "Pasta carbonara, pizza and tiramisu" for field in templates.CUISINE_FIELDS}
+    assert library.match(user_input.model_copy(update=other_cuisine)) is None
+
+
+def test_search_is_vectorized(user_input):
+    """Test that a lookup over 20,000 templates takes milliseconds"""
+    library = templates.TemplateLibrary()
+    rng = np.random.default_rng(0)
+    raw = (rng.random((20000, templates.FEATURES)) > 0.9).astype(np.float32)
+    raw[:, templates.DIRECTION] = -1
+    raw[:, templates.FLAGS] = 0
+    library.ids, library.raw, library.matrix = np.arange(20000), raw, templates._weighted(raw)
+    library.results = [CoachResult.model_validate(stub_coach_args()).model_dump_json()] * 20000
+    library.threshold = 0.0
+
+    started = time.perf_counter()
+    assert library.match(user_input) is not None
+    assert time.perf_counter() - started < 0.05
+
+
+def test_pipeline_serves_approved_template(db, test_user, user_input, stub_agents):
+    """Test that a matching template skips the models and is personalized, and generated plans become candidates"""
+    template = approve(db, user_input)
+
+    result = asyncio.run(service.run_fitness_pipeline(user_input, db, test_user.id))
+    assert stub_agents == {"coach": 0, "estimator": 0}
+    active = [entry for entry in result.workout_plan if "rest" not in entry.activity.lower()]
+    assert len(active) == 3, "template week is cut down to the requested 3 sessions"
+    assert result.estimated_days_to_goal == 105
+    assert db.query(UserPlan).one().model_tier == templates.TEMPLATE_TIER
+    db.refresh(template)
+    assert template.uses == 1
+
+    template.approved = False
+    db.commit()
+    templates.template_library.invalidate()
+    asyncio.run(service.run_fitness_pipeline(user_input, db, test_user.id))
+    assert stub_agents["coach"] == 1
+    assert db.query(PlanTemplate).count() == 1, "the profile is already in the library"
+
+    other = user_input.model_copy(update={"typical_dinner": "Fufu with light soup"})
+    asyncio.run(service.run_fitness_pipeline(other, db, test_user.id))
+    candidate = db.query(PlanTemplate).filter(PlanTemplate.id != template.id).one()
+    assert candidate.approved is False and candidate.source_tier == "o3"
+
+
+def test_candidates_are_capped(db, user_input, monkeypatch):
+    """Test that the oldest unapproved candidates make room once the cap is reached"""
+    monkeypatch.setattr(templates, "TEMPLATE_MAX_CANDIDATES", 2)
+    approved = approve(db, user_input.model_copy(update={"favorite_meals": "Waakye"}))
+    result = CoachResult.model_validate(stub_coach_args())
+    for dinner in ("Banku", "Kenkey", "Omo tuo", "Kenkey"):
+        templates.add_candidate(db, user_input.model_copy(update={"typical_dinner": dinner}), result, "o3")
+        db.commit()
+
+    rows = db.query(PlanTemplate).order_by(PlanTemplate.id).all()
+    assert [row.approved for row in rows] == [True, False, False]
+    assert rows[0].id == approved.id
+    kenkey = templates.feature_vector(user_input.model_copy(update={"typical_dinner": "Kenkey"}))
+    assert rows[1].features == json.dumps(kenkey.tolist()), "Banku, the oldest candidate, was dropped"
+    assert templates.candidates_counter.value(result="duplicate") >= 1
@@ -0,0 +1,76 @@
+"""
+LLM usage accounting test script.
+
+This script verifies cost estimation, that each agent run in plan generation is
+recorded and reported by the usage endpoint, and that per-user token budgets
+are enforced, and that buffered rows are flushed on idle workers and at shutdown.
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from app.db.models import LLMUsage
+from app.diet_fit_app import usage
+from app.diet_fit_app.usage import estimate_cost
+
+
+def test_estimate_cost_matches_dated_models():
+    """Test pricing by model prefix and the cached-token discount"""
+    assert estimate_cost("gpt-4o-2024-08-06", 1_000_000, 0, 0) == 2.50
+    assert estimate_cost("gpt-4o-mini", 1_000_000, 0, 0) == 0.15
+    assert estimate_cost("o3", 1_000_000, 1_000_000, 1_000_000) == 0.50 + 8.00
+    assert estimate_cost("unknown-model", 1000, 0, 1000) == 0.0
+
+
+def test_plan_generation_records_usage(client, token, db, stub_agents, user_input):
+    """Test that both agent runs are buffered, written in a batch and reported"""
+    headers = {"Authorization": f"Bearer {token}"}
+    response = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+    assert response.status_code == 200
+    # Rows are buffered rather than written on the request path
+    assert db.query(LLMUsage).count() == 0
+
+    report = client.get("/api/usage?days=7", headers=headers)
+    assert report.status_code == 200
+    data = report.json()
+    assert [row["agent"] for row in data["usage"]] == ["coach", "estimator"]
+    for row in data["usage"]:
+        assert row["runs"] == 1
+        assert row["prompt_tokens"] > 0
+        assert row["completion_tokens"] > 0
+    assert data["total_tokens"] == sum(r["prompt_tokens"] + r["completion_tokens"] for r in data["usage"])
+    assert db.query(LLMUsage).count() == 2
+
+    metrics = client.get("/metrics").text
+    assert 'llm_tokens_total{agent="coach"' in metrics
+
+
+def test_daily_token_budget_is_enforced(client, token, stub_agents, user_input, monkeypatch):
+    """Test that a user over the daily token budget gets 429 with Retry-After"""
+    monkeypatch.setattr(usage, "LLM_USER_DAILY_TOKEN_BUDGET", 1)
+    headers = {"Authorization": f"Bearer {token}"}
+    first = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+    assert first.status_code == 200
+
+    second = client.post("/api/fitness-plan", json=user_input.model_dump(), headers=headers)
+    assert second.status_code == 429
+    assert 1 <= int(second.headers["retry-after"]) <= 86400
+    assert stub_agents["coach"] == 1
+
+
+def test_quiet_worker_and_shutdown_flush(db, test_user):
+    """Test that stale rows are flushed without new requests and the rest at shutdown"""
+    recorder = usage.UsageRecorder(batch_size=100, flush_seconds=0.05)
+    row = {"user_id": test_user.id, "agent": "coach", "model": "o3", "prompt_tokens": 10,
+           "completion_tokens": 5, "created_at": datetime.now(timezone.utc)}
+
+    async def serve():
+        recorder.start()
+        recorder.record(db.get_bind(), dict(row))
+        await asyncio.sleep(0.2)
+        flushed_while_idle = db.query(LLMUsage).count()
+        recorder.record(db.get_bind(), dict(row))
+        await recorder.stop()
+        return flushed_while_idle
+
+    assert asyncio.run(serve()) == 1
+    assert db.query(LLMUsage).count() == 2
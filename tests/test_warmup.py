@@ -0,0 +1,48 @@
+"""
+Warm-up and readiness test script.
+
+This script verifies that the worker reports not-ready until the warm-up has
+run, and that each warm-up step is timed and reported.
+"""
+import asyncio
+
+from app.core.warmup import Warmup
+from app.main import app
+from tests.conftest import engine
+
+
+def test_liveness_and_readiness_in_test_mode(client):
+    """Test that health endpoints answer when warm-up is skipped"""
+    assert client.get("/health/live").json() == {"status": "alive"}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+
+
+def test_ready_only_after_warmup(client):
+    """Test that readiness flips to 200 once the warm-up steps have run"""
+    warmup = Warmup(app, steps=("db", "schemas", "auth"), engine=engine)
+    app.state.warmup = warmup
+    pending = client.get("/health/ready")
+    assert pending.status_code == 503
+    assert pending.json()["status"] == "warming_up"
+
+    asyncio.run(warmup.run())
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    steps = response.json()["warmup"]["steps"]
+    assert set(steps) == {"db", "schemas", "auth"}
+    assert all(step["ok"] for step in steps.values()), steps
+    assert all(step["ms"] >= 0 for step in steps.values())
+
+
+def test_warmup_timeout_still_marks_ready():
+    """Test that a stuck warm-up does not keep the worker out of rotation"""
+    warmup = Warmup(app, steps=("agents",), timeout=0.01)
+
+    async def slow(*args):
+        await asyncio.sleep(1)
+
+    warmup._agents_then_provider = slow
+    asyncio.run(warmup.run())
+    assert warmup.ready and warmup.timed_out
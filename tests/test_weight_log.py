@@ -0,0 +1,104 @@
+"""
+Weight log test script.
+
+This script verifies batched weigh-in inserts, raw and rolled-up range queries,
+the weighted trend fit, and that adding entries updates the latest plan's
+estimated days to goal from actual progress.
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from app.db.models import WeightEntry
+from app.diet_fit_app import weight_log
+
+
+def test_fit_trend_and_days_to_goal():
+    """Test the weighted fit and the projection towards, away from and at the target"""
+    days = np.arange(14, dtype=float)
+    slope, current = weight_log.fit_trend(days, 90 - 0.1 * days)
+    assert slope == pytest.approx(-0.1) and current == pytest.approx(88.7)
+
+    assert weight_log.days_to_goal(90.0, -0.25, 80.0) == 40
+    assert weight_log.days_to_goal(90.0, 0.05, 80.0) is None
+    assert weight_log.days_to_goal(80.3, -0.1, 80.0) == 0
+
+
+def test_batched_entries_and_rollups(client, token, db):
+    """Test that a batch is inserted and read back raw, per day and per week"""
+    headers = {"Authorization": f"Bearer {token}"}
+    # Monday 2026-10-05 to Sunday 2026-10-18, twice a day
+    start = datetime(2026, 10, 5, 7, tzinfo=timezone.utc)
+    entries = [
+        {"weight": 90 - day * 0.1 - half * 0.2, "recorded_at": (start + timedelta(days=day, hours=12 * half)).isoformat()}
+        for day in range(14) for half in range(2)
+    ]
+    response = client.post("/api/weight-log", json={"entries": entries}, headers=headers)
+    assert response.status_code == 201
+    assert response.json()["inserted"] == 28
+    assert db.query(WeightEntry).count() == 28
+
+    params = {"start": "2026-10-05T00:00:00Z", "end": "2026-10-19T00:00:00Z"}
+    raw = client.get("/api/weight-log", params=params, headers=headers).json()["points"]
+    assert len(raw) == 28 and raw[1]["weight_kg"] == 89.8
+
+    daily = client.get("/api/weight-log", params={**params, "resolution": "day"}, headers=headers).json()["points"]
+    assert len(daily) == 14
+    assert daily[0] == {"period": "2026-10-05T00:00:00Z", "weight_kg": 89.9, "min_kg": 89.8, "max_kg": 90.0, "count": 2}
+
+    weekly = client.get("/api/weight-log", params={**params, "resolution": "week"}, headers=headers).json()["points"]
+    assert [(point["period"][:10], point["count"]) for point in weekly] == [("2026-10-05", 14), ("2026-10-12", 14)]
+
+
+def test_entries_update_plan_estimate(client, token, db, sample_plan):
+    """Test that the trend replaces the plan's estimate without any model call"""
+    headers = {"Authorization": f"Bearer {token}"}
+    now = datetime.now(timezone.utc)
+    # 190 lbs towards 175 lbs at about 1 lb per week
+    entries = [
+        {"weight": 182 - day / 7, "unit": "lbs", "recorded_at": (now - timedelta(days=20 - day)).isoformat()}
+        for day in range(21)
+    ]
+    trend = client.post("/api/weight-log", json={"entries": entries}, headers=headers).json()["trend"]
+    assert trend["entries"] == 21 and trend["plan_id"] == sample_plan.id
+    assert trend["slope_kg_per_week"] == pytest.approx(-1 / 2.20462, abs=0.001)
+    assert trend["target_kg"] == pytest.approx(175 / 2.20462, abs=0.01)
+    # About 179.1 lbs now, 4.1 lbs to go at 1 lb per week
+    assert trend["estimated_days_to_goal"] == pytest.approx(29, abs=1)
+
+    db.refresh(sample_plan)
+    assert sample_plan.estimated_days_to_goal == trend["estimated_days_to_goal"]
+    assert client.get("/api/weight-log/trend", headers=headers).json()["plan_id"] is None
+
+
+def test_too_few_entries_for_a_trend(client, token, sample_plan):
+    """Test that a short log reports no trend and leaves the plan estimate alone"""
+    response = client.post("/api/weight-log", json={"entries": [{"weight": 86}]},
+                           headers={"Authorization": f"Bearer {token}"})
+    assert response.json()["trend"] == {
+        "entries": 1, "current_kg": None, "slope_kg_per_week": None, "target_kg": None,
+        "estimated_days_to_goal": None, "plan_id": None,
+    }
+    assert sample_plan.estimated_days_to_goal == 60
+
+
+def test_future_entries_are_rejected_and_not_fitted(client, token, db, test_user, sample_plan):
+    """Test that future weigh-ins are refused and never become the trend's current weight"""
+    headers = {"Authorization": f"Bearer {token}"}
+    now = datetime.now(timezone.utc)
+    future = {"weight": 60, "recorded_at": (now + timedelta(days=30)).isoformat()}
+    assert client.post("/api/weight-log", json={"entries": [future]}, headers=headers).status_code == 422
+
+    entries = [
+        {"weight": 86 - day * 0.1, "recorded_at": (now - timedelta(days=14 - day)).isoformat()}
+        for day in range(14)
+    ]
+    client.post("/api/weight-log", json={"entries": entries}, headers=headers)
+    # Written before the check existed, or by a skewed clock
+    db.add(WeightEntry(user_id=test_user.id, recorded_at=now + timedelta(days=30), weight_g=60000))
+    db.commit()
+
+    trend = client.get("/api/weight-log/trend", headers=headers).json()
+    assert trend["entries"] == 14
+    assert trend["current_kg"] == pytest.approx(84.7, abs=0.01)